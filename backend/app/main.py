@@ -11,18 +11,24 @@ This is the main FastAPI application that powers the game.
 """
 
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from typing import Optional
 import os
 
 from .models import (
     Mission, MissionList, CodeSubmission, ExecutionResult,
-    SearchQuery, SearchResult, PlayerProgress, CompletionRequest
+    SearchQuery, SearchResult, PlayerProgress, CompletionRequest, CacheStats,
+    DetectionRule, LiveEvents, AppendResult, BatchSubmission
 )
 from .game_logic import GameLogic
-from .services.sandbox_python import PythonSandbox
-from .services.sandbox_bash import BashSandbox
+from .services.sandbox_python import DEFAULT_GRADING_TIMEOUT, PythonSandbox
+from .services.sandbox_bash import BashSandbox, MAX_COMMAND_LENGTH, blocked_command
 from .services.lucene_search_sim import LuceneSearchSimulator
+from .services.percolator import RuleLimitError
+from .services.lucene_query import QueryBudgetError
+from .services.mission_specs import LESSONS_DIR, MissionSpecs
+from .services.batch_grading import BatchGrader
 
 # ==========================================
 # Application Setup
@@ -47,10 +53,44 @@ app.add_middleware(
 )
 
 # Initialize services
-game_logic = GameLogic()
-python_sandbox = PythonSandbox()
+# Missions and their grading are read from MISSION_SPECS_DIR (lessons/ by
+# default) and reloaded when the files change, polled every
+# MISSION_SPECS_WATCH seconds (0 = load once at startup). Grading regexes
+# run on GRADING_REGEX_ENGINE ("re", or "linear" for linear-time matching),
+# and each Python submission gets GRADING_TIMEOUT seconds (0 = no limit).
+mission_specs = MissionSpecs(
+    os.getenv("MISSION_SPECS_DIR", str(LESSONS_DIR)),
+    regex_engine=os.getenv("GRADING_REGEX_ENGINE", "re"),
+)
+watch_interval = float(os.getenv("MISSION_SPECS_WATCH", "2"))
+if watch_interval > 0:
+    mission_specs.watch(watch_interval)
+game_logic = GameLogic(mission_specs)
+grading_timeout = float(os.getenv("GRADING_TIMEOUT", str(DEFAULT_GRADING_TIMEOUT)))
+python_sandbox = PythonSandbox(mission_specs, timeout=grading_timeout)
 bash_sandbox = BashSandbox()
-lucene_search = LuceneSearchSimulator()
+# Batch grading fans out over BATCH_GRADING_WORKERS processes (one per CPU
+# by default, 0 = grade inside the server process)
+batch_workers = os.getenv("BATCH_GRADING_WORKERS")
+batch_grader = BatchGrader(
+    workers=int(batch_workers) if batch_workers else None, specs=mission_specs, timeout=grading_timeout
+)
+# Set LOG_CORPUS_PATH to search a real NDJSON capture instead of the demo logs,
+# and LOG_INDEX_SNAPSHOT to share one memory-mapped index across workers.
+# LOG_SEARCH_SHARDS > 1 spreads each search over that many processes.
+# LOG_SEARCH_MAX_COST / LOG_SEARCH_TIMEOUT bound each query (0 = no limit).
+lucene_search = LuceneSearchSimulator(
+    corpus_path=os.getenv("LOG_CORPUS_PATH"),
+    snapshot_path=os.getenv("LOG_INDEX_SNAPSHOT"),
+    shards=int(os.getenv("LOG_SEARCH_SHARDS", "0")),
+    shard_mode=os.getenv("LOG_SEARCH_SHARD_MODE", "time"),
+    cache_size=int(os.getenv("LOG_SEARCH_CACHE_SIZE", "1024")),
+    cache_ttl=float(os.getenv("LOG_SEARCH_CACHE_TTL", "300")),
+    stemming=os.getenv("LOG_SEARCH_STEMMING", "false").lower() == "true",
+    max_query_cost=int(os.getenv("LOG_SEARCH_MAX_COST", "5000000")),
+    query_timeout=float(os.getenv("LOG_SEARCH_TIMEOUT", "2")),
+    specs=mission_specs
+)
 
 # ==========================================
 # Health Check
@@ -73,7 +113,9 @@ def health_check():
         "services": {
             "python_sandbox": "ready",
             "bash_sandbox": "ready",
-            "lucene_search": "ready"
+            "lucene_search": "ready",
+            # "stale" when the last spec reload failed and older specs are served
+            "mission_specs": "ready" if mission_specs.last_error is None else "stale"
         }
     }
 
@@ -159,23 +201,16 @@ def run_bash(submission: CodeSubmission):
     It uses a simulated file system and pre-defined outputs.
     """
     # Input validation
-    if len(submission.code) > 5000:
+    if len(submission.code) > MAX_COMMAND_LENGTH:
         raise HTTPException(
             status_code=400,
-            detail="Command too long. Maximum 5,000 characters."
+            detail=f"Command too long. Maximum {MAX_COMMAND_LENGTH:,} characters."
         )
     
     # Block obviously dangerous patterns (extra safety layer)
-    dangerous_patterns = ["rm -rf", "sudo", "chmod 777", ">/dev/", "mkfs"]
-    for pattern in dangerous_patterns:
-        if pattern in submission.code.lower():
-            return ExecutionResult(
-                success=False,
-                output="",
-                error="This command is not allowed in the simulation.",
-                hints=["Try using safe commands like grep, cat, or ls."],
-                feedback="That command could be dangerous on real systems. In this game, we focus on safe analysis commands!"
-            )
+    blocked = blocked_command(submission.code)
+    if blocked is not None:
+        return blocked
     
     # Run through SAFE sandbox
     mission = game_logic.get_mission(submission.mission_id)
@@ -187,6 +222,21 @@ def run_bash(submission: CodeSubmission):
     
     return result
 
+
+@app.post("/api/run/batch")
+def run_batch(batch: BatchSubmission):
+    """
+    Grade many Python and Bash submissions at once, e.g. a whole class.
+    
+    ⚠️ Same safe simulation as /api/run/python and /api/run/bash.
+    
+    Streams NDJSON: one BatchGradeResult per submission in the order
+    they finish (index is the submission's position in the request),
+    then a final {"summary": BatchSummary} line with totals and
+    throughput.
+    """
+    return StreamingResponse(batch_grader.ndjson(batch.submissions), media_type="application/x-ndjson")
+
 # ==========================================
 # Log Search Endpoint
 # ==========================================
@@ -198,9 +248,27 @@ def search_logs(query: SearchQuery):
     
     Supported syntax:
     - field:value (exact match)
-    - field:*partial* (wildcard)
-    - field:[min TO max] (range)
-    - AND, OR operators
+    - words and "quoted phrases" (full text over every field)
+    - field:*partial* (wildcard), field:prefix* (prefix)
+    - field:value~N (fuzzy, e.g. user:jhon~1)
+    - field:[min TO max] (range; IPs work as bounds)
+    - ip:10.0.0.0/8 (CIDR block)
+    - AND, OR, NOT operators and ( ) grouping
+    
+    Queries that match nothing come back with a "did you mean"
+    suggestion when a misspelt value can be corrected.
+    
+    Results come back in pages of at most 100; send next_cursor back
+    as search_after to continue where the last page stopped.
+    
+    Optional aggregations (terms, date_histogram, cardinality) summarize
+    every matching event without returning the rows themselves.
+    
+    Set profile to get parse, execution and materialization timings
+    plus per-clause timings, sizes and the order clauses ran in.
+    
+    Set live to search the events appended with /api/search/events
+    instead; live searches are never graded.
     """
     # Input validation
     if len(query.query) > 1000:
@@ -209,15 +277,61 @@ def search_logs(query: SearchQuery):
             detail="Query too long. Maximum 1,000 characters."
         )
     
+    if query.live:
+        return lucene_search.search_live(query.query, max_results=min(query.max_results or 100, 100))
+    
     # Execute search against simulated logs
     result = lucene_search.search(
         query=query.query,
         mission_id=query.mission_id,
-        max_results=min(query.max_results or 100, 100)  # Cap at 100
+        max_results=min(query.max_results or 100, 100),  # Cap at 100 per page
+        search_after=query.search_after,
+        aggregations=query.aggregations,
+        profile=query.profile
     )
     
     return result
 
+@app.get("/api/search/cache", response_model=CacheStats)
+def search_cache_stats():
+    """Hit, miss and eviction counters of the log search result cache."""
+    return lucene_search.cache_stats()
+
+@app.post("/api/search/rules")
+def save_detection_rule(rule: DetectionRule):
+    """Save a detection rule that is checked against every appended event."""
+    try:
+        lucene_search.add_rule(rule.rule_id, rule.query)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid rule query: {e}")
+    except RuleLimitError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"message": f"Rule {rule.rule_id} saved"}
+
+@app.delete("/api/search/rules/{rule_id}")
+def delete_detection_rule(rule_id: str):
+    """Delete a saved detection rule."""
+    if not lucene_search.remove_rule(rule_id):
+        raise HTTPException(status_code=404, detail="Rule not found")
+    return {"message": f"Rule {rule_id} deleted"}
+
+@app.post("/api/search/events", response_model=AppendResult)
+def append_live_events(batch: LiveEvents):
+    """
+    Append events to the live event log (live incident mode).
+    
+    Returns the alerts raised by saved detection rules. Rules that
+    can't be matched within the search timeout get a 503 and the
+    events are not appended. Live events
+    are kept apart from the mission corpus; search them with
+    "live": true. Only the most recent ones are kept.
+    """
+    try:
+        alerts = lucene_search.append_events(batch.events)
+    except QueryBudgetError as e:
+        raise HTTPException(status_code=503, detail=f"Matching rules took too long, nothing was appended: {e}")
+    return AppendResult(added=len(batch.events), alerts=alerts)
+
 # ==========================================
 # Progress Endpoints
 # ==========================================
@@ -6,7 +6,7 @@ These ensure all data is properly validated before processing.
 """
 
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Dict, List, Literal, Optional, Union
 from enum import Enum
 
 
@@ -63,6 +63,37 @@ class ExecutionResult(BaseModel):
     is_complete: bool = Field(False, description="Whether mission is now complete")
 
 
+class BatchSubmission(BaseModel):
+    """Many submissions graded in one request, e.g. a whole class."""
+    submissions: List[CodeSubmission] = Field(..., min_length=1, max_length=5000)
+
+
+class BatchGradeResult(BaseModel):
+    """One graded submission of a batch (a line of the NDJSON stream)."""
+    index: int = Field(..., description="Position of the submission in the batch")
+    mission_id: str
+    result: Optional[ExecutionResult] = Field(None, description="Grading outcome, unless the submission was rejected")
+    error: Optional[str] = Field(None, description="Why the submission could not be graded")
+
+
+class BatchSummary(BaseModel):
+    """Totals of a batch, sent as the last NDJSON line."""
+    total: int
+    correct: int
+    rejected: int = Field(..., description="Submissions that could not be graded")
+    workers: int = Field(..., description="Worker processes used (0 = graded in the server process)")
+    seconds: float
+    per_second: float = Field(..., description="Submissions graded per second")
+
+
+class AggregationRequest(BaseModel):
+    """One aggregation to compute over all events matching a search."""
+    type: Literal["terms", "date_histogram", "cardinality"] = Field(..., description="Aggregation kind")
+    field: str = Field(..., max_length=50, description="Field to aggregate on")
+    size: int = Field(10, ge=1, le=100, description="Number of buckets for terms")
+    interval: str = Field("1h", max_length=10, description="Bucket width for date_histogram, e.g. 30m, 1h, 1d")
+
+
 class SearchQuery(BaseModel):
     """Lucene-style log search query."""
     query: str = Field(
@@ -72,6 +103,18 @@ class SearchQuery(BaseModel):
     )
     mission_id: Optional[str] = Field(None, description="Mission context for the search")
     max_results: Optional[int] = Field(100, ge=1, le=100, description="Maximum results to return")
+    search_after: Optional[str] = Field(
+        None,
+        max_length=200,
+        description="Cursor from a previous result's next_cursor to fetch the next page"
+    )
+    aggregations: Optional[Dict[str, AggregationRequest]] = Field(
+        None,
+        max_length=10,
+        description="Named aggregations to compute over every matching event"
+    )
+    profile: bool = Field(False, description="Return per-clause timings and sizes with the result")
+    live: bool = Field(False, description="Search the appended live events instead of the mission corpus")
 
 
 class LogEntry(BaseModel):
@@ -85,15 +128,92 @@ class LogEntry(BaseModel):
     details: Optional[str] = None
 
 
+class AggregationBucket(BaseModel):
+    """A single bucket of a terms or date_histogram aggregation."""
+    key: str
+    count: int
+
+
+class AggregationResult(BaseModel):
+    """Result of one aggregation: buckets, or a single value for cardinality."""
+    buckets: List[AggregationBucket] = Field(default_factory=list)
+    value: Optional[int] = None
+
+
+class ClauseProfile(BaseModel):
+    """Timing of one query clause; children are listed in the order they ran."""
+    type: str
+    description: str
+    time_ms: float
+    matches: int = Field(..., description="Events this clause matched")
+    estimate: Optional[int] = Field(None, description="Planner's size estimate (posting-list size for terms)")
+    candidates: Optional[int] = Field(None, description="Events the clause was restricted to, if any")
+    children: List["ClauseProfile"] = Field(default_factory=list)
+
+
+class QueryProfile(BaseModel):
+    """Where the time of one search went."""
+    parse_ms: float
+    cost: int = Field(0, description="The planner's work estimate, compared against the query budget")
+    execute_ms: float = Field(..., description="Running the clause tree into a set of matches")
+    collect_ms: float = Field(..., description="Picking the requested page out of the matches")
+    aggregation_ms: float = 0.0
+    materialize_ms: float = Field(..., description="Building the returned log entries")
+    total_ms: float
+    clauses: List[ClauseProfile] = Field(default_factory=list)
+
+
 class SearchResult(BaseModel):
     """Result of a log search."""
     query: str
-    total_matches: int
+    total_matches: int = Field(..., description="Total events matching the query, not just this page")
+    returned_count: int = Field(0, description="Number of events returned in this page")
     results: List[LogEntry]
+    next_cursor: Optional[str] = Field(None, description="Pass as search_after to fetch the next page")
+    aggregations: Optional[Dict[str, AggregationResult]] = Field(None, description="Requested aggregations")
+    profile: Optional[QueryProfile] = Field(None, description="Execution profile, when requested")
+    suggestion: Optional[str] = Field(None, description="Corrected query to try when nothing matched")
     is_correct: bool = Field(False, description="Whether query matches expected for mission")
     feedback: str = Field("", description="Feedback on the query")
 
 
+class CacheStats(BaseModel):
+    """Counters of the log search result cache."""
+    entries: int
+    max_entries: int
+    ttl_seconds: float
+    hits: int
+    misses: int
+    evictions: int
+    expirations: int
+    generation: int = Field(0, description="Corpus generation; bumped whenever events are ingested")
+    hit_rate: float
+
+
+class DetectionRule(BaseModel):
+    """A saved query that raises alerts when newly appended events match it."""
+    rule_id: str = Field(..., min_length=1, max_length=64, pattern=r"^[\w.-]+$")
+    query: str = Field(..., max_length=1000, description="Lucene-style query the events must match")
+
+
+class LiveEvents(BaseModel):
+    """Events to append to the live event log during a live session."""
+    events: List[Dict[str, Union[str, int, float, bool, None]]] = Field(..., max_length=1000)
+
+
+class RuleAlert(BaseModel):
+    """A newly appended event that matched a saved rule."""
+    rule_id: str
+    event_id: int
+    entry: LogEntry
+
+
+class AppendResult(BaseModel):
+    """Outcome of appending live events."""
+    added: int
+    alerts: List[RuleAlert] = Field(default_factory=list)
+
+
 class PlayerProgress(BaseModel):
     """Player's current progress in the game."""
     current_tier: int = Field(1, ge=1, le=3)
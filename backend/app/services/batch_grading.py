@@ -0,0 +1,199 @@
+"""
+Cyber Coding Game - Batch Grading
+
+Grades many submissions at once, e.g. a whole class re-graded after
+a rubric change, across a pool of worker processes.
+
+Submissions go to the workers in chunks, so there is one round trip
+per chunk rather than per submission. Each worker has its own
+PythonSandbox (and verdict cache) over its own copy of the mission
+specs. The specs are reloaded before every chunk, so rubric edits
+apply to the rest of a running batch. Bash submissions get a fresh
+BashSandbox each, so one student's cd can't leak into the next.
+
+Results are yielded in completion order, each tagged with the
+submission's position in the batch, and ndjson() adds a throughput
+summary as the last line.
+
+Run directly to grade an NDJSON file of submissions
+({"code": ..., "mission_id": ...} per line):
+
+    python -m app.services.batch_grading submissions.ndjson [workers]
+"""
+
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from itertools import islice
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from ..models import BatchGradeResult, BatchSummary, CodeSubmission, ExecutionResult
+from .mission_specs import LESSONS_DIR, MissionCatalog, MissionSpecs
+from .sandbox_bash import MAX_COMMAND_LENGTH, BashSandbox, blocked_command
+from .sandbox_python import DEFAULT_GRADING_TIMEOUT, PythonSandbox
+
+# Submissions per task sent to a worker
+DEFAULT_CHUNK_SIZE = 32
+
+# This worker process's sandbox, set up by _init_worker
+_sandbox: Optional[PythonSandbox] = None
+
+
+class GradingError(ValueError):
+    """A submission that can't be graded (unknown mission, oversized command...)."""
+
+
+def grade_submission(sandbox: PythonSandbox, catalog: MissionCatalog, submission: CodeSubmission) -> ExecutionResult:
+    """Grade one submission the way /api/run/python and /api/run/bash would."""
+    mission = catalog.missions.get(submission.mission_id)
+    if mission is None:
+        raise GradingError("Mission not found")
+    if mission.language == "python":
+        return sandbox.simulate(submission.code, submission.mission_id, mission.tier)
+    if mission.language == "bash":
+        if len(submission.code) > MAX_COMMAND_LENGTH:
+            raise GradingError(f"Command too long. Maximum {MAX_COMMAND_LENGTH:,} characters.")
+        blocked = blocked_command(submission.code)
+        if blocked is not None:
+            return blocked
+        return BashSandbox().simulate(submission.code, submission.mission_id, mission.tier)
+    raise GradingError(f"{mission.language} missions are graded through /api/search/logs, not in batches")
+
+
+def _grade_chunk(sandbox: PythonSandbox, chunk: List[Tuple[int, CodeSubmission]]) -> List[BatchGradeResult]:
+    catalog = sandbox.specs.current
+    results = []
+    for index, submission in chunk:
+        try:
+            result, error = grade_submission(sandbox, catalog, submission), None
+        except GradingError as e:
+            result, error = None, str(e)
+        results.append(BatchGradeResult(index=index, mission_id=submission.mission_id, result=result, error=error))
+    return results
+
+
+def _init_worker(specs_dir: str, regex_engine: str, timeout: float):
+    """Worker initializer: load the mission specs and build the sandbox."""
+    global _sandbox
+    _sandbox = PythonSandbox(MissionSpecs(Path(specs_dir), regex_engine), timeout=timeout)
+
+
+def _grade_chunk_in_worker(chunk: List[Tuple[int, CodeSubmission]]) -> List[BatchGradeResult]:
+    # Cheap when nothing changed: one stat per spec file
+    _sandbox.specs.reload()
+    return _grade_chunk(_sandbox, chunk)
+
+
+def _chunks(submissions: Iterable[CodeSubmission], size: int) -> Iterator[List[Tuple[int, CodeSubmission]]]:
+    numbered = enumerate(submissions)
+    while True:
+        chunk = list(islice(numbered, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class BatchGrader:
+    """
+    Grades batches of submissions on a pool of worker processes.
+
+    With workers=0 everything is graded in the calling process using
+    the given specs (no pool); otherwise workers load their specs from
+    the same directory, on the same regex engine. Each submission gets
+    timeout seconds, as in PythonSandbox. Call close() to stop the
+    workers.
+    """
+
+    def __init__(self, workers: Optional[int] = None, specs: Optional[MissionSpecs] = None,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE, timeout: float = DEFAULT_GRADING_TIMEOUT):
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1")
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.chunk_size = chunk_size
+        self.specs = specs or MissionSpecs()
+        self._local = PythonSandbox(self.specs, timeout=timeout) if self.workers == 0 else None
+        # Worker processes are only started by the first batch
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(str(self.specs.directory), self.specs.regex_engine, timeout),
+        ) if self.workers > 0 else None
+
+    def grade(self, submissions: Iterable[CodeSubmission]) -> Iterator[BatchGradeResult]:
+        """Grade every submission, yielding results as they complete."""
+        if self.pool is None:
+            for chunk in _chunks(submissions, self.chunk_size):
+                yield from _grade_chunk(self._local, chunk)
+            return
+        # Enough chunks in flight to keep every worker busy, without
+        # queueing a whole (possibly huge) input up front
+        pending = set()
+        try:
+            for chunk in _chunks(submissions, self.chunk_size):
+                pending.add(self.pool.submit(_grade_chunk_in_worker, chunk))
+                if len(pending) >= 2 * self.workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield from future.result()
+            for future in as_completed(pending):
+                yield from future.result()
+        finally:
+            # A client that hangs up mid-stream shouldn't keep the pool busy
+            for future in pending:
+                future.cancel()
+
+    def ndjson(self, submissions: Iterable[CodeSubmission]) -> Iterator[str]:
+        """grade() as NDJSON lines, ending with a {"summary": ...} line."""
+        started = time.perf_counter()
+        total = correct = rejected = 0
+        for graded in self.grade(submissions):
+            total += 1
+            if graded.result is None:
+                rejected += 1
+            elif graded.result.success:
+                correct += 1
+            yield graded.model_dump_json() + "\n"
+        seconds = time.perf_counter() - started
+        summary = BatchSummary(
+            total=total,
+            correct=correct,
+            rejected=rejected,
+            workers=self.workers,
+            seconds=round(seconds, 4),
+            per_second=round(total / seconds, 1) if seconds > 0 else 0.0,
+        )
+        yield json.dumps({"summary": summary.model_dump()}) + "\n"
+
+    def close(self):
+        """Stop the worker processes."""
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _read_submissions(path: str) -> Iterator[CodeSubmission]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield CodeSubmission.model_validate_json(line)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        print("usage: python -m app.services.batch_grading <submissions.ndjson> [workers]")
+        sys.exit(2)
+    specs = MissionSpecs(
+        Path(os.getenv("MISSION_SPECS_DIR", str(LESSONS_DIR))),
+        regex_engine=os.getenv("GRADING_REGEX_ENGINE", "re"),
+    )
+    with BatchGrader(int(sys.argv[2]) if len(sys.argv) == 3 else None, specs) as grader:
+        for line in grader.ndjson(_read_submissions(sys.argv[1])):
+            sys.stdout.write(line)
@@ -0,0 +1,128 @@
+"""
+Cyber Coding Game - Grading Benchmark
+
+Grades adversarial Python submissions against every mission and
+reports the slowest grading seen per mission, on each regex engine.
+
+The inputs are built from each mission's own grading. The words in
+its regexes and check arguments are repeated up to the submission
+size limit without the rest of a match: the near miss that makes a
+backtracking regex retry every split. They go into bare text (also
+after every other word, so literal prefilters can't rule them out),
+string literals, print() calls and long identifiers. On top of that
+come many statements, long expressions, deep nesting, and random
+mixes of the mission's words with punctuation. The verdict cache
+and the time budget are off, so every input is graded in full.
+
+Run directly:
+
+    python -m app.services.grading_bench [random inputs per mission] [seed]
+"""
+
+import os
+import random
+import re
+import statistics
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, List, Sequence, Tuple
+
+from .mission_specs import LESSONS_DIR, MissionSpecs, PythonGrading
+from .python_grader import REGEX_ENGINES, Regex, required_literals
+from .sandbox_python import PythonSandbox
+
+# CodeSubmission.code's limit
+MAX_CODE_LENGTH = 10_000
+
+_WORD_RE = re.compile(r"[A-Za-z_]{2,}")
+_PUNCTUATION = [" ", "\n", "(", ")", "'", '"', ".", ":", ",", "=", "#", "?", "{}", "    "]
+
+
+@dataclass(frozen=True)
+class BenchResult:
+    """Grading times for one mission on one engine."""
+    mission_id: str
+    engine: str
+    inputs: int
+    worst_ms: float
+    worst_input: str
+    median_ms: float
+
+
+def mission_words(grading: PythonGrading) -> List[str]:
+    """Words a near miss for this mission would be made of."""
+    checks = list(grading.checks) + [check for check, _ in grading.partial_checks]
+    sources = [check[1] for check in checks if len(check) > 1]
+    sources += list(grading.patterns) + [pattern for pattern, _ in grading.partial_patterns]
+    words = set()
+    for source in sources:
+        pattern = source.pattern if isinstance(source, Regex) else str(source)
+        words.update(_WORD_RE.findall(pattern))
+        words.update(required_literals(pattern) or ())
+    return sorted(word for word in words if word.strip()) or ["x"]
+
+
+def _fill(unit: str, room: int) -> str:
+    return unit * max(1, room // max(1, len(unit)))
+
+
+def adversarial_inputs(words: Sequence[str], rounds: int, rng: random.Random) -> Iterator[Tuple[str, str]]:
+    """(label, code) pairs, each at most MAX_CODE_LENGTH characters."""
+    limit = MAX_CODE_LENGTH
+    # Every word once up front gets past PatternSet's literal prefilter,
+    # and leaves nothing to complete a match after the repeated word
+    prelude = "# " + " ".join(words) + "\n"
+    for word in words:
+        yield f"{word!r} repeated", _fill(word, limit)
+        yield f"all words, then {word!r} repeated", prelude + _fill(word, limit - len(prelude))
+        yield f"{word!r} repeated in a string", 'x = "' + _fill(word + " ", limit - 8) + '"'
+        yield f"{word!r} repeated in print()", 'print("' + _fill(word, limit - 10) + '")'
+        yield f"{word!r} as a long name", _fill(word + "_", limit - 4) + "x=1"
+        yield f"print({word!r}) repeated", _fill(f"print({word!r})\n", limit)
+    yield "long expression", "x = " + _fill("a+", limit - 6) + "a"
+    yield "deep nesting", "x = " + "[" * 90 + "]" * 90
+    yield "one long line of spaces", "x = 1" + " " * (limit - 6)
+    pieces = list(words) + _PUNCTUATION
+    for i in range(rounds):
+        code = []
+        size = 0
+        while size < limit - 20:
+            piece = rng.choice(pieces)
+            code.append(piece)
+            size += len(piece)
+        yield f"random mix #{i}", "".join(code)
+
+
+def bench_engine(specs: MissionSpecs, rounds: int = 20, seed: int = 0) -> List[BenchResult]:
+    """Worst-case grading time per Python mission, on specs' regex engine."""
+    sandbox = PythonSandbox(specs, cache_size=0, timeout=0)
+    results = []
+    for mission_id, grading in specs.current.python.items():
+        times: List[Tuple[float, str]] = []
+        for label, code in adversarial_inputs(mission_words(grading), rounds, random.Random(seed)):
+            started = time.perf_counter()
+            sandbox.grade(code, mission_id)
+            times.append((time.perf_counter() - started, label))
+        worst, worst_input = max(times)
+        results.append(BenchResult(
+            mission_id=mission_id,
+            engine=specs.regex_engine,
+            inputs=len(times),
+            worst_ms=round(worst * 1000, 2),
+            worst_input=worst_input,
+            median_ms=round(statistics.median(t for t, _ in times) * 1000, 3),
+        ))
+    return results
+
+
+if __name__ == "__main__":
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    directory = Path(os.getenv("MISSION_SPECS_DIR", str(LESSONS_DIR)))
+    print(f"{'mission':<12}{'engine':<8}{'inputs':>7}{'median ms':>11}{'worst ms':>10}  worst input")
+    for engine in REGEX_ENGINES:
+        for result in bench_engine(MissionSpecs(directory, engine), rounds, seed):
+            print(f"{result.mission_id:<12}{result.engine:<8}{result.inputs:>7}"
+                  f"{result.median_ms:>11}{result.worst_ms:>10}  {result.worst_input}")
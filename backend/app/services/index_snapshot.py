@@ -0,0 +1,393 @@
+"""
+Cyber Coding Game - Index Snapshots
+
+Saves a built LogIndex to a single binary file and loads it back
+as a read-only, memory-mapped index.
+
+Loading parses only a small JSON header; term dictionaries,
+postings, full-text positions, columns and even the events
+themselves stay in the file and are read through typed memoryviews
+on demand. Every
+worker process that maps the same snapshot shares the same
+physical pages through the OS page cache, so startup takes
+milliseconds whatever the corpus size.
+
+File layout:
+    MAGIC (8 bytes) | header length (uint64) | JSON header | sections
+
+Each section is a flat array (postings, columns, string tables)
+aligned to 8 bytes; the header maps section names to
+(offset, byte length, array typecode). It also records the capture
+the index was built from (see corpus_source), so a snapshot that no
+longer matches its capture can be rebuilt.
+
+Build a snapshot from a capture:
+
+    python -m app.services.index_snapshot capture.ndjson corpus.idx
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping, Sequence
+from typing import Any, Dict, List, Optional, Tuple
+
+from .lucene_index import LogIndex, NumericColumn, DictColumn, StringColumn
+from .text_analysis import Analyzer
+
+MAGIC = b"CCGIDX01"
+FORMAT_VERSION = 5
+
+
+# ==========================================
+# Read-only views over mapped sections
+# ==========================================
+
+class StringTable(Sequence):
+    """Strings stored as one UTF-8 blob plus an offsets array."""
+
+    def __init__(self, offsets, blob):
+        self._offsets = offsets
+        self._blob = blob
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return bytes(self._blob[self._offsets[i]:self._offsets[i + 1]]).decode("utf-8")
+
+
+class SnapshotTerms(Mapping):
+    """term -> posting list, binary-searching a sorted term table."""
+
+    def __init__(self, terms: StringTable, offsets, doc_ids):
+        self._terms = terms
+        self._offsets = offsets
+        self._doc_ids = doc_ids
+
+    def ordinal(self, term: str) -> int:
+        """Position of term in the sorted table, or -1."""
+        i = bisect_left(self._terms, term)
+        return i if i < len(self._terms) and self._terms[i] == term else -1
+
+    def __getitem__(self, term: str):
+        i = self.ordinal(term)
+        if i < 0:
+            raise KeyError(term)
+        return self._doc_ids[self._offsets[i]:self._offsets[i + 1]]
+
+    def __iter__(self):
+        return iter(self._terms)
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+
+class SnapshotGrams(Mapping):
+    """trigram -> set of terms, stored as ordinals into the term table."""
+
+    def __init__(self, grams: StringTable, offsets, ordinals, terms: StringTable):
+        self._grams = SnapshotTerms(grams, offsets, ordinals)
+        self._terms = terms
+
+    def __getitem__(self, gram: str) -> frozenset:
+        return frozenset(self._terms[i] for i in self._grams[gram])
+
+    def __iter__(self):
+        return iter(self._grams)
+
+    def __len__(self) -> int:
+        return len(self._grams)
+
+
+class PositionLists(Sequence):
+    """Positions of one token in each event of its text posting list."""
+
+    def __init__(self, start: int, end: int, offsets, positions):
+        self._start = start
+        self._end = end
+        self._offsets = offsets
+        self._positions = positions
+
+    def __len__(self) -> int:
+        return self._end - self._start
+
+    def __getitem__(self, i: int):
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        entry = self._start + i
+        return self._positions[self._offsets[entry]:self._offsets[entry + 1]]
+
+
+class SnapshotPositions(Mapping):
+    """token -> PositionLists, parallel to the text postings."""
+
+    def __init__(self, terms: SnapshotTerms, offsets, positions):
+        self._terms = terms
+        self._offsets = offsets
+        self._positions = positions
+
+    def __getitem__(self, token: str) -> PositionLists:
+        i = self._terms.ordinal(token)
+        if i < 0:
+            raise KeyError(token)
+        return PositionLists(self._terms._offsets[i], self._terms._offsets[i + 1], self._offsets, self._positions)
+
+    def __iter__(self):
+        return iter(self._terms)
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+
+class JsonValues(Sequence):
+    """Dictionary values of a column, JSON-encoded in a string table."""
+
+    def __init__(self, table: StringTable):
+        self._table = table
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+    def __getitem__(self, i: int) -> Any:
+        return json.loads(self._table[i])
+
+
+# ==========================================
+# Writing
+# ==========================================
+
+def corpus_source(path: str) -> Dict[str, Any]:
+    """Identity of a capture file as recorded in snapshots: absolute path, size and modification time."""
+    stat = os.stat(path)
+    return {"path": os.path.abspath(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+class _Writer:
+    """Collects named sections and lays them out 8-byte aligned."""
+
+    def __init__(self):
+        self.sections: Dict[str, Tuple[str, bytes]] = {}
+
+    def add(self, name: str, typecode: str, values):
+        data = values if isinstance(values, bytes) else array(typecode, values).tobytes()
+        self.sections[name] = (typecode, data)
+
+    def add_strings(self, name: str, strings: List[str]):
+        encoded = [s.encode("utf-8") for s in strings]
+        offsets = array("Q", [0])
+        for item in encoded:
+            offsets.append(offsets[-1] + len(item))
+        self.add(name + "/offsets", "Q", offsets)
+        self.add(name + "/blob", "B", b"".join(encoded))
+
+    def add_postings(self, name: str, keys: List[str], lists: List[Any]):
+        offsets = array("Q", [0])
+        doc_ids = array("I")
+        for postings in lists:
+            doc_ids.extend(postings)
+            offsets.append(len(doc_ids))
+        self.add_strings(name + "/keys", keys)
+        self.add(name + "/offsets", "Q", offsets)
+        self.add(name + "/ids", "I", doc_ids)
+
+    def write(self, path: str, meta: Dict[str, Any]):
+        layout = {}
+        position = 0
+        for name, (typecode, data) in self.sections.items():
+            layout[name] = [position, len(data), typecode]
+            position += len(data) + (-len(data) % 8)
+        header = json.dumps(dict(meta, sections=layout)).encode("utf-8")
+        header += b" " * (-len(header) % 8)
+
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, "wb") as handle:
+            handle.write(MAGIC)
+            handle.write(struct.pack("<Q", len(header)))
+            handle.write(header)
+            for name, (typecode, data) in self.sections.items():
+                handle.write(data)
+                handle.write(b"\0" * (-len(data) % 8))
+        # Atomic swap so concurrently starting workers never see half a file
+        os.replace(tmp_path, path)
+
+
+def save_snapshot(index: LogIndex, path: str, source: Optional[Dict[str, Any]] = None):
+    """
+    Serialize every index structure (and the events) to path, with
+    the corpus_source of the capture it was built from, if any.
+    """
+    writer = _Writer()
+    fields = {}
+    for field, terms in index.postings.items():
+        keys = sorted(terms)
+        writer.add_postings(f"postings/{field}", keys, [terms[key] for key in keys])
+        grams = index.trigrams.get(field)
+        if grams:
+            ordinal = {term: i for i, term in enumerate(keys)}
+            gram_keys = sorted(grams)
+            writer.add_postings(
+                f"trigrams/{field}", gram_keys,
+                [sorted(ordinal[term] for term in grams[gram]) for gram in gram_keys]
+            )
+        fields[field] = {"trigrams": bool(grams)}
+    for field, column in index.numeric.items():
+        values, doc_ids = column.sorted_arrays()
+        writer.add(f"numeric/{field}/values", "d", values)
+        writer.add(f"numeric/{field}/ids", "I", doc_ids)
+    for field, column in index.ip_columns.items():
+        values, doc_ids = column.sorted_arrays()
+        writer.add(f"ip/{field}/values", "d", values)
+        writer.add(f"ip/{field}/ids", "I", doc_ids)
+    for field, column in index.columns.items():
+        if isinstance(column, StringColumn):
+            writer.add(f"columns/{field}/offsets", "Q", column.offsets)
+            writer.add(f"columns/{field}/blob", "B", bytes(column.blob))
+        else:
+            writer.add(f"columns/{field}/codes", "I", column.codes)
+            writer.add_strings(f"columns/{field}/values", [json.dumps(value) for value in column.values])
+    for field, times in index.time_values.items():
+        writer.add(f"time/{field}", "d", times)
+    tokens = sorted(index.text_postings)
+    writer.add_postings("text", tokens, [index.text_postings[token] for token in tokens])
+    position_offsets = array("Q", [0])
+    positions = array("I")
+    for token in tokens:
+        for offsets in index.text_positions[token]:
+            positions.extend(offsets)
+            position_offsets.append(len(positions))
+    writer.add("text/positions/offsets", "Q", position_offsets)
+    writer.add("text/positions/values", "I", positions)
+    writer.add("untimed", "I", index.untimed)
+    writer.write(path, {
+        "version": FORMAT_VERSION,
+        "byteorder": sys.byteorder,
+        "docs": len(index),
+        "time_ordered": index.time_ordered,
+        "analyzer": {"stem": index.analyzer.stem},
+        "fields": fields,
+        "numeric": list(index.numeric),
+        "ip_columns": list(index.ip_columns),
+        "columns": list(index.columns),
+        "string_columns": [field for field, column in index.columns.items() if isinstance(column, StringColumn)],
+        "time_values": list(index.time_values),
+        "source": source,
+    })
+
+
+# ==========================================
+# Loading
+# ==========================================
+
+class _Sections:
+    """Typed views of a mapped snapshot's sections, by name."""
+
+    def __init__(self, view: memoryview, base: int, layout: Dict[str, List[Any]]):
+        self._view = view
+        self._base = base
+        self._layout = layout
+
+    def array(self, name: str):
+        offset, length, typecode = self._layout[name]
+        data = self._view[self._base + offset:self._base + offset + length]
+        return data if typecode == "B" else data.cast(typecode)
+
+    def strings(self, name: str) -> StringTable:
+        return StringTable(self.array(name + "/offsets"), self.array(name + "/blob"))
+
+    def terms(self, name: str) -> SnapshotTerms:
+        return SnapshotTerms(self.strings(name + "/keys"), self.array(name + "/offsets"), self.array(name + "/ids"))
+
+
+def _read_header(view: memoryview, path: str) -> Tuple[Dict[str, Any], int]:
+    """A snapshot's JSON header and the offset its sections start at."""
+    if bytes(view[:len(MAGIC)]) != MAGIC:
+        raise ValueError(f"{path} is not an index snapshot")
+    (header_length,) = struct.unpack_from("<Q", view, len(MAGIC))
+    base = len(MAGIC) + 8
+    header = json.loads(bytes(view[base:base + header_length]))
+    if header["version"] != FORMAT_VERSION or header["byteorder"] != sys.byteorder:
+        raise ValueError(f"{path} was written by an incompatible version or platform")
+    return header, base + header_length
+
+
+def _load_terms(index: LogIndex, header: Dict[str, Any], sections: _Sections):
+    """Term dictionaries, trigrams and the full-text index."""
+    index.text_postings = sections.terms("text")
+    index.text_positions = SnapshotPositions(
+        index.text_postings, sections.array("text/positions/offsets"), sections.array("text/positions/values")
+    )
+    for field, info in header["fields"].items():
+        index.postings[field] = sections.terms(f"postings/{field}")
+        index._sorted_terms[field] = index.postings[field]._terms
+        if info["trigrams"]:
+            grams = sections.terms(f"trigrams/{field}")
+            index.trigrams[field] = SnapshotGrams(
+                grams._terms, grams._offsets, grams._doc_ids, index.postings[field]._terms
+            )
+
+
+def _load_columns(index: LogIndex, header: Dict[str, Any], sections: _Sections):
+    """Numeric, IP, row and time columns."""
+    for kind, listed, columns in (("numeric", "numeric", index.numeric), ("ip", "ip_columns", index.ip_columns)):
+        for field in header[listed]:
+            column = NumericColumn()
+            column._sorted = (sections.array(f"{kind}/{field}/values"), sections.array(f"{kind}/{field}/ids"))
+            columns[field] = column
+    string_columns = set(header["string_columns"])
+    for field in header["columns"]:
+        if field in string_columns:
+            column = StringColumn()
+            column.offsets = sections.array(f"columns/{field}/offsets")
+            column.blob = sections.array(f"columns/{field}/blob")
+        else:
+            column = DictColumn()
+            column.codes = sections.array(f"columns/{field}/codes")
+            column.values = JsonValues(sections.strings(f"columns/{field}/values"))
+        index.columns[field] = column
+    for field in header["time_values"]:
+        index.time_values[field] = sections.array(f"time/{field}")
+
+
+def load_snapshot(path: str) -> LogIndex:
+    """
+    Memory-map a snapshot and return a read-only LogIndex over it.
+    The index's snapshot_source is the corpus_source it was saved with.
+    """
+    with open(path, "rb") as handle:
+        mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)
+    header, base = _read_header(view, path)
+    sections = _Sections(view, base, header["sections"])
+    index = LogIndex(analyzer=Analyzer(**header["analyzer"]))
+    _load_terms(index, header, sections)
+    _load_columns(index, header, sections)
+    index.untimed = sections.array("untimed")
+    index.time_ordered = header["time_ordered"]
+    index.logs.size = header["docs"]
+    index.read_only = True
+    index.snapshot_source = header["source"]
+    # Keep the mapping alive for as long as the index is
+    index.snapshot_map = mapped
+    return index
+
+
+if __name__ == "__main__":
+    from .log_ingest import ingest_file
+
+    if len(sys.argv) != 3:
+        print("usage: python -m app.services.index_snapshot <capture.ndjson> <snapshot.idx>")
+        sys.exit(2)
+    built = LogIndex()
+    print(ingest_file(sys.argv[1], built))
+    save_snapshot(built, sys.argv[2], corpus_source(sys.argv[1]))
+    started = time.perf_counter()
+    loaded = load_snapshot(sys.argv[2])
+    print(f"Wrote {sys.argv[2]}: {len(loaded):,} events, loads in {(time.perf_counter() - started) * 1000:.1f} ms")
@@ -0,0 +1,413 @@
+"""
+Cyber Coding Game - Linear-Time Regex
+
+A regex search whose running time is linear in the input, whatever
+the pattern. Used for grading patterns when backtracking re is too
+risky on untrusted code (see python_grader).
+
+The pattern is parsed with re's own parser, so the syntax is the
+same. It is then compiled to a Thompson NFA, and the search runs
+over it as a DFA that is built lazily: each (set of NFA states,
+previous character class, next character) transition is worked out
+once and cached. After warm-up the search does one dict lookup per
+input character.
+
+Only "is there a match" is answered; there are no groups or spans.
+Backreferences, lookarounds, atomic groups and possessive repeats
+have no linear-time equivalent and are rejected at compile time.
+
+backtracking_risk() is the other side: a lint for the pattern shapes
+that make backtracking re take exponential or polynomial time, for
+patterns that will run on re.
+"""
+
+import re
+import string
+import threading
+import time
+from typing import Callable, Dict, FrozenSet, List, Optional, Tuple
+
+try:
+    from re import _compiler as sre_compile, _constants as sre_constants, _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_compile
+    import sre_constants
+    import sre_parse
+
+# NFA bigger than this is refused (e.g. a{1000}{1000})
+MAX_NFA_STATES = 20_000
+# DFA states cached per pattern; past this, new states are stepped on uncached
+MAX_DFA_STATES = 5_000
+# Characters scanned between deadline checks
+DEADLINE_STRIDE = 4096
+
+_CHAR, _SPLIT, _ASSERT, _MATCH = range(4)
+
+# Character classes of the previous position, for anchors and \b
+_START, _NEWLINE, _WORD, _OTHER = "s", "n", "w", "o"
+_END = None
+
+_SINGLE_CHARACTER = (sre_constants.LITERAL, sre_constants.NOT_LITERAL, sre_constants.ANY, sre_constants.IN)
+
+_UNSUPPORTED = {
+    sre_constants.GROUPREF: "backreferences",
+    sre_constants.GROUPREF_EXISTS: "conditional groups",
+    sre_constants.ASSERT: "lookarounds",
+    sre_constants.ASSERT_NOT: "lookarounds",
+}
+for _name, _what in (("ATOMIC_GROUP", "atomic groups"), ("POSSESSIVE_REPEAT", "possessive repeats")):
+    if hasattr(sre_constants, _name):
+        _UNSUPPORTED[getattr(sre_constants, _name)] = _what
+
+
+class RegexTimeout(RuntimeError):
+    """A search ran past its deadline."""
+
+
+def _char_class(ch: str) -> str:
+    if ch == "\n":
+        return _NEWLINE
+    return _WORD if ch.isalnum() or ch == "_" else _OTHER
+
+
+def _char_predicate(op, av, flags: int) -> Optional[Callable[[str], bool]]:
+    """
+    Predicate for an item that matches exactly one character, else None.
+
+    The item is compiled on its own with re, so case folding, classes
+    like \\w and the ASCII flag mean exactly what they do in re.
+    """
+    if op not in _SINGLE_CHARACTER:
+        return None
+    state = sre_parse.State()
+    state.flags = flags
+    match = sre_compile.compile(sre_parse.SubPattern(state, [(op, av)]), flags).match
+    return lambda ch: match(ch) is not None
+
+
+class LinearRegex:
+    """A compiled pattern whose search() is linear in the text length."""
+
+    def __init__(self, pattern: str, flags: int = 0):
+        self.pattern = pattern
+        parsed = sre_parse.parse(pattern, flags)
+        self.flags = parsed.state.flags
+        self._kind: List[int] = []
+        self._pred: List[Optional[Callable[[str], bool]]] = []
+        self._arg: List[object] = []
+        self._out: List[List[int]] = []
+        match = self._add(_MATCH)
+        self._start = self._sequence(list(parsed), self.flags, match)
+        self._match = match
+
+        # Lazy DFA: state id -> (NFA states, previous class); transitions per character
+        self._dfa_states: List[Tuple[FrozenSet[int], str]] = []
+        self._dfa_ids: Dict[Tuple[FrozenSet[int], str], int] = {}
+        self._transitions: List[Dict[str, int]] = []
+        self._lock = threading.Lock()
+        self._start_id = self._dfa_id((frozenset({self._start}), _START))
+
+    # -- NFA construction (built back to front: every piece gets its continuation)
+
+    def _add(self, kind: int, pred=None, arg=None, out=None) -> int:
+        if len(self._kind) >= MAX_NFA_STATES:
+            raise ValueError(f"pattern {self.pattern!r} is too large for the linear engine")
+        self._kind.append(kind)
+        self._pred.append(pred)
+        self._arg.append(arg)
+        self._out.append(out or [])
+        return len(self._kind) - 1
+
+    def _sequence(self, items, flags: int, cont: int) -> int:
+        for op, av in reversed(items):
+            cont = self._item(op, av, flags, cont)
+        return cont
+
+    def _item(self, op, av, flags: int, cont: int) -> int:
+        if op in _UNSUPPORTED:
+            raise ValueError(f"the linear engine can't run {_UNSUPPORTED[op]} in {self.pattern!r}")
+        pred = _char_predicate(op, av, flags)
+        if pred is not None:
+            return self._add(_CHAR, pred, out=[cont])
+        if op is sre_constants.BRANCH:
+            return self._add(_SPLIT, out=[self._sequence(list(branch), flags, cont) for branch in av[1]])
+        if op is sre_constants.SUBPATTERN:
+            _, add_flags, del_flags, body = av
+            return self._sequence(list(body), (flags | add_flags) & ~del_flags, cont)
+        if op is sre_constants.AT:
+            return self._add(_ASSERT, arg=(av, flags), out=[cont])
+        if op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            low, high, body = av
+            body = list(body)
+            if high == sre_constants.MAXREPEAT:
+                loop = self._add(_SPLIT)
+                self._out[loop] = [self._sequence(body, flags, loop), cont]
+                start = loop
+            else:
+                # x{0,n}: n nested optional copies
+                start = cont
+                for _ in range(high - low):
+                    start = self._add(_SPLIT, out=[self._sequence(body, flags, start), cont])
+            for _ in range(low):
+                start = self._sequence(body, flags, start)
+            return start
+        raise ValueError(f"the linear engine doesn't support {op} in {self.pattern!r}")
+
+    # -- Search
+
+    def _holds(self, state: int, prev: str, nxt: Optional[str], final: bool) -> bool:
+        """Whether an anchor holds between prev (a class) and nxt (a character or _END)."""
+        at, flags = self._arg[state]
+        multiline = flags & re.MULTILINE
+        if at in (sre_constants.AT_BEGINNING, sre_constants.AT_BEGINNING_LINE):
+            return prev == _START or (multiline and prev == _NEWLINE)
+        if at is sre_constants.AT_BEGINNING_STRING:
+            return prev == _START
+        if at in (sre_constants.AT_END, sre_constants.AT_END_LINE):
+            if nxt is _END:
+                return True
+            return nxt == "\n" and (multiline or final)
+        if at is sre_constants.AT_END_STRING:
+            return nxt is _END
+        if at in (sre_constants.AT_BOUNDARY, sre_constants.AT_NON_BOUNDARY):
+            boundary = (prev == _WORD) != (nxt is not _END and _char_class(nxt) == _WORD)
+            return boundary == (at is sre_constants.AT_BOUNDARY)
+        raise ValueError(f"the linear engine doesn't support anchor {at} in {self.pattern!r}")
+
+    def _expand(self, states: FrozenSet[int], prev: str, nxt: Optional[str], final: bool) -> List[int]:
+        """Character-consuming states (and the match state) reachable without input."""
+        seen = set()
+        stack = list(states)
+        reached = []
+        while stack:
+            state = stack.pop()
+            if state in seen:
+                continue
+            seen.add(state)
+            kind = self._kind[state]
+            if kind == _SPLIT:
+                stack.extend(self._out[state])
+            elif kind == _ASSERT:
+                if self._holds(state, prev, nxt, final):
+                    stack.extend(self._out[state])
+            else:
+                reached.append(state)
+        return reached
+
+    def _dfa_id(self, key: Tuple[FrozenSet[int], str]) -> Optional[int]:
+        """Id of a cached DFA state, added if there is room; None once the cache is full."""
+        found = self._dfa_ids.get(key)
+        if found is None:
+            with self._lock:
+                found = self._dfa_ids.get(key)
+                if found is None:
+                    if len(self._dfa_states) >= MAX_DFA_STATES:
+                        return None
+                    self._dfa_states.append(key)
+                    self._transitions.append({})
+                    found = len(self._dfa_states) - 1
+                    self._dfa_ids[key] = found
+        return found
+
+    def _next(self, states: FrozenSet[int], prev: str, ch: str, final: bool) -> Optional[Tuple[FrozenSet[int], str]]:
+        """NFA states and character class after reading ch, or None if a match ends before it."""
+        reached = self._expand(states, prev, ch, final)
+        if self._match in reached:
+            return None
+        following = {self._out[state][0] for state in reached if self._kind[state] == _CHAR and self._pred[state](ch)}
+        # Unanchored search: a match may also start at the next position
+        following.add(self._start)
+        return frozenset(following), _char_class(ch)
+
+    def search(self, text: str, deadline: Optional[float] = None) -> bool:
+        """
+        Whether the pattern matches anywhere in text.
+
+        deadline is a time.perf_counter() value; RegexTimeout is raised
+        once it has passed (checked every few thousand characters).
+        """
+        transitions = self._transitions
+        dfa_id: Optional[int] = self._start_id
+        # Once the cache is full, new states are stepped on without being stored
+        uncached: Optional[Tuple[FrozenSet[int], str]] = None
+        last = len(text) - 1
+        for i, ch in enumerate(text):
+            if deadline is not None and i % DEADLINE_STRIDE == 0 and time.perf_counter() > deadline:
+                raise RegexTimeout(f"regex search ran past its deadline after {i:,} characters")
+            # $ may match before a final newline, so the last step is never cached
+            cacheable = dfa_id is not None and i != last
+            if cacheable:
+                row = transitions[dfa_id]
+                nxt = row.get(ch)
+                if nxt is not None:
+                    if nxt < 0:
+                        return True
+                    dfa_id = nxt
+                    continue
+            key = self._next(*(self._dfa_states[dfa_id] if dfa_id is not None else uncached), ch, i == last)
+            if key is None:
+                if cacheable:
+                    row[ch] = -1
+                return True
+            nxt = self._dfa_id(key)
+            if cacheable and nxt is not None:
+                row[ch] = nxt
+            dfa_id, uncached = nxt, (key if nxt is None else None)
+        states, prev = self._dfa_states[dfa_id] if dfa_id is not None else uncached
+        return self._match in self._expand(states, prev, _END, True)
+
+    def __repr__(self) -> str:
+        return f"LinearRegex({self.pattern!r})"
+
+
+# -- Backtracking lint, for patterns that will run on re
+
+# Stands in for "every character" when comparing character classes
+_SAMPLE = string.printable + " éß∑"
+# Repeats bounded above this count as unbounded
+_UNBOUNDED = 32
+
+_REPEATS = tuple(getattr(sre_constants, name) for name in ("MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT")
+                 if hasattr(sre_constants, name))
+
+
+def _group_flags(flags: int, av) -> int:
+    return (flags | av[1]) & ~av[2]
+
+
+def _unbounded(op, av) -> bool:
+    # Possessive repeats never give back what they took
+    return op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and av[1] > _UNBOUNDED
+
+
+def _first(items, flags: int) -> Tuple[FrozenSet[str], bool]:
+    """Characters a match of items can start with, and whether it can be empty."""
+    first: FrozenSet[str] = frozenset()
+    for op, av in items:
+        chars, nullable = _first_item(op, av, flags)
+        first |= chars
+        if not nullable:
+            return first, False
+    return first, True
+
+
+def _first_item(op, av, flags: int) -> Tuple[FrozenSet[str], bool]:
+    pred = _char_predicate(op, av, flags)
+    if pred is not None:
+        return frozenset(ch for ch in _SAMPLE if pred(ch)), False
+    if op is sre_constants.BRANCH:
+        branches = [_first(list(branch), flags) for branch in av[1]]
+        return frozenset().union(*(chars for chars, _ in branches)), any(nullable for _, nullable in branches)
+    if op is sre_constants.SUBPATTERN:
+        return _first(list(av[3]), _group_flags(flags, av))
+    if op in _REPEATS:
+        chars, nullable = _first(list(av[2]), flags)
+        return chars, nullable or av[0] == 0
+    if op is getattr(sre_constants, "ATOMIC_GROUP", None):
+        return _first(list(av), flags)
+    if op in (sre_constants.GROUPREF, sre_constants.GROUPREF_EXISTS):
+        return frozenset(_SAMPLE), True
+    # Anchors and lookarounds consume nothing
+    return frozenset(), True
+
+
+def _unwrap(op, av, flags: int):
+    """Look through groups around a single item: (\\w+) is \\w+."""
+    while op is sre_constants.SUBPATTERN and len(av[3]) == 1:
+        flags = _group_flags(flags, av)
+        op, av = av[3][0]
+    return op, av, flags
+
+
+def _restarts(items, flags: int, first: FrozenSet[str]) -> bool:
+    """
+    Whether an unbounded repeat at the end of items, with only
+    optional items after it, can take characters that start items.
+    Inside an outer repeat, that is two ways to split every run.
+    """
+    for op, av in reversed(items):
+        if op is sre_constants.SUBPATTERN:
+            if _restarts(list(av[3]), _group_flags(flags, av), first):
+                return True
+        elif op is sre_constants.BRANCH:
+            if any(_restarts(list(branch), flags, first) for branch in av[1]):
+                return True
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            if _unbounded(op, av) and _first(list(av[2]), flags)[0] & first:
+                return True
+            if _restarts(list(av[2]), flags, first):
+                return True
+        if not _first_item(op, av, flags)[1]:
+            return False
+    return False
+
+
+def _overlapping_branches(items, flags: int) -> bool:
+    for op, av in items:
+        if op is sre_constants.SUBPATTERN and _overlapping_branches(list(av[3]), _group_flags(flags, av)):
+            return True
+        if op is sre_constants.BRANCH:
+            seen: FrozenSet[str] = frozenset()
+            for branch in av[1]:
+                chars = _first(list(branch), flags)[0]
+                if chars & seen:
+                    return True
+                seen |= chars
+    return False
+
+
+def _sequence_risk(items, flags: int) -> Optional[str]:
+    items = [_unwrap(op, av, flags) for op, av in items]
+    for i, (op, av, item_flags) in enumerate(items):
+        risk = _item_risk(op, av, item_flags)
+        if risk:
+            return risk
+        if not _unbounded(op, av):
+            continue
+        chars = _first(list(av[2]), item_flags)[0]
+        for next_op, next_av, next_flags in items[i + 1:]:
+            if _unbounded(next_op, next_av) and chars & _first(list(next_av[2]), next_flags)[0]:
+                return ("two unbounded repeats over overlapping characters, with only optional "
+                        "items between them (polynomial backtracking, as in \\w+\\s*\\w+)")
+            if not _first_item(next_op, next_av, next_flags)[1]:
+                break
+    return None
+
+
+def _item_risk(op, av, flags: int) -> Optional[str]:
+    if op is sre_constants.BRANCH:
+        for branch in av[1]:
+            risk = _sequence_risk(list(branch), flags)
+            if risk:
+                return risk
+    elif op is sre_constants.SUBPATTERN:
+        return _sequence_risk(list(av[3]), _group_flags(flags, av))
+    elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+        body = list(av[2])
+        if _unbounded(op, av):
+            if _restarts(body, flags, _first(body, flags)[0]):
+                return ("a repeat inside a repeat can also start the outer repeat's next round "
+                        "(exponential backtracking, as in (a+)+)")
+            if _overlapping_branches(body, flags):
+                return ("a repeated alternation has branches that can start with the same "
+                        "character (exponential backtracking, as in (\\w|[a-z]\\d)*)")
+        return _sequence_risk(body, flags)
+    return None
+
+
+def backtracking_risk(pattern: str, flags: int = 0) -> Optional[str]:
+    """
+    Why pattern could make re backtrack catastrophically, or None.
+
+    Looks for three shapes, erring on the side of flagging: a repeat
+    nested in a repeat where the inner one can also start the outer
+    one's next round, a repeated alternation whose branches can start
+    alike, and two unbounded repeats over overlapping characters with
+    only optional items between them. The first two are exponential
+    in the input length, the last polynomial. A lone .* is quadratic
+    over a search at worst and is let through.
+
+    Raises re.error if pattern doesn't compile.
+    """
+    parsed = sre_parse.parse(pattern, flags)
+    return _sequence_risk(list(parsed), parsed.state.flags)
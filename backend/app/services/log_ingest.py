@@ -0,0 +1,124 @@
+"""
+Cyber Coding Game - Log Corpus Ingest
+
+Streams large log captures into a LogIndex without reading the
+whole file into memory.
+
+Files are memory-mapped read-only and consumed line by line, so
+the OS pages raw text in and out as needed. Parsed events are
+handed to the index in fixed-size batches; only the current batch
+is held in Python at any time.
+
+Supported formats:
+- NDJSON (.ndjson, .jsonl, .json): one JSON object per line
+- Anything else: one plain-text event per line, stored as {"message": line}
+
+Run directly to measure ingest throughput:
+
+    python -m app.services.log_ingest path/to/capture.ndjson
+"""
+
+import json
+import logging
+import mmap
+import os
+import sys
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional
+
+from .lucene_index import LogIndex
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 10_000
+NDJSON_EXTENSIONS = (".ndjson", ".jsonl", ".json")
+
+
+@dataclass
+class IngestStats:
+    """Summary of one ingest run."""
+    events: int = 0
+    skipped: int = 0
+    batches: int = 0
+    bytes_read: int = 0
+    seconds: float = 0.0
+
+    @property
+    def events_per_second(self) -> float:
+        return self.events / self.seconds if self.seconds > 0 else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.events:,} events ({self.skipped:,} skipped) in {self.batches} batches, "
+            f"{self.bytes_read / 1_048_576:.1f} MiB in {self.seconds:.2f}s "
+            f"= {self.events_per_second:,.0f} events/s"
+        )
+
+
+def _iter_lines(path: str) -> Iterator[bytes]:
+    """Yield raw lines of a file through a read-only memory map."""
+    if os.path.getsize(path) == 0:
+        return
+    with open(path, "rb") as handle, mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        yield from iter(mapped.readline, b"")
+
+
+def _parse_line(line: bytes, ndjson: bool) -> Optional[Dict[str, Any]]:
+    """Turn one raw line into an event dict, or None to skip it."""
+    text = line.decode("utf-8", errors="replace").strip()
+    if not text:
+        return None
+    if not ndjson:
+        return {"message": text}
+    try:
+        event = json.loads(text)
+    except ValueError:
+        return None
+    return event if isinstance(event, dict) else None
+
+
+def ingest_file(path: str, index: LogIndex, batch_size: int = DEFAULT_BATCH_SIZE,
+                ndjson: Optional[bool] = None) -> IngestStats:
+    """
+    Stream a log file into index in batches of batch_size events.
+
+    The format is picked from the file extension unless ndjson is
+    given. Lines that are blank or not a JSON object are skipped
+    and counted.
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+    if ndjson is None:
+        ndjson = path.lower().endswith(NDJSON_EXTENSIONS)
+
+    stats = IngestStats()
+    started = time.perf_counter()
+    batch: List[Dict[str, Any]] = []
+    for line in _iter_lines(path):
+        stats.bytes_read += len(line)
+        event = _parse_line(line, ndjson)
+        if event is None:
+            if line.strip():
+                stats.skipped += 1
+            continue
+        batch.append(event)
+        if len(batch) >= batch_size:
+            stats.events += index.add_batch(batch)
+            stats.batches += 1
+            batch = []
+    if batch:
+        stats.events += index.add_batch(batch)
+        stats.batches += 1
+    index.finalize()
+    stats.seconds = time.perf_counter() - started
+
+    logger.info("Ingested %s: %s", path, stats)
+    return stats
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("usage: python -m app.services.log_ingest <capture.ndjson>")
+        sys.exit(2)
+    print(ingest_file(sys.argv[1], LogIndex()))
@@ -0,0 +1,1098 @@
+"""
+Cyber Coding Game - Log Index
+
+In-memory inverted index over the simulated log corpus.
+
+Each field gets its own term dictionary that maps a normalized
+value to the posting list (sorted event IDs) that contain it.
+The index is built once per corpus so queries only touch the
+postings they need instead of every event.
+
+Sets of matching events are passed around as bitmaps: a plain
+Python int where bit N is set when event N matches. AND, OR and
+NOT become single C-level integer operations.
+
+Numeric fields (and timestamps, parsed to epoch seconds once at
+ingest, and IPv4 addresses as 32-bit integers) are also kept as
+sorted columns, so range and CIDR clauses are a pair of binary
+searches plus the matching slice.
+
+Wildcards are matched against the term dictionary, not events:
+a trigram index over each string field's terms narrows the
+candidates, then a compiled (cached) matcher verifies them.
+
+Results are returned in a stable (timestamp, event ID) order. When
+events arrive in time order (the usual case for logs) that is just
+event-ID order, so a page resumes with a single bitmap shift.
+
+Every value is also run through an analyzer (see text_analysis.py)
+into a positional full-text index, so bare words resolve through
+token postings and "phrases" through position intersection.
+
+Every field is also stored column-wise in event-ID order, and the
+columns are the only copy of the events: dictionary-encoded codes
+for repetitive fields (user, action, status, ip...), a packed string
+buffer for near-unique ones (timestamps, messages), and epoch seconds
+for date histograms. Events are rebuilt from the columns on demand
+(see ColumnRows), so no per-event dicts are kept.
+"""
+
+import ipaddress
+import json
+import math
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from collections.abc import Sequence as SequenceABC
+from datetime import datetime, timezone
+from functools import lru_cache
+from itertools import chain, islice
+from typing import List, Dict, Any, Iterable, Iterator, Callable, Optional, Sequence, Set, Tuple
+
+from .lucene_query import TermQuery, WildcardQuery, RangeQuery, FuzzyQuery, CidrQuery, Deadline, LEAF_TYPES
+from .text_analysis import Analyzer
+
+
+def bitmap_from_ids(doc_ids: Iterable[int], size: int) -> int:
+    """Build a bitmap with the given event IDs set."""
+    buf = bytearray((size + 7) // 8)
+    for doc_id in doc_ids:
+        buf[doc_id >> 3] |= 1 << (doc_id & 7)
+    return int.from_bytes(buf, "little")
+
+
+def _paced(items: Iterable, deadline: Optional[Deadline], every: int = 256) -> Iterable:
+    """items, checking the deadline as they are consumed (when there is one)."""
+    return items if deadline is None else deadline.paced(items, every)
+
+
+def _chunks(slices: Iterable[Sequence[int]], size: int = 1 << 14) -> Iterator[Sequence[int]]:
+    """Posting slices cut into pieces of at most size IDs."""
+    for ids in slices:
+        for start in range(0, len(ids), size):
+            yield ids[start:start + size]
+
+
+def iter_bitmap(bitmap: int, start: int = 0) -> Iterator[int]:
+    """Yield the event IDs set in a bitmap, in ascending order, from start on."""
+    bitmap >>= start
+    data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+    for byte_index, byte in enumerate(data):
+        if not byte:
+            continue
+        base = start + (byte_index << 3)
+        while byte:
+            low = byte & -byte
+            yield base + low.bit_length() - 1
+            byte ^= low
+
+
+# String fields parsed to epoch seconds for range queries
+TIME_FIELDS = ("timestamp",)
+
+# Field whose epoch, followed by event ID, defines result order
+SORT_FIELD = "timestamp"
+
+# Markers for the start/end of a term in the trigram index, so
+# anchored fragments like "adm*" narrow candidates too
+_TERM_START = "\x02"
+_TERM_END = "\x03"
+# Position gap between fields so phrases never match across two values
+POSITION_GAP = 100
+
+# Sorts after any character that appears in real terms
+_MAX_CHAR = "\U0010ffff"
+
+# A dictionary column whose distinct values pass this (and half its
+# events) is near-unique, so it's moved to a packed StringColumn
+MAX_DICT_VALUES = 4096
+_JSON_MARK = "\x00"
+_MISSING = object()
+
+
+def _trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+@lru_cache(maxsize=256)
+def compile_wildcard(pattern: str) -> Callable[[str], bool]:
+    """
+    Compile a case-insensitive ``*`` wildcard into a matcher.
+
+    Matches the whole (lowercased) term like Lucene does. Common
+    shapes get str fast paths; the general case walks the literal
+    fragments with str.find, so matching is linear with no regex
+    backtracking however many ``*`` the pattern has.
+    """
+    parts = pattern.lower().split("*")
+    if len(parts) == 1:
+        return parts[0].__eq__
+    head, *middle, tail = parts
+    if not middle:
+        if not tail:
+            return lambda value: value.startswith(head)
+        if not head:
+            return lambda value: value.endswith(tail)
+    elif len(middle) == 1 and not head and not tail:
+        needle = middle[0]
+        return lambda value: needle in value
+    middle = [part for part in middle if part]
+    min_length = len(head) + len(tail)
+
+    def match(value: str) -> bool:
+        if len(value) < min_length or not value.startswith(head) or not value.endswith(tail):
+            return False
+        pos, end = len(head), len(value) - len(tail)
+        for part in middle:
+            pos = value.find(part, pos, end)
+            if pos < 0:
+                return False
+            pos += len(part)
+        return True
+
+    return match
+
+
+def _pattern_trigrams(pattern: str) -> Set[str]:
+    """Trigrams every term matching the wildcard pattern must contain."""
+    parts = pattern.lower().split("*")
+    fragments = parts[1:-1]
+    if parts[0]:
+        fragments.append(_TERM_START + parts[0])
+    if parts[-1]:
+        fragments.append(parts[-1] + _TERM_END)
+    return set().union(*(_trigrams(fragment) for fragment in fragments))
+
+
+def prefix_range(terms: Sequence[str], prefix: str) -> Tuple[int, int]:
+    """Slice of a sorted term list holding every term that starts with prefix."""
+    lo = bisect_left(terms, prefix)
+    return lo, bisect_left(terms, prefix + _MAX_CHAR, lo)
+
+
+def levenshtein_matches(terms: Sequence[str], word: str, max_edits: int,
+                        deadline: Optional[Deadline] = None) -> List[Tuple[str, int]]:
+    """
+    (term, edit distance) for every term of a sorted list within
+    max_edits of word. Like Lucene, swapping two adjacent characters
+    counts as one edit.
+
+    Walks the list like a trie: consecutive terms share their common
+    prefix's rows of the edit-distance table, and once no cell of the
+    last two rows can lead back under max_edits, no term with that
+    prefix can match, so the whole prefix range is skipped with one
+    bisect. That is the pruning a Levenshtein automaton gives,
+    without building one.
+
+    With a deadline, it is checked every 256 terms visited.
+    """
+    matches = []
+    rows = [list(range(len(word) + 1))]
+    previous = ""
+    i = 0
+    visited = 0
+    while i < len(terms):
+        if deadline is not None and not visited % 256:
+            deadline.check()
+        visited += 1
+        term = terms[i]
+        common = 0
+        limit = min(len(term), len(previous), len(rows) - 1)
+        while common < limit and term[common] == previous[common]:
+            common += 1
+        del rows[common + 1:]
+        previous = term
+        dead_end = None
+        for depth in range(common, len(term)):
+            char = term[depth]
+            above = rows[-1]
+            row = [above[0] + 1]
+            for j, expected in enumerate(word, 1):
+                cost = min(row[j - 1] + 1, above[j] + 1, above[j - 1] + (expected != char))
+                if depth and j > 1 and expected == term[depth - 1] and word[j - 2] == char:
+                    cost = min(cost, rows[-2][j - 2] + 1)
+                row.append(cost)
+            rows.append(row)
+            if min(row) > max_edits and min(above) >= max_edits:
+                dead_end = term[:depth + 1]
+                break
+        if dead_end is not None:
+            i = prefix_range(terms, dead_end)[1]
+            continue
+        if rows[-1][-1] <= max_edits:
+            matches.append((term, rows[-1][-1]))
+        i += 1
+    return matches
+
+
+def parse_timestamp(value: Any) -> Optional[float]:
+    """Parse an ISO-style timestamp to epoch seconds (naive = UTC)."""
+    try:
+        parsed = datetime.fromisoformat(str(value).strip())
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def ipv4_to_int(value: str) -> Optional[int]:
+    """The 32-bit integer of a dotted IPv4 address, or None if value isn't one."""
+    parts = value.split(".")
+    if len(parts) != 4:
+        return None
+    number = 0
+    for part in parts:
+        if not part.isdigit() or len(part) > 3 or int(part) > 255:
+            return None
+        number = number << 8 | int(part)
+    return number
+
+
+def parse_interval(interval: str) -> int:
+    """Convert an interval like 30s, 5m, 1h or 1d to seconds."""
+    match = re.fullmatch(r'(\d+)([smhd])', interval.strip())
+    if not match or int(match.group(1)) == 0:
+        raise ValueError(f"invalid interval {interval!r}, use e.g. 30m, 1h or 1d")
+    return int(match.group(1)) * {"s": 1, "m": 60, "h": 3600, "d": 86400}[match.group(2)]
+
+
+class NumericColumn:
+    """
+    Sorted (value, event ID) pairs for one numeric field.
+
+    New values are buffered (as compact arrays) and merged on the
+    next range lookup, so bulk ingest pays for one sort rather than
+    one per event. The sorted arrays are swapped in as one tuple so
+    concurrent readers never see values and IDs from different
+    generations.
+    """
+
+    def __init__(self):
+        self._sorted: Tuple[array, array] = (array("d"), array("I"))
+        self._pending_values = array("d")
+        self._pending_ids = array("I")
+
+    def add(self, value: float, doc_id: int):
+        self._pending_values.append(value)
+        self._pending_ids.append(doc_id)
+
+    def sorted_arrays(self) -> Tuple[array, array]:
+        """(values, event IDs), both ordered by value."""
+        if self._pending_ids:
+            values = self._sorted[0] + self._pending_values
+            doc_ids = self._sorted[1] + self._pending_ids
+            self._pending_values = array("d")
+            self._pending_ids = array("I")
+            # Pending IDs are all newer than sorted ones, so a stable sort
+            # on value alone keeps ties in event-ID order
+            order = sorted(range(len(values)), key=values.__getitem__)
+            self._sorted = (
+                array("d", (values[i] for i in order)),
+                array("I", (doc_ids[i] for i in order)),
+            )
+        return self._sorted
+
+    def select(self, low: Optional[float], high: Optional[float],
+               include_low: bool = True, include_high: bool = True) -> List[array]:
+        """
+        Slices of event IDs whose value falls in the range.
+
+        low > high wraps around (value >= low or value <= high), so
+        hour:[23 TO 5] means "from 11 PM through 5 AM".
+        """
+        values, doc_ids = self.sorted_arrays()
+        if low is not None and high is not None and low > high:
+            bounds = [(low, None, include_low, True), (None, high, True, include_high)]
+        else:
+            bounds = [(low, high, include_low, include_high)]
+        slices = []
+        for lo, hi, inc_lo, inc_hi in bounds:
+            start = 0 if lo is None else (bisect_left if inc_lo else bisect_right)(values, lo)
+            end = len(values) if hi is None else (bisect_right if inc_hi else bisect_left)(values, hi)
+            if end > start:
+                slices.append(doc_ids[start:end])
+        return slices
+
+    def __len__(self) -> int:
+        return len(self._sorted[0]) + len(self._pending_ids)
+
+
+def flatten_event(event: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+    """Nested objects as dotted fields: {"a": {"b": 1}} -> {"a.b": 1}. Lists stay values."""
+    flat: Dict[str, Any] = {}
+    for field, value in event.items():
+        name = f"{prefix}{field}"
+        if isinstance(value, dict):
+            flat.update(flatten_event(value, name + "."))
+        else:
+            flat[name] = value
+    return flat
+
+
+class DictColumn:
+    """
+    Dictionary-encoded column: one small integer code per event.
+
+    Code 0 means the event has no value for the field; other codes
+    index into values, which holds each distinct value once.
+    """
+
+    def __init__(self, size: int = 0):
+        self.codes = array("I", [0]) * size
+        self.values: List[Any] = [None]
+        self._code_of: Dict[Tuple[type, Any], int] = {}
+
+    @staticmethod
+    def _key(value: Any) -> Tuple[type, Any]:
+        # The type keeps True, 1 and 1.0 apart; lists are keyed by their JSON
+        if isinstance(value, (list, dict)):
+            return type(value), json.dumps(value, sort_keys=True, default=str)
+        return type(value), value
+
+    def append(self, value: Any):
+        key = self._key(value)
+        code = self._code_of.get(key)
+        if code is None:
+            code = self._code_of[key] = len(self.values)
+            self.values.append(value)
+        self.codes.append(code)
+
+    def append_missing(self):
+        self.codes.append(0)
+
+    def value(self, doc_id: int, default: Any = None) -> Any:
+        """The event's value, or default if it has none."""
+        code = self.codes[doc_id]
+        return self.values[code] if code else default
+
+    def take(self, doc_ids: Sequence[int]) -> List[Any]:
+        """Values of several events (None where missing)."""
+        codes, values = self.codes, self.values
+        return [values[codes[doc_id]] for doc_id in doc_ids]
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+
+class StringColumn:
+    """
+    Column for near-unique values, packed into one UTF-8 buffer and
+    found through an offsets array. Strings are stored as they are;
+    anything else (and the empty string) as _JSON_MARK plus JSON. An
+    empty slot means the event has no value for the field.
+    """
+
+    def __init__(self, size: int = 0):
+        self.offsets = array("Q", [0]) * (size + 1)
+        self.blob = bytearray()
+
+    @classmethod
+    def from_dict_column(cls, column: DictColumn) -> "StringColumn":
+        converted = cls()
+        for doc_id in range(len(column)):
+            value = column.value(doc_id, _MISSING)
+            if value is _MISSING:
+                converted.append_missing()
+            else:
+                converted.append(value)
+        return converted
+
+    def append(self, value: Any):
+        if isinstance(value, str) and value and value[0] != _JSON_MARK:
+            self.blob += value.encode("utf-8")
+        else:
+            self.blob += (_JSON_MARK + json.dumps(value)).encode("utf-8")
+        self.offsets.append(len(self.blob))
+
+    def append_missing(self):
+        self.offsets.append(len(self.blob))
+
+    def value(self, doc_id: int, default: Any = None) -> Any:
+        """The event's value, or default if it has none."""
+        start, end = self.offsets[doc_id], self.offsets[doc_id + 1]
+        return self._decode(start, end) if end > start else default
+
+    def take(self, doc_ids: Sequence[int]) -> List[Any]:
+        """Values of several events (None where missing)."""
+        offsets = self.offsets
+        return [
+            self._decode(offsets[doc_id], offsets[doc_id + 1]) if offsets[doc_id + 1] > offsets[doc_id] else None
+            for doc_id in doc_ids
+        ]
+
+    def _decode(self, start: int, end: int) -> Any:
+        text = bytes(self.blob[start:end]).decode("utf-8")
+        return json.loads(text[1:]) if text[0] == _JSON_MARK else text
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+
+class ColumnRows(SequenceABC):
+    """
+    The corpus as a sequence of event dicts, rebuilt on demand from
+    the columns. Fields come back in column order.
+    """
+
+    def __init__(self, columns: Dict[str, Any], size: int = 0):
+        # Shared with the index, so column conversions are seen here too
+        self._columns = columns
+        self.size = size
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, doc_id: int) -> Dict[str, Any]:
+        if not 0 <= doc_id < self.size:
+            raise IndexError(doc_id)
+        row = {}
+        for field, column in self._columns.items():
+            value = column.value(doc_id, _MISSING)
+            if value is not _MISSING:
+                row[field] = value
+        return row
+
+    def take(self, field: str, doc_ids: Sequence[int]) -> List[Any]:
+        """One field of several events (None where missing), read column-wise."""
+        column = self._columns.get(field)
+        return [None] * len(doc_ids) if column is None else column.take(doc_ids)
+
+
+class LogIndex:
+    """
+    Per-field inverted index over a list of log events.
+
+    Event IDs are positions in the corpus list, so posting lists
+    are naturally sorted as events are added in order.
+    """
+
+    def __init__(self, logs: Iterable[Dict[str, Any]] = (), analyzer: Optional[Analyzer] = None):
+        """Build the index for an initial corpus."""
+        self.columns: Dict[str, Any] = {}
+        self.logs = ColumnRows(self.columns)
+        self.postings: Dict[str, Dict[str, List[int]]] = {}
+        # Full-text index over every field's analyzed value: token ->
+        # event IDs, plus the token's positions in each of those events
+        self.analyzer = analyzer or Analyzer()
+        self.text_postings: Dict[str, List[int]] = {}
+        self.text_positions: Dict[str, List[List[int]]] = {}
+        self.numeric: Dict[str, NumericColumn] = {}
+        # IPv4 values of each field as integers, for CIDR and IP ranges
+        self.ip_columns: Dict[str, NumericColumn] = {}
+        self.trigrams: Dict[str, Dict[str, Set[str]]] = {}
+        self.time_values: Dict[str, array] = {}
+        # Sort-order bookkeeping: events without a usable timestamp
+        # sort last, and any out-of-order event clears time_ordered
+        self.untimed: List[int] = []
+        self.time_ordered = True
+        self._last_epoch = float("-inf")
+        # Set for indexes loaded from a snapshot (see index_snapshot.py)
+        self.read_only = False
+        # Bumped on every added event so cached results can be invalidated
+        self.generation = 0
+        # field -> sorted term list for prefix/fuzzy lookups, built lazily
+        self._sorted_terms: Dict[str, Sequence[str]] = {}
+        self.add_batch(logs)
+        self.finalize()
+
+    @staticmethod
+    def normalize(value: Any) -> str:
+        """Normalize a field value into an index term."""
+        return str(value).lower()
+
+    def add(self, log: Dict[str, Any]) -> int:
+        """
+        Index a single event and return its event ID.
+
+        Nested objects are flattened into dotted fields, so
+        {"http": {"method": "GET"}} is searched as http.method:GET.
+        """
+        if self.read_only:
+            raise RuntimeError("this index was loaded from a snapshot and is read-only")
+        if any(isinstance(value, dict) for value in log.values()):
+            log = flatten_event(log)
+        doc_id = len(self.logs)
+        self.generation += 1
+        sort_epoch = None
+        positions: Dict[str, List[int]] = {}
+        position = 0
+        for field, value in log.items():
+            if field not in TIME_FIELDS:
+                # Timestamps are searched with ranges, not words
+                position = self._add_tokens(value, position, positions)
+            self._add_to_column(field, value, doc_id)
+            self._add_posting(field, value, doc_id)
+            epoch = self._add_typed_value(field, value, doc_id, derive_hour="hour" not in log)
+            if field == SORT_FIELD and epoch is not None:
+                sort_epoch = epoch
+        self._add_text(positions, doc_id)
+        self._pad_missing(doc_id, len(log))
+        self._track_order(doc_id, sort_epoch)
+        # Only now is the event visible as a row
+        self.logs.size = doc_id + 1
+        return doc_id
+
+    def _add_tokens(self, value: Any, position: int, positions: Dict[str, List[int]]) -> int:
+        """Record a value's token positions; returns where the next field starts."""
+        tokens = self.analyzer.tokens(str(value))
+        for offset, token in enumerate(tokens, position):
+            positions.setdefault(token, []).append(offset)
+        return position + len(tokens) + POSITION_GAP
+
+    def _add_to_column(self, field: str, value: Any, doc_id: int):
+        column = self.columns.get(field)
+        if column is None:
+            column = self.columns[field] = DictColumn(doc_id)
+        column.append(value)
+        if isinstance(column, DictColumn) and len(column.values) > MAX_DICT_VALUES \
+                and len(column.values) * 2 > len(column.codes):
+            self.columns[field] = StringColumn.from_dict_column(column)
+
+    def _add_posting(self, field: str, value: Any, doc_id: int):
+        terms = self.postings.setdefault(field, {})
+        term = self.normalize(value)
+        postings = terms.get(term)
+        if postings is None:
+            postings = terms[term] = []
+            self._sorted_terms.pop(field, None)
+            if isinstance(value, str) and field not in TIME_FIELDS:
+                self._add_trigrams(field, term)
+        postings.append(doc_id)
+
+    def _add_typed_value(self, field: str, value: Any, doc_id: int, derive_hour: bool) -> Optional[float]:
+        """Index a timestamp, number or IPv4 value in its column; returns a timestamp's epoch."""
+        if field in TIME_FIELDS:
+            return self._add_time(field, value, doc_id, derive_hour)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            self._add_number(field, value, doc_id)
+        elif isinstance(value, str) and value[:1].isdigit():
+            address = ipv4_to_int(value)
+            if address is not None:
+                column = self.ip_columns.get(field)
+                if column is None:
+                    column = self.ip_columns[field] = NumericColumn()
+                column.add(address, doc_id)
+        return None
+
+    def _add_time(self, field: str, value: Any, doc_id: int, derive_hour: bool) -> Optional[float]:
+        epoch = parse_timestamp(value)
+        if epoch is None:
+            return None
+        times = self.time_values.get(field)
+        if times is None:
+            times = self.time_values[field] = array("d", [math.nan]) * doc_id
+        times.append(epoch)
+        self._add_number(field, epoch, doc_id)
+        if derive_hour:
+            # Derived so hour:[23 TO 5] works on any timestamped corpus
+            self._add_number("hour", datetime.fromtimestamp(epoch, timezone.utc).hour, doc_id)
+        return epoch
+
+    def _add_text(self, positions: Dict[str, List[int]], doc_id: int):
+        for token, offsets in positions.items():
+            doc_ids = self.text_postings.get(token)
+            if doc_ids is None:
+                self.text_postings[token] = [doc_id]
+                self.text_positions[token] = [offsets]
+            else:
+                doc_ids.append(doc_id)
+                self.text_positions[token].append(offsets)
+
+    def _pad_missing(self, doc_id: int, field_count: int):
+        """Pad columns for fields this event doesn't have."""
+        if len(self.columns) > field_count:
+            for column in self.columns.values():
+                if len(column) == doc_id:
+                    column.append_missing()
+        for times in self.time_values.values():
+            if len(times) == doc_id:
+                times.append(math.nan)
+
+    def _track_order(self, doc_id: int, sort_epoch: Optional[float]):
+        if sort_epoch is None:
+            self.untimed.append(doc_id)
+            self.time_ordered = False
+        else:
+            if sort_epoch < self._last_epoch:
+                self.time_ordered = False
+            self._last_epoch = max(self._last_epoch, sort_epoch)
+
+    def add_batch(self, logs: Iterable[Dict[str, Any]]) -> int:
+        """Index a batch of events and return how many were added."""
+        count = 0
+        for log in logs:
+            self.add(log)
+            count += 1
+        return count
+
+    def finalize(self):
+        """Merge buffered numeric values so queries find columns ready."""
+        for column in chain(self.numeric.values(), self.ip_columns.values()):
+            column.sorted_arrays()
+
+    def _add_trigrams(self, field: str, term: str):
+        grams = self.trigrams.setdefault(field, {})
+        for gram in _trigrams(_TERM_START + term + _TERM_END):
+            grams.setdefault(gram, set()).add(term)
+
+    def _add_number(self, field: str, value: float, doc_id: int):
+        column = self.numeric.get(field)
+        if column is None:
+            column = self.numeric[field] = NumericColumn()
+        column.add(value, doc_id)
+
+    def lookup(self, field: str, value: Any) -> List[int]:
+        """Return the posting list for field:value (empty if absent)."""
+        return self.postings.get(field, {}).get(self.normalize(value), [])
+
+    def lookup_bitmap(self, field: str, value: Any) -> int:
+        """Return the postings for field:value as a bitmap."""
+        return bitmap_from_ids(self.lookup(field, value), len(self.logs))
+
+    def text_lookup(self, text: str) -> Sequence[int]:
+        """
+        Events whose analyzed text contains text: a posting list for a
+        single token, or position intersection for a phrase.
+        """
+        tokens = self.analyzer.tokens(text)
+        if len(tokens) == 1:
+            return self.text_postings.get(tokens[0], [])
+        return self.phrase_postings(tokens)
+
+    def phrase_postings(self, tokens: Sequence[str]) -> List[int]:
+        """Events containing the tokens at consecutive positions of one field."""
+        doc_lists = [self.text_postings.get(token) for token in tokens]
+        if not tokens or not all(doc_lists):
+            return []
+        # Drive from the rarest token; look the others up by binary search
+        lead = min(doc_lists, key=len)
+        matches = []
+        for doc_id in lead:
+            starts = None
+            for offset, (token, doc_ids) in enumerate(zip(tokens, doc_lists)):
+                i = bisect_left(doc_ids, doc_id)
+                if i == len(doc_ids) or doc_ids[i] != doc_id:
+                    starts = None
+                    break
+                shifted = {position - offset for position in self.text_positions[token][i]}
+                starts = shifted if starts is None else starts & shifted
+                if not starts:
+                    break
+            if starts:
+                matches.append(doc_id)
+        return matches
+
+    def sorted_terms(self, field: str) -> Sequence[str]:
+        """The field's term dictionary in sorted order."""
+        terms = self._sorted_terms.get(field)
+        if terms is None:
+            terms = self._sorted_terms[field] = sorted(self.postings.get(field, ()))
+        return terms
+
+    def prefix_terms(self, field: str, prefix: str) -> Sequence[str]:
+        """Terms of field starting with prefix, by binary search on the dictionary."""
+        terms = self.sorted_terms(field)
+        lo, hi = prefix_range(terms, self.normalize(prefix))
+        return terms[lo:hi]
+
+    def fuzzy_terms(self, field: str, value: str, max_edits: int,
+                    deadline: Optional[Deadline] = None) -> List[Tuple[str, int]]:
+        """(term, edit distance) for terms of field within max_edits of value."""
+        return levenshtein_matches(self.sorted_terms(field), self.normalize(value), max_edits, deadline)
+
+    def suggest(self, field: str, value: str, max_edits: int = 2) -> Optional[str]:
+        """The closest existing term to a value, preferring more frequent ones."""
+        terms = self.postings.get(field, {})
+        candidates = [
+            (distance, -len(terms[term]), term)
+            for term, distance in self.fuzzy_terms(field, value, max_edits) if distance
+        ]
+        return min(candidates)[2] if candidates else None
+
+    def all_ids(self) -> int:
+        """Bitmap with every event in the corpus set."""
+        return (1 << len(self.logs)) - 1
+
+    def has_field(self, field: str) -> bool:
+        """Whether any event in the corpus carries this field."""
+        return field in self.postings
+
+    def __len__(self) -> int:
+        return len(self.logs)
+
+    # ==========================================
+    # Result ordering and pagination
+    # ==========================================
+
+    def sort_key(self, doc_id: int) -> Tuple[float, int]:
+        """Stable sort key of an event: (timestamp epoch, event ID)."""
+        times = self.time_values.get(SORT_FIELD)
+        epoch = times[doc_id] if times is not None else math.nan
+        return (float("inf") if math.isnan(epoch) else epoch, doc_id)
+
+    def top_k(self, plan, k: int, after: Optional[Tuple[float, int]] = None,
+              deadline: Optional[Deadline] = None) -> Tuple[List[int], int]:
+        """
+        Run a compiled plan and return the first k matching event IDs
+        after the cursor key, and the exact total.
+
+        A single-term query is answered straight from its posting list;
+        otherwise the total is the bitmap's popcount and collection stops
+        as soon as k IDs have been read. No rows are touched either way.
+        The deadline, if any, is passed on to the plan.
+        """
+        if isinstance(plan.root, LEAF_TYPES):
+            postings = self.clause_postings(plan.root)
+            if postings is not None:
+                page = self.page_postings(postings, k, after)
+                if page is not None:
+                    return page, len(postings)
+        matches = plan.execute(self, deadline=deadline)
+        return self.page(matches, k, after), matches.bit_count()
+
+    def page(self, matches: int, k: int, after: Optional[Tuple[float, int]] = None) -> List[int]:
+        """Up to k matching event IDs in sort-key order, strictly after the given key."""
+        if self.time_ordered:
+            return list(islice(iter_bitmap(matches, self._resume_position(after)), k))
+        return list(islice(self._iter_sorted(matches, after), k))
+
+    def page_postings(self, postings: List[int], k: int,
+                      after: Optional[Tuple[float, int]] = None) -> Optional[List[int]]:
+        """Page a sorted posting list directly, or None if event-ID order isn't sort order."""
+        if not self.time_ordered:
+            return None
+        start = bisect_left(postings, self._resume_position(after))
+        return list(postings[start:start + k])
+
+    def _resume_position(self, after: Optional[Tuple[float, int]]) -> int:
+        """
+        First event ID sorting after the key, for time-ordered indexes.
+
+        Event-ID order is sort order there, so this is a bisect on the
+        timestamp column. The key need not belong to this index (a
+        cursor from another shard works too).
+        """
+        column = self.numeric.get(SORT_FIELD)
+        if after is None or column is None:
+            return 0
+        values, doc_ids = column.sorted_arrays()
+        lo = bisect_left(values, after[0])
+        hi = bisect_right(values, after[0], lo)
+        return bisect_right(doc_ids, after[1], lo, hi)
+
+    def _iter_sorted(self, matches: int, after: Optional[Tuple[float, int]]) -> Iterator[int]:
+        """Walk the sorted timestamp column from the cursor, yielding matches."""
+        buf = matches.to_bytes((len(self.logs) + 7) // 8, "little")
+        column = self.numeric.get(SORT_FIELD)
+        values, doc_ids = column.sorted_arrays() if column else (array("d"), array("I"))
+        if after is None:
+            pos, untimed_pos = 0, 0
+        elif after[0] == float("inf"):
+            pos, untimed_pos = len(doc_ids), bisect_right(self.untimed, after[1])
+        else:
+            lo = bisect_left(values, after[0])
+            hi = bisect_right(values, after[0], lo)
+            pos, untimed_pos = bisect_right(doc_ids, after[1], lo, hi), 0
+        for i in range(pos, len(doc_ids)):
+            doc_id = doc_ids[i]
+            if buf[doc_id >> 3] >> (doc_id & 7) & 1:
+                yield doc_id
+        for i in range(untimed_pos, len(self.untimed)):
+            doc_id = self.untimed[i]
+            if buf[doc_id >> 3] >> (doc_id & 7) & 1:
+                yield doc_id
+
+    # ==========================================
+    # Aggregations
+    # ==========================================
+
+    def _matching_ids(self, matches: int) -> Iterable[int]:
+        """Event IDs of a bitmap, as a plain range when every event matches."""
+        if matches.bit_count() == len(self.logs):
+            return range(len(self.logs))
+        return iter_bitmap(matches)
+
+    def value_counts(self, field: str, matches: int) -> Counter:
+        """How many matching events carry each value of field."""
+        column = self.columns.get(field)
+        counts: Counter = Counter()
+        if column is None:
+            return counts
+        if isinstance(column, DictColumn):
+            codes = column.codes
+            for code, count in Counter(codes[doc_id] for doc_id in self._matching_ids(matches)).items():
+                if code:
+                    counts[str(column.values[code])] += count
+            return counts
+        for doc_id in self._matching_ids(matches):
+            value = column.value(doc_id, _MISSING)
+            if value is not _MISSING:
+                counts[str(value)] += 1
+        return counts
+
+    def date_histogram(self, field: str, matches: int, interval: float) -> Counter:
+        """Matches per time bucket of interval seconds, keyed by bucket start epoch."""
+        times = self.time_values.get(field)
+        if times is None:
+            return Counter()
+        return Counter(
+            math.floor(times[doc_id] / interval) * interval
+            for doc_id in self._matching_ids(matches) if not math.isnan(times[doc_id])
+        )
+
+    def partial_aggregations(self, matches: int, requests: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Mergeable aggregation state for this index: value counts for
+        terms, value sets for cardinality and bucket counts for
+        date_histogram. Shards return these to be combined.
+        """
+        partials: Dict[str, Any] = {}
+        for name, agg in requests.items():
+            if agg.type == "terms":
+                partials[name] = self.value_counts(agg.field, matches)
+            elif agg.type == "cardinality":
+                partials[name] = set(self.value_counts(agg.field, matches))
+            else:
+                partials[name] = self.date_histogram(agg.field, matches, parse_interval(agg.interval))
+        return partials
+
+    # ==========================================
+    # Query plan backend
+    # ==========================================
+
+    def estimate_clause(self, clause) -> int:
+        """Upper bound on how many events a leaf clause can match."""
+        if isinstance(clause, TermQuery):
+            if clause.field is None:
+                tokens = self.analyzer.tokens(clause.value)
+                return min((len(self.text_postings.get(token, ())) for token in tokens), default=0)
+            return len(self.lookup(clause.field, clause.value))
+        if isinstance(clause, (RangeQuery, CidrQuery)):
+            return sum(len(ids) for ids in self._range_slices(clause))
+        if isinstance(clause, WildcardQuery) and clause.field is not None:
+            terms = self.postings.get(clause.field, {})
+            return sum(len(terms[term]) for term in self._wildcard_candidates(clause.field, clause.pattern))
+        if isinstance(clause, FuzzyQuery):
+            return sum(len(self.postings[field][term]) for field, term in self._fuzzy_field_terms(clause))
+        return len(self.logs)
+
+    def clause_cost(self, clause) -> int:
+        """
+        Work units to execute a leaf clause: posting entries read plus
+        dictionary terms checked. Unlike estimate_clause it never runs
+        the fuzzy matcher, so pricing a query stays cheap.
+        """
+        if isinstance(clause, TermQuery):
+            if clause.field is None:
+                # Every token's postings are read (and positions for phrases)
+                return sum(len(self.text_postings.get(token, ())) for token in self.analyzer.tokens(clause.value))
+            return len(self.lookup(clause.field, clause.value))
+        fields = [clause.field] if clause.field is not None else list(self.postings)
+        if isinstance(clause, WildcardQuery):
+            return sum(self._wildcard_cost(field, clause.pattern) for field in fields)
+        if isinstance(clause, FuzzyQuery):
+            # An edit-distance row per character for every dictionary term,
+            # and the matches' postings (at most the whole corpus per field)
+            return sum(
+                len(self.postings[field]) * (len(clause.value) + 1) + len(self.logs)
+                for field in fields if field in self.postings
+            )
+        return self.estimate_clause(clause)
+
+    def _wildcard_cost(self, field: str, pattern: str) -> int:
+        """
+        Upper bound on a wildcard's work in one field, from the size of
+        the prefix range or the rarest required trigram's term list
+        (no candidate sets are built).
+        """
+        terms = self.postings.get(field)
+        if not terms:
+            return 0
+        if pattern.endswith("*") and "*" not in pattern[:-1]:
+            lo, hi = prefix_range(self.sorted_terms(field), self.normalize(pattern[:-1]))
+            breadth = hi - lo
+        else:
+            grams = self.trigrams.get(field)
+            required = _pattern_trigrams(pattern)
+            breadth = len(terms) if grams is None or not required else \
+                min(len(grams.get(gram, ())) for gram in required)
+        # Terms checked, plus their postings at the field's average length
+        return breadth + min(len(self.logs), breadth * len(self.logs) // len(terms))
+
+    def clause_postings(self, clause) -> Optional[List[int]]:
+        """
+        The sorted posting list for a leaf answered by a single term,
+        or None when the clause needs full execution.
+        """
+        if isinstance(clause, TermQuery):
+            if clause.field is None:
+                return self.text_lookup(clause.value)
+            return self.lookup(clause.field, clause.value)
+        return None
+
+    def execute_clause(self, clause, candidates: Optional[int] = None,
+                       deadline: Optional[Deadline] = None) -> int:
+        """
+        Execute a leaf clause into a bitmap of event IDs.
+
+        Every clause is answered from postings or columns, so
+        candidates are ignored; the caller intersects anyway. The
+        deadline, if any, is checked while terms are matched and
+        posting lists merged, so one clause can't run past it.
+        """
+        if isinstance(clause, TermQuery):
+            if clause.field is not None:
+                return self.lookup_bitmap(clause.field, clause.value)
+            # Bare word or phrase: full-text index
+            return bitmap_from_ids(self.text_lookup(clause.value), len(self.logs))
+
+        if isinstance(clause, WildcardQuery):
+            fields = [clause.field] if clause.field is not None else list(self.postings)
+            return bitmap_from_ids(
+                chain.from_iterable(_paced(
+                    (self.postings[field][term]
+                     for field in fields if field in self.postings
+                     for term in self.wildcard_terms(field, clause.pattern, deadline)),
+                    deadline
+                )),
+                len(self.logs)
+            )
+
+        if isinstance(clause, FuzzyQuery):
+            return bitmap_from_ids(
+                chain.from_iterable(_paced(
+                    (self.postings[field][term] for field, term in self._fuzzy_field_terms(clause, deadline)),
+                    deadline
+                )),
+                len(self.logs)
+            )
+
+        if isinstance(clause, (RangeQuery, CidrQuery)):
+            return bitmap_from_ids(
+                chain.from_iterable(_paced(_chunks(self._range_slices(clause, deadline)), deadline, every=1)),
+                len(self.logs)
+            )
+
+        raise ValueError(f"unsupported clause: {clause}")
+
+    def _fuzzy_field_terms(self, clause, deadline: Optional[Deadline] = None) -> List[Tuple[str, str]]:
+        """(field, term) pairs a fuzzy clause matches, from the term dictionaries."""
+        fields = [clause.field] if clause.field is not None else list(self.postings)
+        return [
+            (field, term)
+            for field in fields if field in self.postings
+            for term, _ in self.fuzzy_terms(field, clause.value, clause.max_edits, deadline)
+        ]
+
+    def wildcard_terms(self, field: str, pattern: str, deadline: Optional[Deadline] = None) -> Sequence[str]:
+        """
+        Terms of field matching a wildcard. A plain prefix (``adm*``) is
+        one range of the sorted dictionary; anything else is verified
+        after trigram narrowing.
+        """
+        if pattern.endswith("*") and "*" not in pattern[:-1]:
+            return self.prefix_terms(field, pattern[:-1])
+        matcher = compile_wildcard(pattern)
+        return [term for term in _paced(self._wildcard_candidates(field, pattern), deadline) if matcher(term)]
+
+    def _wildcard_candidates(self, field: str, pattern: str) -> Iterable[str]:
+        """Terms that may match: those sharing every trigram of the pattern."""
+        terms = self.postings.get(field, {})
+        grams = self.trigrams.get(field)
+        required = _pattern_trigrams(pattern)
+        if grams is None or not required:
+            return list(terms)
+        candidates = None
+        for gram in sorted(required, key=lambda g: len(grams.get(g, ()))):
+            matches = grams.get(gram)
+            if not matches:
+                return []
+            candidates = set(matches) if candidates is None else candidates & matches
+            if not candidates:
+                return []
+        return candidates
+
+    def _range_slices(self, clause, deadline: Optional[Deadline] = None) -> List[Sequence[int]]:
+        """Event-ID slices of the sorted column matched by a range or CIDR clause."""
+        if isinstance(clause, CidrQuery):
+            network = ipaddress.ip_network(clause.network)
+            return self._ip_slices(clause.field, network.network_address, network.broadcast_address,
+                                   deadline=deadline)
+        if _is_ip(clause.low) or _is_ip(clause.high):
+            low = None if clause.low is None else ipaddress.ip_address(clause.low)
+            high = None if clause.high is None else ipaddress.ip_address(clause.high)
+            return self._ip_slices(clause.field, low, high, clause.include_low, clause.include_high, deadline)
+        column = self.numeric.get(clause.field)
+        if column is None:
+            return []
+        parse = _as_time if clause.field in TIME_FIELDS else _as_number
+        return column.select(parse(clause.low), parse(clause.high), clause.include_low, clause.include_high)
+
+    def _ip_slices(self, field: Optional[str], low, high,
+                   include_low: bool = True, include_high: bool = True,
+                   deadline: Optional[Deadline] = None) -> List[Sequence[int]]:
+        """
+        Event IDs whose IP in field (any field when None) lies between
+        two addresses. IPv4 is one binary search on the integer column;
+        IPv6 addresses are checked against the field's term dictionary.
+        """
+        if (low or high).version == 6:
+            return self._ipv6_slices(field, low, high, include_low, include_high, deadline)
+        low = None if low is None else int(low)
+        high = None if high is None else int(high)
+        fields = [field] if field is not None else list(self.ip_columns)
+        return [
+            ids
+            for name in fields if name in self.ip_columns
+            for ids in self.ip_columns[name].select(low, high, include_low, include_high)
+        ]
+
+    def _ipv6_slices(self, field: Optional[str], low, high,
+                     include_low: bool, include_high: bool,
+                     deadline: Optional[Deadline] = None) -> List[Sequence[int]]:
+        slices = []
+        for name in ([field] if field is not None else list(self.postings)):
+            for term, doc_ids in _paced(self.postings.get(name, {}).items(), deadline):
+                if ":" not in term:
+                    continue
+                try:
+                    address = ipaddress.IPv6Address(term)
+                except ValueError:
+                    continue
+                if low is not None and (address < low or (address == low and not include_low)):
+                    continue
+                if high is not None and (address > high or (address == high and not include_high)):
+                    continue
+                slices.append(doc_ids)
+        return slices
+
+
+def _is_ip(bound: Optional[str]) -> bool:
+    """Whether a range bound is an IP address (dotted IPv4 or IPv6)."""
+    if bound is None or not (bound.count(".") == 3 or ":" in bound):
+        return False
+    try:
+        ipaddress.ip_address(bound)
+    except ValueError:
+        return False
+    return True
+
+
+def _as_number(bound: Optional[str]) -> Optional[float]:
+    """Parse a range bound; None stays open."""
+    if bound is None:
+        return None
+    try:
+        return float(bound)
+    except ValueError:
+        raise ValueError(f"range bound {bound!r} is not a number")
+
+
+def _as_time(bound: Optional[str]) -> Optional[float]:
+    """Parse a timestamp range bound (ISO date/time or epoch seconds)."""
+    if bound is None:
+        return None
+    epoch = parse_timestamp(bound)
+    return epoch if epoch is not None else _as_number(bound)
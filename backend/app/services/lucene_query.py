@@ -0,0 +1,517 @@
+"""
+Cyber Coding Game - Lucene Query Parser
+
+Turns Lucene-style query strings into a small AST and a
+compiled execution plan.
+
+Supported syntax:
+- field:value, field:"quoted value", bare words and "phrases"
+- nested.field:value for fields of nested objects (flattened at indexing)
+- field:*partial* (wildcard), field:prefix* (prefix)
+- field:value~N (fuzzy: within N edits, default 2, at most 2)
+- field:[min TO max] / field:{min TO max} (inclusive / exclusive range;
+  IP addresses work as bounds)
+- field:10.0.0.0/8 (CIDR block)
+- AND, OR, NOT (also &&, ||, !) with precedence NOT > AND > OR
+- ( ... ) grouping; field:( ... ) applies the field to every clause
+  inside that has none, e.g. user:(john OR mike)
+- +clause / -clause (required / excluded)
+
+Anything else is a QuerySyntaxError rather than a guess: a field with
+no value, a malformed range, or text stuck to the end of a term (such
+as the slop in "john"~1, which isn't supported).
+
+Clauses next to each other with no operator are OR'd, like Lucene.
+A -clause or NOT clause written that way excludes from the clause
+before it instead (``a -b`` means ``a AND NOT b``).
+
+The plan only talks to a backend through these methods, so any
+index implementation can run it:
+
+- ``all_ids()`` -> bitmap of every event
+- ``estimate_clause(clause)`` -> upper bound on matches for a leaf
+- ``execute_clause(clause, candidates, deadline)`` -> bitmap of matches
+  for a leaf
+- ``clause_cost(clause)`` -> work units to execute a leaf (optional,
+  used by QueryPlan.cost; defaults to the estimate)
+
+Running plans can be given a Deadline; it is checked before every
+clause and, through Deadline.paced, inside a clause's loops over
+terms and postings, so even one expensive clause stops in time.
+"""
+
+import ipaddress
+import re
+import time
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+
+
+class QuerySyntaxError(ValueError):
+    """Raised when a query string cannot be parsed."""
+
+
+class QueryBudgetError(ValueError):
+    """Raised when a query costs more than allowed or runs past its deadline."""
+
+
+# Lucene caps fuzzy queries at two edits
+MAX_EDITS = 2
+_FUZZY_RE = re.compile(r'(.+)~(\d*)')
+_CIDR_RE = re.compile(r'[0-9A-Fa-f:.]+/\d{1,3}')
+
+
+# ==========================================
+# AST
+# ==========================================
+
+def _quote(value: str) -> str:
+    """Render a value so it re-parses to the same term."""
+    if value and re.fullmatch(r'[^\s()"\[\]{}:*]+', value) and not _FUZZY_RE.fullmatch(value) \
+            and not _CIDR_RE.fullmatch(value):
+        return value
+    return '"' + value.replace('"', '\\"') + '"'
+
+
+@dataclass(frozen=True)
+class TermQuery:
+    """
+    Exact match on field. With field None, a full-text match: value is
+    analyzed, and the events whose analyzed text (any field) contains
+    its token, or its tokens as a phrase, match.
+    """
+    field: Optional[str]
+    value: str
+
+    def __str__(self) -> str:
+        text = _quote(self.value)
+        return f"{self.field}:{text}" if self.field else text
+
+
+@dataclass(frozen=True)
+class WildcardQuery:
+    """Pattern match where * stands for any run of characters."""
+    field: Optional[str]
+    pattern: str
+
+    def __str__(self) -> str:
+        return f"{self.field}:{self.pattern}" if self.field else self.pattern
+
+
+@dataclass(frozen=True)
+class FuzzyQuery:
+    """Match terms within max_edits insertions, deletions or substitutions of value."""
+    field: Optional[str]
+    value: str
+    max_edits: int = 2
+
+    def __str__(self) -> str:
+        text = f"{_quote(self.value)}~{self.max_edits}"
+        return f"{self.field}:{text}" if self.field else text
+
+
+@dataclass(frozen=True)
+class CidrQuery:
+    """IP addresses inside a network block, e.g. 10.0.0.0/8."""
+    field: Optional[str]
+    network: str
+
+    def __str__(self) -> str:
+        return f"{self.field}:{self.network}" if self.field else self.network
+
+
+@dataclass(frozen=True)
+class RangeQuery:
+    """Range match; a bound of None is open."""
+    field: str
+    low: Optional[str]
+    high: Optional[str]
+    include_low: bool = True
+    include_high: bool = True
+
+    def __str__(self) -> str:
+        low = "*" if self.low is None else _quote(self.low)
+        high = "*" if self.high is None else _quote(self.high)
+        left = "[" if self.include_low else "{"
+        right = "]" if self.include_high else "}"
+        return f"{self.field}:{left}{low} TO {high}{right}"
+
+
+@dataclass(frozen=True)
+class AndQuery:
+    clauses: Tuple["Query", ...]
+
+    def __str__(self) -> str:
+        return "(" + " AND ".join(str(c) for c in self.clauses) + ")"
+
+
+@dataclass(frozen=True)
+class OrQuery:
+    clauses: Tuple["Query", ...]
+
+    def __str__(self) -> str:
+        return "(" + " OR ".join(str(c) for c in self.clauses) + ")"
+
+
+@dataclass(frozen=True)
+class NotQuery:
+    clause: "Query"
+
+    def __str__(self) -> str:
+        return f"NOT {self.clause}"
+
+
+Query = Union[TermQuery, WildcardQuery, FuzzyQuery, CidrQuery, RangeQuery, AndQuery, OrQuery, NotQuery]
+LEAF_TYPES = (TermQuery, WildcardQuery, FuzzyQuery, CidrQuery, RangeQuery)
+
+
+# ==========================================
+# Tokenizer
+# ==========================================
+
+_QUOTED = r'"(?:[^"\\]|\\.)*"'
+# Dotted names (http.method) are flattened nested fields; 10.0.0.1 is not a field
+_FIELD = r'\w+(?:\.[A-Za-z_]\w*)*'
+_BOUND = rf'(?:{_QUOTED}|[^\s\]}}]+)'
+_TOKEN_RE = re.compile(
+    rf'''
+    (?P<ws>\s+)
+  | (?P<lparen>\()
+  | (?P<rparen>\))
+  | (?P<and>(?:(?i:AND)|&&)(?=[\s()]|$))
+  | (?P<or>(?:(?i:OR)|\|\|)(?=[\s()]|$))
+  | (?P<not>(?i:NOT)(?=[\s()]|$)|!)
+  | (?P<plus>\+)
+  | (?P<minus>-)
+  | (?P<range>(?P<rfield>{_FIELD}):(?P<ropen>[\[{{])
+        \s*(?P<low>{_BOUND})\s+(?i:TO)\s+(?P<high>{_BOUND})\s*
+        (?P<rclose>[\]}}]))
+  | (?P<badrange>(?:{_FIELD}:)?[\[{{])
+  | (?P<fgroup>{_FIELD}):(?=\()
+  | (?P<term>(?:(?P<field>{_FIELD}):)?(?P<value>{_QUOTED}|[^\s()"]+))
+    ''',
+    re.VERBOSE,
+)
+
+_TOKEN_KINDS = ("ws", "lparen", "rparen", "and", "or", "not", "plus", "minus", "range", "badrange", "fgroup", "term")
+
+
+@dataclass(frozen=True)
+class _Token:
+    kind: str
+    text: str
+    node: Optional[Query] = None
+
+
+def _unquote(text: str) -> Tuple[str, bool]:
+    """Strip surrounding quotes; returns (value, was_double_quoted)."""
+    if len(text) >= 2 and text[0] == text[-1] == '"':
+        return re.sub(r'\\(.)', r'\1', text[1:-1]), True
+    return text.strip("'"), False
+
+
+def _bound(text: str) -> Optional[str]:
+    value, quoted = _unquote(text)
+    return None if value == "*" and not quoted else value
+
+
+def _leaf(field: Optional[str], raw: str) -> Query:
+    value, quoted = _unquote(raw)
+    if quoted:
+        return TermQuery(field, value)
+    if _CIDR_RE.fullmatch(value):
+        try:
+            return CidrQuery(field, str(ipaddress.ip_network(value, strict=False)))
+        except ValueError as e:
+            raise QuerySyntaxError(f"invalid CIDR block {value!r}: {e}")
+    fuzzy = _FUZZY_RE.fullmatch(value)
+    if fuzzy:
+        edits = int(fuzzy.group(2) or MAX_EDITS)
+        if edits > MAX_EDITS:
+            raise QuerySyntaxError(f"fuzzy distance {edits} is too large (at most {MAX_EDITS})")
+        return FuzzyQuery(field, fuzzy.group(1), edits)
+    if "*" in value:
+        return WildcardQuery(field, value)
+    return TermQuery(field, value)
+
+
+def tokenize(query: str) -> List[_Token]:
+    """Split a query string into tokens."""
+    tokens = []
+    pos = 0
+    while pos < len(query):
+        match = _TOKEN_RE.match(query, pos)
+        if not match or match.end() == pos:
+            raise QuerySyntaxError(f"unexpected character {query[pos]!r} at position {pos}")
+        kind = next(name for name in _TOKEN_KINDS if match.group(name) is not None)
+        start, pos = pos, match.end()
+        if kind == "ws":
+            continue
+        if kind == "badrange":
+            raise QuerySyntaxError(f"malformed range at position {start}, use field:[low TO high]")
+        if kind in ("range", "term") and pos < len(query) and not query[pos].isspace() and query[pos] not in "()":
+            # e.g. "john"~1: the rest would silently become another term
+            raise QuerySyntaxError(f"unexpected {query[pos]!r} after {match.group(0)!r} at position {pos}")
+        if kind == "term" and match.group("field") is None and re.fullmatch(_FIELD + ":", match.group("value")):
+            raise QuerySyntaxError(f"field {match.group('value')[:-1]!r} has no value at position {start}")
+        node = None
+        if kind == "range":
+            node = RangeQuery(
+                field=match.group("rfield"),
+                low=_bound(match.group("low")),
+                high=_bound(match.group("high")),
+                include_low=match.group("ropen") == "[",
+                include_high=match.group("rclose") == "]",
+            )
+        elif kind == "term":
+            node = _leaf(match.group("field"), match.group("value"))
+        tokens.append(_Token("clause" if node is not None else kind, match.group(0), node))
+    return tokens
+
+
+def _with_field(node: Query, field: str) -> Query:
+    """Apply field to every clause in node that has none, as in user:(john OR mike)."""
+    if isinstance(node, (AndQuery, OrQuery)):
+        return type(node)(tuple(_with_field(clause, field) for clause in node.clauses))
+    if isinstance(node, NotQuery):
+        return NotQuery(_with_field(node.clause, field))
+    if getattr(node, "field", field) is None:
+        return replace(node, field=field)
+    return node
+
+
+# ==========================================
+# Parser
+# ==========================================
+
+class _Parser:
+    """Recursive-descent parser: or_expr > and_expr > unary > primary."""
+
+    def __init__(self, tokens: List[_Token]):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self) -> Optional[str]:
+        return self.tokens[self.pos].kind if self.pos < len(self.tokens) else None
+
+    def take(self, kind: str) -> _Token:
+        if self.peek() != kind:
+            found = self.tokens[self.pos].text if self.pos < len(self.tokens) else "end of query"
+            raise QuerySyntaxError(f"expected {kind} but found {found!r}")
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def parse(self) -> Query:
+        if not self.tokens:
+            raise QuerySyntaxError("empty query")
+        node = self.or_expr()
+        if self.peek() is not None:
+            raise QuerySyntaxError(f"unexpected {self.tokens[self.pos].text!r}")
+        return node
+
+    def or_expr(self) -> Query:
+        clauses = [self.and_expr()]
+        while self.peek() in ("or", "clause", "lparen", "fgroup"):
+            if self.peek() == "or":
+                self.pos += 1
+            clauses.append(self.and_expr())
+        return clauses[0] if len(clauses) == 1 else OrQuery(tuple(clauses))
+
+    def and_expr(self) -> Query:
+        clauses = [self.unary()]
+        while self.peek() in ("and", "not", "minus", "plus"):
+            if self.peek() == "and":
+                self.pos += 1
+            clauses.append(self.unary())
+        return clauses[0] if len(clauses) == 1 else AndQuery(tuple(clauses))
+
+    def unary(self) -> Query:
+        if self.peek() in ("not", "minus"):
+            self.pos += 1
+            return NotQuery(self.unary())
+        if self.peek() == "plus":
+            self.pos += 1
+        return self.primary()
+
+    def primary(self) -> Query:
+        if self.peek() == "fgroup":
+            field = self.take("fgroup").text[:-1]
+            return _with_field(self.primary(), field)
+        if self.peek() == "lparen":
+            self.pos += 1
+            node = self.or_expr()
+            self.take("rparen")
+            return node
+        return self.take("clause").node
+
+
+def _simplify(node: Query) -> Query:
+    """Flatten nested AND/OR and cancel double negation."""
+    if isinstance(node, NotQuery):
+        inner = _simplify(node.clause)
+        return inner.clause if isinstance(inner, NotQuery) else NotQuery(inner)
+    if isinstance(node, (AndQuery, OrQuery)):
+        flat = []
+        for clause in node.clauses:
+            clause = _simplify(clause)
+            if type(clause) is type(node):
+                flat.extend(clause.clauses)
+            else:
+                flat.append(clause)
+        return type(node)(tuple(flat))
+    return node
+
+
+def normalize_query(query: str) -> str:
+    """Canonical whitespace form of a raw query string."""
+    return " ".join(query.split())
+
+
+def parse_query(query: str) -> Query:
+    """Parse a query string into a simplified AST."""
+    return _simplify(_Parser(tokenize(normalize_query(query))).parse())
+
+
+# ==========================================
+# Execution plan
+# ==========================================
+
+class Deadline:
+    """A wall-clock limit on running a query."""
+
+    def __init__(self, seconds: float, clock=time.perf_counter):
+        self.seconds = seconds
+        self._clock = clock
+        self.expires = clock() + seconds
+
+    def remaining(self) -> float:
+        """Seconds left, never below zero."""
+        return max(0.0, self.expires - self._clock())
+
+    def check(self):
+        """Raise QueryBudgetError once the deadline has passed."""
+        if self._clock() > self.expires:
+            raise QueryBudgetError(f"query ran longer than {self.seconds:g}s")
+
+    def paced(self, items: Iterable, every: int = 256) -> Iterator:
+        """Yield items, checking the deadline before every `every`-th one."""
+        for i, item in enumerate(items):
+            if not i % every:
+                self.check()
+            yield item
+
+
+class QueryPlan:
+    """
+    A parsed query ready to run against any backend.
+
+    Plans are immutable, so one compiled plan is safely shared by
+    every request (and thread) that sends the same query.
+    """
+
+    def __init__(self, root: Query):
+        self.root = root
+        self.key = str(root)
+
+    def execute(self, backend, candidates: Optional[int] = None,
+                profile: Optional[List[dict]] = None, deadline: Optional[Deadline] = None) -> int:
+        """
+        Run the plan and return a bitmap of matching event IDs.
+
+        Pass a list as profile to have a timing record for the root
+        clause appended to it. Records are dicts with type, description,
+        time_ms, matches and children (in the order they ran); leaves
+        also carry the backend's estimate and the candidate count.
+
+        With a deadline, QueryBudgetError is raised once it passes,
+        between clauses or inside one (see execute_clause).
+        """
+        return self._run(self.root, backend, candidates, profile, deadline)
+
+    def cost(self, backend) -> int:
+        """
+        Estimated work to run the plan, without running it: the leaves'
+        clause costs plus one pass over a corpus-sized bitmap for every
+        clause (each AND, OR and NOT combines bitmaps of that size).
+        """
+        words = (backend.all_ids().bit_length() + 63) // 64
+        clause_cost = getattr(backend, "clause_cost", backend.estimate_clause)
+
+        def visit(node: Query) -> int:
+            if isinstance(node, LEAF_TYPES):
+                return clause_cost(node) + words
+            if isinstance(node, NotQuery):
+                return visit(node.clause) + words
+            return sum(visit(clause) for clause in node.clauses) + words
+
+        return visit(self.root)
+
+    def _estimate(self, node: Query, backend) -> int:
+        if isinstance(node, LEAF_TYPES):
+            return backend.estimate_clause(node)
+        if isinstance(node, AndQuery):
+            return min(self._estimate(c, backend) for c in node.clauses)
+        if isinstance(node, OrQuery):
+            return sum(self._estimate(c, backend) for c in node.clauses)
+        return backend.all_ids().bit_length()
+
+    def _run(self, node: Query, backend, candidates: Optional[int],
+             profile: Optional[List[dict]] = None, deadline: Optional[Deadline] = None) -> int:
+        if deadline is not None:
+            deadline.check()
+        if profile is None:
+            return self._run_node(node, backend, candidates, None, deadline)
+        record = {"type": type(node).__name__, "description": str(node), "children": []}
+        started = time.perf_counter()
+        result = self._run_node(node, backend, candidates, record["children"], deadline)
+        record["time_ms"] = (time.perf_counter() - started) * 1000
+        record["matches"] = result.bit_count()
+        if isinstance(node, LEAF_TYPES):
+            record["estimate"] = backend.estimate_clause(node)
+            record["candidates"] = None if candidates is None else candidates.bit_count()
+        profile.append(record)
+        return result
+
+    def _run_node(self, node: Query, backend, candidates: Optional[int],
+                  profile: Optional[List[dict]], deadline: Optional[Deadline]) -> int:
+        if isinstance(node, LEAF_TYPES):
+            return backend.execute_clause(node, candidates, deadline)
+
+        if isinstance(node, OrQuery):
+            result = 0
+            for clause in node.clauses:
+                result |= self._run(clause, backend, candidates, profile, deadline)
+            return result
+
+        base = backend.all_ids() if candidates is None else candidates
+
+        if isinstance(node, NotQuery):
+            return base & ~self._run(node.clause, backend, base, profile, deadline)
+
+        # AND: most selective positive clauses first so later clauses
+        # only visit survivors, then subtract the negated ones.
+        positives = [c for c in node.clauses if not isinstance(c, NotQuery)]
+        negatives = [c.clause for c in node.clauses if isinstance(c, NotQuery)]
+        positives.sort(key=lambda c: self._estimate(c, backend))
+        result = base
+        for clause in positives:
+            result &= self._run(clause, backend, result, profile, deadline)
+            if not result:
+                return 0
+        for clause in negatives:
+            result &= ~self._run(clause, backend, result, profile, deadline)
+            if not result:
+                return 0
+        return result
+
+
+@lru_cache(maxsize=512)
+def _compile_normalized(query: str) -> QueryPlan:
+    return QueryPlan(_simplify(_Parser(tokenize(query)).parse()))
+
+
+def compile_query(query: str) -> QueryPlan:
+    """Return the (cached) execution plan for a query string."""
+    return _compile_normalized(normalize_query(query))
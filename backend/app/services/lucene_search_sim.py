@@ -7,9 +7,76 @@ This module does NOT connect to any external services.
 All data is local and pre-defined for educational purposes.
 """
 
-import re
-from typing import List, Dict, Any, Optional
-from ..models import SearchResult, LogEntry
+import base64
+import heapq
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import List, Dict, Any, NamedTuple, Optional, Tuple
+from ..models import (
+    SearchResult, LogEntry, AggregationRequest, AggregationResult, AggregationBucket, QueryProfile,
+    CacheStats, RuleAlert
+)
+from .lucene_index import LogIndex
+from .log_ingest import IngestStats, ingest_file
+from .index_snapshot import corpus_source, load_snapshot, save_snapshot
+from .sharded_search import ShardedSearch
+from .percolator import Percolator
+from .mission_specs import MissionSpecs, MissionTarget
+from .text_analysis import Analyzer
+from .result_cache import ResultCache, DEFAULT_MAX_ENTRIES, DEFAULT_TTL_SECONDS
+from .lucene_query import compile_query, Deadline, QueryBudgetError, QueryPlan, TermQuery, AndQuery, OrQuery
+
+logger = logging.getLogger(__name__)
+
+# Query budget: planner work units (roughly posting entries and bitmap
+# words touched; a few million take well under a second) and seconds
+DEFAULT_MAX_QUERY_COST = 5_000_000
+DEFAULT_QUERY_TIMEOUT = 2.0
+
+# Live events are kept apart from the graded corpus; once there are
+# this many, the oldest half is dropped
+MAX_LIVE_EVENTS = 10_000
+
+
+@dataclass(frozen=True)
+class MissionGrade:
+    """How a submission's results compare to a mission's target set."""
+    precision: float
+    recall: float
+    missing: int
+    extra: int
+    correct: bool
+
+
+# (LogEntry field, event field, default when the event has none)
+_ENTRY_FIELDS = (
+    ("timestamp", "timestamp", ""),
+    ("level", "level", "INFO"),
+    ("user", "user", None),
+    ("action", "action", ""),
+    ("status", "status", ""),
+    ("ip", "ip", None),
+    ("details", "path", None),
+)
+
+
+def _as_text(value: Any) -> str:
+    """A corpus value as LogEntry text."""
+    return value if isinstance(value, str) else str(value)
+
+
+class _CachedSearch(NamedTuple):
+    results: List[LogEntry]
+    total: int
+    next_cursor: Optional[str]
+    aggregations: Optional[Dict[str, AggregationResult]]
+    suggestion: Optional[str]
+    grade: Optional[MissionGrade]
 
 
 class LuceneSearchSimulator:
@@ -18,14 +85,98 @@ class LuceneSearchSimulator:
     
     Supports:
     - field:value (exact match)
-    - field:*partial* (wildcard)
-    - field:[min TO max] (range)
-    - AND, OR operators
+    - words and "phrases" (full text over every field)
+    - field:*partial* (wildcard), field:prefix* (prefix)
+    - field:value~N (fuzzy)
+    - field:[min TO max] (range, also over IP addresses)
+    - ip:10.0.0.0/8 (CIDR block)
+    - AND, OR, NOT operators and ( ) grouping
     """
     
-    def __init__(self):
-        """Initialize with fake log data."""
-        self.logs = self._create_fake_logs()
+    def __init__(self, corpus_path: Optional[str] = None, snapshot_path: Optional[str] = None,
+                 shards: int = 0, shard_mode: str = "time",
+                 cache_size: int = DEFAULT_MAX_ENTRIES, cache_ttl: float = DEFAULT_TTL_SECONDS,
+                 stemming: bool = False, max_query_cost: int = DEFAULT_MAX_QUERY_COST,
+                 query_timeout: float = DEFAULT_QUERY_TIMEOUT, specs: Optional[MissionSpecs] = None):
+        """
+        Initialize and index the log corpus.
+        
+        Uses the built-in fake logs unless corpus_path points to an
+        NDJSON or line-delimited capture, which is streamed in.
+        
+        If snapshot_path exists it is memory-mapped instead of building
+        anything, unless it was built from another capture than
+        corpus_path or the capture has changed since; otherwise the
+        freshly built corpus index is saved there so the next worker to
+        start can map it.
+        
+        With shards > 1, searches are split across that many worker
+        processes, each holding a time-range ("time") or event ID
+        modulo ("hash") slice of the corpus.
+        
+        Search results are kept in an LRU cache of cache_size entries
+        for cache_ttl seconds (cache_size=0 disables it).
+        
+        stemming makes bare words match other forms of the same word
+        (logins -> login). A snapshot keeps the setting it was built with.
+        
+        Queries whose estimated cost (QueryPlan.cost) is over
+        max_query_cost are refused before they run, and running ones
+        are stopped after query_timeout seconds; 0 turns either off.
+        
+        Missions with a search target in their spec (specs, loaded from
+        lessons/ by default) are graded by the events found.
+        """
+        self.ingest_stats: Optional[IngestStats] = None
+        self.index = self._open_index(corpus_path, snapshot_path, stemming)
+        self.logs = self.index.logs
+        self.sharded = ShardedSearch(self.index, shards, shard_mode) if shards > 1 else None
+        self.cache = ResultCache(cache_size, cache_ttl)
+        self.max_query_cost = max_query_cost
+        self.query_timeout = query_timeout
+        self.percolator = Percolator(self.index.analyzer)
+        # Appended live events, in their own index that grading never reads
+        self.live = LogIndex(analyzer=self.index.analyzer)
+        self._live_events: List[Dict[str, Any]] = []
+        # Live events dropped so far, so event IDs keep counting up
+        self._live_dropped = 0
+        self._append_lock = threading.Lock()
+        self.specs = specs or MissionSpecs()
+        # target query -> (corpus generation, target bitmap), built up front
+        self._target_bitmaps: Dict[str, Tuple[int, int]] = {}
+        for target in self.mission_targets.values():
+            try:
+                self._target_bitmap(target)
+            except QueryBudgetError:
+                # Reported to whoever searches that mission
+                pass
+    
+    def _open_index(self, corpus_path: Optional[str], snapshot_path: Optional[str], stemming: bool) -> LogIndex:
+        """Map a snapshot that matches the corpus, or build the index (and save the snapshot)."""
+        source = corpus_source(corpus_path) if corpus_path else None
+        if snapshot_path and os.path.exists(snapshot_path):
+            try:
+                index = load_snapshot(snapshot_path)
+            except ValueError as e:
+                logger.warning("Rebuilding %s: %s", snapshot_path, e)
+            else:
+                if source is None or index.snapshot_source == source:
+                    return index
+                logger.warning("Rebuilding %s: it was not built from the current %s", snapshot_path, corpus_path)
+        analyzer = Analyzer(stem=stemming)
+        if corpus_path:
+            index = LogIndex(analyzer=analyzer)
+            self.ingest_stats = ingest_file(corpus_path, index)
+        else:
+            index = LogIndex(self._create_fake_logs(), analyzer)
+        if snapshot_path:
+            save_snapshot(index, snapshot_path, source)
+        return index
+    
+    @property
+    def mission_targets(self) -> Dict[str, MissionTarget]:
+        """Search targets of the current mission specs."""
+        return self.specs.current.search_targets
     
     def _create_fake_logs(self) -> List[Dict[str, Any]]:
         """Create realistic-looking fake log data."""
@@ -58,15 +209,36 @@ class LuceneSearchSimulator:
             {"timestamp": "2024-01-16 09:30:00", "level": "INFO", "user": "sarah", "action": "login", "status": "success", "ip": "192.168.1.51", "hour": 9},
         ]
     
-    def search(self, query: str, mission_id: Optional[str] = None, max_results: int = 100) -> SearchResult:
+    def search(self, query: str, mission_id: Optional[str] = None, max_results: int = 100,
+               search_after: Optional[str] = None,
+               aggregations: Optional[Dict[str, AggregationRequest]] = None,
+               profile: bool = False) -> SearchResult:
         """
         Execute a Lucene-style search query.
         
         Supports:
         - field:value
-        - field:*wildcard*
-        - field:[min TO max]
-        - AND, OR
+        - word, "a phrase"
+        - field:*wildcard*, field:prefix*
+        - field:value~N
+        - field:[min TO max], ip:10.0.0.0/8
+        - AND, OR, NOT, -clause, ( )
+        
+        Results are ordered by (timestamp, event ID). Pass a previous
+        result's next_cursor as search_after to fetch the next page.
+        Aggregations are computed over every match, not just the page.
+        
+        With profile set, the result carries a QueryProfile: parse,
+        execute, collect, aggregation and materialization times plus a
+        per-clause tree. Profiled searches always run on the local index
+        through the full plan, so clause timings are comparable.
+        
+        Missions with a declared target are graded by comparing the
+        full match bitmap with the target's (see _grade), so any query
+        that finds the right events passes, however it is written.
+        
+        Results and grades are cached (see _cache_key); profiled
+        searches always run.
         """
         query = query.strip()
         
@@ -78,8 +250,55 @@ class LuceneSearchSimulator:
                 feedback="Enter a search query. Example: status:failed"
             )
         
+        started = time.perf_counter()
+        timings = None
         try:
-            matching_logs = self._execute_query(query)
+            after = self._decode_cursor(search_after) if search_after else None
+            plan = compile_query(query)
+            parse_ms = (time.perf_counter() - started) * 1000
+            catalog = self.specs.current
+            target = catalog.search_targets.get(mission_id)
+            graded = target is not None
+            cache_key = None if profile else self._cache_key(
+                plan, mission_id, max_results, search_after, aggregations, catalog.version
+            )
+            cached = self.cache.get(cache_key) if cache_key is not None else None
+            matches = None
+            # Cache hits are free, so only misses are priced and timed
+            cost = self._check_budget(plan) if cached is None else 0
+            deadline = Deadline(self.query_timeout) if self.query_timeout > 0 else None
+            # Fetch one extra event to learn whether another page exists
+            if cached is not None:
+                pass
+            elif profile:
+                matches, page_ids, agg_results, timings = self._profile_search(
+                    plan, max_results + 1, after, aggregations, deadline
+                )
+                total = matches.bit_count()
+            elif self.sharded:
+                page_ids, total, partials = self.sharded.search(query, max_results + 1, after, aggregations, deadline)
+                agg_results = self._finish_aggregations(partials, aggregations) if aggregations else None
+                if graded:
+                    # The parent holds the whole index; grade against it
+                    matches = plan.execute(self.index, deadline=deadline)
+            elif aggregations or graded:
+                # Both need every match, so run the plan once and page the bitmap
+                matches = plan.execute(self.index, deadline=deadline)
+                page_ids, total = self.index.page(matches, max_results + 1, after), matches.bit_count()
+                agg_results = self.aggregate(matches, aggregations) if aggregations else None
+            else:
+                page_ids, total = self._execute_top_k(plan, max_results + 1, after, deadline)
+                agg_results = None
+            # Inside the budget too, since the target may need rebuilding
+            grade = self._grade(target, matches, deadline) if graded and cached is None else None
+        except QueryBudgetError as e:
+            return SearchResult(
+                query=query,
+                total_matches=0,
+                results=[],
+                feedback=f"Query too expensive: {str(e)}. Narrow it down with field:value terms "
+                         f"instead of broad wildcards or long OR lists."
+            )
         except Exception as e:
             return SearchResult(
                 query=query,
@@ -88,128 +307,325 @@ class LuceneSearchSimulator:
                 feedback=f"Query error: {str(e)}. Check your syntax!"
             )
         
-        # Limit results
-        matching_logs = matching_logs[:max_results]
-        
-        # Convert to LogEntry objects
-        results = [
-            LogEntry(
-                timestamp=log.get("timestamp", ""),
-                level=log.get("level", "INFO"),
-                user=log.get("user"),
-                action=log.get("action", ""),
-                status=log.get("status", ""),
-                ip=log.get("ip"),
-                details=log.get("path")
-            )
-            for log in matching_logs
-        ]
+        query_profile = None
+        if cached is not None:
+            results, total, next_cursor, agg_results, suggestion, grade = cached
+        else:
+            next_cursor = None
+            if len(page_ids) > max_results:
+                page_ids = page_ids[:max_results]
+                next_cursor = self._encode_cursor(self.index.sort_key(page_ids[-1]))
+            
+            # Convert only the returned page to LogEntry objects
+            materialize_start = time.perf_counter()
+            results = self._materialize(page_ids)
+            if timings is not None:
+                finished = time.perf_counter()
+                query_profile = QueryProfile(
+                    parse_ms=parse_ms,
+                    cost=cost,
+                    materialize_ms=(finished - materialize_start) * 1000,
+                    total_ms=(finished - started) * 1000,
+                    **timings
+                )
+            suggestion = self._suggest(plan) if total == 0 else None
+            if cache_key is not None:
+                self.cache.put(cache_key, _CachedSearch(results, total, next_cursor, agg_results, suggestion, grade))
         
-        # Determine if query is correct for mission
-        is_correct = self._check_mission_query(query, mission_id, len(results))
+        # Missions without a target accept any query that finds something
+        is_correct = grade.correct if grade is not None else total > 0
         
-        feedback = self._generate_feedback(query, len(results), mission_id, is_correct)
+        feedback = self._generate_feedback(query, total, target, is_correct, suggestion, grade)
         
         return SearchResult(
             query=query,
-            total_matches=len(results),
+            total_matches=total,
+            returned_count=len(results),
             results=results,
+            next_cursor=next_cursor,
+            aggregations=agg_results,
+            profile=query_profile,
+            suggestion=suggestion,
             is_correct=is_correct,
             feedback=feedback
         )
     
-    def _execute_query(self, query: str) -> List[Dict]:
-        """Parse and execute a Lucene-style query."""
-        # Handle AND/OR operators
-        if " AND " in query.upper():
-            parts = re.split(r'\s+AND\s+', query, flags=re.IGNORECASE)
-            result = self.logs.copy()
-            for part in parts:
-                part_matches = self._execute_single_query(part.strip())
-                result = [log for log in result if log in part_matches]
-            return result
-        
-        if " OR " in query.upper():
-            parts = re.split(r'\s+OR\s+', query, flags=re.IGNORECASE)
-            result = []
-            for part in parts:
-                part_matches = self._execute_single_query(part.strip())
-                for match in part_matches:
-                    if match not in result:
-                        result.append(match)
-            return result
-        
-        return self._execute_single_query(query)
-    
-    def _execute_single_query(self, query: str) -> List[Dict]:
-        """Execute a single query term."""
-        # Range query: field:[min TO max]
-        range_match = re.match(r'(\w+):\[(\d+)\s+TO\s+(\d+)\]', query)
-        if range_match:
-            field = range_match.group(1)
-            min_val = int(range_match.group(2))
-            max_val = int(range_match.group(3))
-            return [
-                log for log in self.logs
-                if field in log and isinstance(log[field], int) 
-                and min_val <= log[field] <= max_val
-            ]
-        
-        # Field:value query
-        field_match = re.match(r'(\w+):(.+)', query)
-        if field_match:
-            field = field_match.group(1)
-            value = field_match.group(2).strip('"\'')
-            
-            # Wildcard matching
-            if '*' in value:
-                pattern = value.replace('*', '.*')
-                return [
-                    log for log in self.logs
-                    if field in log and re.search(pattern, str(log[field]), re.IGNORECASE)
-                ]
-            
-            # Exact matching
-            return [
-                log for log in self.logs
-                if field in log and str(log[field]).lower() == value.lower()
-            ]
+    def _materialize(self, doc_ids: List[int], index: Optional[LogIndex] = None) -> List[LogEntry]:
+        """
+        Build LogEntry objects for a page straight from the index
+        columns (the corpus unless another index is given), one field
+        at a time, without rebuilding event dicts. Missing fields get
+        their defaults and non-string values are rendered as text.
+        """
+        logs = (self.index if index is None else index).logs
+        names = [name for name, _, _ in _ENTRY_FIELDS]
+        columns = [
+            [default if value is None else _as_text(value) for value in logs.take(field, doc_ids)]
+            for _, field, default in _ENTRY_FIELDS
+        ]
+        return [LogEntry.model_validate(dict(zip(names, row))) for row in zip(*columns)]
+    
+    # ==========================================
+    # Live events and standing rules
+    # ==========================================
+    
+    def add_rule(self, rule_id: str, query: str):
+        """
+        Save a detection rule. Raises QuerySyntaxError if it doesn't
+        parse, QueryBudgetError if it costs more than max_query_cost
+        (it would run on every append) and RuleLimitError if there are
+        too many rules.
+        """
+        self._check_budget(compile_query(query))
+        self.percolator.add_rule(rule_id, query)
+    
+    def remove_rule(self, rule_id: str) -> bool:
+        """Delete a detection rule; False if it didn't exist."""
+        return self.percolator.remove_rule(rule_id)
+    
+    def append_events(self, events: List[Dict[str, Any]]) -> List[RuleAlert]:
+        """
+        Append live events and return an alert for every (event, saved
+        rule) match among them.
+        
+        Live events go to their own index (see search_live), never the
+        corpus missions are graded on. It holds at most MAX_LIVE_EVENTS;
+        past that the oldest events are dropped, at least half at once
+        so the index isn't rebuilt on every append. Event IDs count every
+        live event ever appended.
         
-        # Fallback: search all fields
+        Rules are matched first, within query_timeout; if that runs out,
+        QueryBudgetError is raised and nothing is appended.
+        """
+        deadline = Deadline(self.query_timeout) if self.query_timeout > 0 else None
+        matches = self.percolator.percolate(events, deadline)
+        with self._append_lock:
+            if len(self._live_events) + len(events) > MAX_LIVE_EVENTS:
+                keep_count = min(MAX_LIVE_EVENTS // 2, max(0, MAX_LIVE_EVENTS - len(events)))
+                keep = self._live_events[len(self._live_events) - keep_count:]
+                self._live_dropped += len(self._live_events) - len(keep)
+                self._live_events = keep
+                self.live = LogIndex(keep, self.index.analyzer)
+            first_id = len(self.live)
+            self._live_events.extend(events)
+            self.live.add_batch(events)
+            self.live.finalize()
+            live, base = self.live, self._live_dropped + first_id
+        entries = self._materialize([first_id + pos for pos, _ in matches], live)
         return [
-            log for log in self.logs
-            if any(query.lower() in str(v).lower() for v in log.values())
+            RuleAlert(rule_id=rule_id, event_id=base + pos, entry=entry)
+            for (pos, rule_id), entry in zip(matches, entries)
         ]
     
-    def _check_mission_query(self, query: str, mission_id: Optional[str], result_count: int) -> bool:
-        """Check if query satisfies mission objectives."""
-        if not mission_id:
-            return result_count > 0
+    def search_live(self, query: str, max_results: int = 100) -> SearchResult:
+        """
+        Search the appended live events. Returns the first page of
+        matches, oldest first; nothing is graded or cached.
+        """
+        query = query.strip()
+        if not query:
+            return SearchResult(query=query, total_matches=0, results=[], feedback="Enter a search query.")
+        with self._append_lock:
+            live = self.live
+            try:
+                plan = compile_query(query)
+                self._check_budget(plan, live)
+                deadline = Deadline(self.query_timeout) if self.query_timeout > 0 else None
+                matches = plan.execute(live, deadline=deadline)
+            except ValueError as e:
+                return SearchResult(query=query, total_matches=0, results=[], feedback=f"Query error: {str(e)}.")
+            results = self._materialize(live.page(matches, max_results), live)
+        total = matches.bit_count()
+        return SearchResult(
+            query=query,
+            total_matches=total,
+            returned_count=len(results),
+            results=results,
+            is_correct=total > 0,
+            feedback=f"Found {total} live events."
+        )
+    
+    def _suggest(self, plan: QueryPlan) -> Optional[str]:
+        """
+        "Did you mean" for a query with no results: every field:value
+        term that matches nothing is swapped for the closest term in
+        that field's dictionary. None if nothing could be corrected.
+        """
+        changed = False
         
-        if mission_id == "mission03":
-            # Looking for failed logins
-            return "status:failed" in query.lower() or ("failed" in query.lower() and result_count > 0)
+        def correct(node):
+            nonlocal changed
+            if isinstance(node, TermQuery) and node.field is not None and not self.index.lookup(node.field, node.value):
+                term = self.index.suggest(node.field, node.value)
+                if term is not None:
+                    changed = True
+                    return TermQuery(node.field, term)
+            if isinstance(node, (AndQuery, OrQuery)):
+                return type(node)(tuple(correct(clause) for clause in node.clauses))
+            return node
         
-        if mission_id == "mission06":
-            # Looking for after-hours admin access
-            checks = [
-                "admin" in query.lower(),
-                any(x in query.lower() for x in ["hour", "23", "02", "03", "night"])
-            ]
-            return all(checks) and result_count > 0
+        root = correct(plan.root)
+        if not changed:
+            return None
+        text = str(root)
+        return text[1:-1] if isinstance(root, (AndQuery, OrQuery)) else text
+    
+    def _cache_key(self, plan: QueryPlan, mission_id: Optional[str], max_results: int,
+                   search_after: Optional[str],
+                   aggregations: Optional[Dict[str, AggregationRequest]], spec_version: int) -> tuple:
+        """
+        Result cache key. Uses the normalized AST, so queries that only
+        differ in spacing or redundant grouping share an entry, and the
+        corpus generation and mission spec version, so ingesting new
+        events or reloading specs invalidates them all.
+        """
+        agg_key = tuple(sorted(
+            (name, tuple(agg.model_dump().items())) for name, agg in aggregations.items()
+        )) if aggregations else None
+        return (plan.key, mission_id, max_results, search_after, agg_key, self.index.generation, spec_version)
+    
+    def cache_stats(self) -> CacheStats:
+        """Hit, miss and eviction counters of the result cache."""
+        return self.cache.stats().model_copy(update={"generation": self.index.generation})
+    
+    def _execute_query(self, query: str) -> int:
+        """Parse (cached) and execute a Lucene-style query into a bitmap of event IDs."""
+        return compile_query(query).execute(self.index)
+    
+    def _execute_top_k(self, plan: QueryPlan, k: int, after: Optional[Tuple[float, int]] = None,
+                       deadline: Optional[Deadline] = None) -> Tuple[List[int], int]:
+        """Return the first k matching event IDs after the cursor key, and the exact total."""
+        return self.index.top_k(plan, k, after, deadline)
+    
+    def _check_budget(self, plan: QueryPlan, index: Optional[LogIndex] = None) -> int:
+        """Price a plan; raises QueryBudgetError if it is over max_query_cost."""
+        cost = plan.cost(self.index if index is None else index)
+        if 0 < self.max_query_cost < cost:
+            raise QueryBudgetError(f"estimated cost {cost:,} is over the limit of {self.max_query_cost:,}")
+        return cost
+    
+    def _profile_search(self, plan: QueryPlan, k: int, after: Optional[Tuple[float, int]],
+                        aggregations: Optional[Dict[str, AggregationRequest]],
+                        deadline: Optional[Deadline] = None):
+        """Run a search step by step, timing each step and every clause."""
+        clauses: List[dict] = []
+        started = time.perf_counter()
+        matches = plan.execute(self.index, profile=clauses, deadline=deadline)
+        executed = time.perf_counter()
+        page_ids = self.index.page(matches, k, after)
+        collected = time.perf_counter()
+        agg_results = self.aggregate(matches, aggregations) if aggregations else None
+        aggregated = time.perf_counter()
+        timings = {
+            "execute_ms": (executed - started) * 1000,
+            "collect_ms": (collected - executed) * 1000,
+            "aggregation_ms": (aggregated - collected) * 1000,
+            "clauses": clauses,
+        }
+        return matches, page_ids, agg_results, timings
+    
+    def aggregate(self, matches: int, aggregations: Dict[str, AggregationRequest]) -> Dict[str, AggregationResult]:
+        """Compute named aggregations over a bitmap of matching events."""
+        return self._finish_aggregations([self.index.partial_aggregations(matches, aggregations)], aggregations)
+    
+    @staticmethod
+    def _finish_aggregations(partials: List[Dict[str, Any]],
+                             aggregations: Dict[str, AggregationRequest]) -> Dict[str, AggregationResult]:
+        """Merge per-index partial aggregations (one per shard) into results."""
+        results = {}
+        for name, agg in aggregations.items():
+            if agg.type == "cardinality":
+                results[name] = AggregationResult(value=len(set().union(*(p[name] for p in partials))))
+                continue
+            counts: Counter = Counter()
+            for partial in partials:
+                counts.update(partial[name])
+            if agg.type == "terms":
+                top = heapq.nsmallest(agg.size, counts.items(), key=lambda item: (-item[1], item[0]))
+                buckets = [AggregationBucket(key=key, count=count) for key, count in top]
+            else:
+                buckets = [
+                    AggregationBucket(
+                        key=datetime.fromtimestamp(start, timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+                        count=count
+                    )
+                    for start, count in sorted(counts.items())
+                ]
+            results[name] = AggregationResult(buckets=buckets)
+        return results
+    
+    @staticmethod
+    def _encode_cursor(key: Tuple[float, int]) -> str:
+        """Opaque cursor for a (timestamp epoch, event ID) sort key."""
+        return base64.urlsafe_b64encode(f"{key[0]!r}:{key[1]}".encode()).decode()
+    
+    @staticmethod
+    def _decode_cursor(cursor: str) -> Tuple[float, int]:
+        """Inverse of _encode_cursor; raises ValueError for anything else."""
+        try:
+            epoch, doc_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+            return float(epoch), int(doc_id)
+        except (ValueError, UnicodeDecodeError):
+            raise ValueError("invalid search_after cursor")
+    
+    def _target_bitmap(self, target: MissionTarget, deadline: Optional[Deadline] = None) -> int:
+        """
+        A mission's target events as a bitmap. Built once per corpus
+        generation, so events added to the graded corpus (index.add or
+        ingest) that fit the target join it; live events never do.
         
-        return result_count > 0
+        Building one is held to the same budget as a search; raises
+        QueryBudgetError naming the target when it is over.
+        """
+        generation = self.index.generation
+        cached = self._target_bitmaps.get(target.query)
+        if cached is None or cached[0] != generation:
+            plan = compile_query(target.query)
+            try:
+                self._check_budget(plan)
+                cached = (generation, plan.execute(self.index, deadline=deadline))
+            except QueryBudgetError as e:
+                raise QueryBudgetError(f"mission target {target.query!r}: {e}") from e
+            self._target_bitmaps[target.query] = cached
+        return cached[1]
     
-    def _generate_feedback(self, query: str, result_count: int, mission_id: Optional[str], is_correct: bool) -> str:
+    def _grade(self, target_spec: MissionTarget, matches: int, deadline: Optional[Deadline] = None) -> MissionGrade:
+        """Score a submission's match bitmap against the mission's target set."""
+        target = self._target_bitmap(target_spec, deadline)
+        found = (matches & target).bit_count()
+        returned = matches.bit_count()
+        wanted = target.bit_count()
+        precision = found / returned if returned else float(wanted == 0)
+        recall = found / wanted if wanted else 1.0
+        return MissionGrade(
+            precision=precision,
+            recall=recall,
+            missing=wanted - found,
+            extra=returned - found,
+            correct=precision >= target_spec.min_precision and recall >= target_spec.min_recall,
+        )
+    
+    def _generate_feedback(self, query: str, result_count: int, target: Optional[MissionTarget], is_correct: bool,
+                           suggestion: Optional[str] = None, grade: Optional[MissionGrade] = None) -> str:
         """Generate helpful feedback based on results."""
         if result_count == 0:
-            return "No results found. Try adjusting your query. Available fields: user, status, action, ip, level, hour"
+            if suggestion:
+                return f"No results found. Did you mean: {suggestion}"
+            return ("No results found. Try adjusting your query. "
+                    "Available fields: user, status, action, ip, level, hour, timestamp")
         
         if is_correct:
-            if mission_id == "mission03":
-                return f"🎯 Found {result_count} failed events! Notice the IP 10.0.50.99 appears multiple times — that's a pattern worth investigating!"
-            elif mission_id == "mission06":
-                return f"🌙 Found {result_count} after-hours admin accesses! This is suspicious behavior that a real analyst would escalate."
+            if target is not None and target.success_feedback:
+                return target.success_feedback.format(count=result_count)
             return f"✅ Found {result_count} matching entries."
         
+        if grade is not None:
+            hints = []
+            if grade.missing:
+                hints.append(f"{grade.missing} events you're hunting for are missing, so widen the search")
+            if grade.extra:
+                hints.append(f"{grade.extra} results don't belong, so narrow it down")
+            if hints:
+                return f"Found {result_count} results, but " + "; ".join(hints) + "."
+        
         return f"Found {result_count} results. Review them to see if they match what you're looking for."
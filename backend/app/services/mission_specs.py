@@ -0,0 +1,248 @@
+"""
+Cyber Coding Game - Mission Specs
+
+Missions and the way they are graded live in JSON files under
+lessons/, one per mission, next to the lesson text of its tier:
+
+    {
+      "id": "mission04", "tier": 2, "title": "...",  <- Mission fields
+      "grading": {
+        "python": {"checks": [["loops_over", "logs"]], ...}
+      }
+    }
+
+A "python" grading holds syntax-tree checks (see python_grader)
+or regex patterns, plus the output and feedback shown on success.
+A "search" grading holds the reference query whose results the
+player's search must find (see MissionTarget).
+
+Every file is validated and its grading compiled once, into an
+immutable MissionCatalog. Regexes are compiled for the catalog's
+regex engine; on re, a pattern that could backtrack catastrophically
+is a spec error. Reloading builds a whole new catalog and
+then swaps the reference. A request that already picked up the old
+catalog finishes with it, and a broken file leaves the old catalog
+in place. MissionSpecs.watch() polls the files and reloads when
+they change, so edits go live without a restart.
+"""
+
+import json
+import logging
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from pydantic import ValidationError
+
+from ..models import Mission
+from .lucene_query import compile_query
+from .python_grader import REGEX_ENGINES, Check, PatternSet, compile_check
+
+logger = logging.getLogger(__name__)
+
+# lessons/ at the repository root
+LESSONS_DIR = Path(__file__).resolve().parents[3] / "lessons"
+
+DEFAULT_WATCH_INTERVAL = 2.0
+
+
+class MissionSpecError(ValueError):
+    """A mission spec file is malformed; the message names the file."""
+
+
+@dataclass(frozen=True)
+class MissionTarget:
+    """
+    The events a mission's answer must find, given as a reference
+    query over the corpus. A submission passes when its results
+    reach both thresholds against that set (exact match by default).
+    """
+    query: str
+    min_precision: float = 1.0
+    min_recall: float = 1.0
+    # Shown on success; {count} is replaced by the number of results
+    success_feedback: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class PythonGrading:
+    """How a Python mission is graded, by checks or by patterns (checks compiled)."""
+    output: str = "Success!"
+    success_feedback: str = "Great job!"
+    requires_all: bool = False
+    checks: Tuple[Check, ...] = ()
+    partial_checks: Tuple[Tuple[Check, str], ...] = ()
+    patterns: Tuple[str, ...] = ()
+    partial_patterns: Tuple[Tuple[str, str], ...] = ()
+    # Solution then partial patterns, compiled together
+    matcher: Optional[PatternSet] = field(default=None, compare=False)
+
+
+@dataclass(frozen=True)
+class MissionCatalog:
+    """Every mission and its compiled grading, as loaded at one point in time."""
+    version: int
+    missions: Dict[str, Mission]
+    python: Dict[str, PythonGrading]
+    search_targets: Dict[str, MissionTarget]
+
+
+def _python_grading(spec: Dict[str, Any], regex_engine: str = "re") -> PythonGrading:
+    checks = tuple(compile_check(check, regex_engine) for check in spec.get("checks", []))
+    partial_checks = tuple(
+        (compile_check(entry["check"], regex_engine), entry["hint"]) for entry in spec.get("partial_checks", [])
+    )
+    patterns = tuple(spec.get("patterns", []))
+    partial_patterns = tuple((entry["pattern"], entry["hint"]) for entry in spec.get("partial_patterns", []))
+    if bool(checks) == bool(patterns):
+        raise ValueError("python grading needs either checks or patterns")
+    matcher = None
+    if patterns:
+        matcher = PatternSet(patterns + tuple(pattern for pattern, _ in partial_patterns), engine=regex_engine)
+    return PythonGrading(
+        output=spec.get("output", "Success!"),
+        success_feedback=spec.get("success_feedback", "Great job!"),
+        requires_all=bool(spec.get("requires_all", False)),
+        checks=checks,
+        partial_checks=partial_checks,
+        patterns=patterns,
+        partial_patterns=partial_patterns,
+        matcher=matcher,
+    )
+
+
+def _search_target(spec: Dict[str, Any]) -> MissionTarget:
+    target = MissionTarget(
+        query=spec["target"],
+        min_precision=float(spec.get("min_precision", 1.0)),
+        min_recall=float(spec.get("min_recall", 1.0)),
+        success_feedback=spec.get("success_feedback"),
+    )
+    compile_query(target.query)
+    if target.success_feedback is not None:
+        target.success_feedback.format(count=0)
+    return target
+
+
+def load_catalog(directory: Path, version: int = 1, regex_engine: str = "re") -> MissionCatalog:
+    """Load, validate and compile every *.json spec below directory."""
+    if regex_engine not in REGEX_ENGINES:
+        raise ValueError(f"unknown regex engine {regex_engine!r}, use one of {', '.join(REGEX_ENGINES)}")
+    missions: Dict[str, Mission] = {}
+    python: Dict[str, PythonGrading] = {}
+    search_targets: Dict[str, MissionTarget] = {}
+    for path in sorted(Path(directory).rglob("*.json")):
+        try:
+            spec = json.loads(path.read_text(encoding="utf-8"))
+            grading = spec.pop("grading", {})
+            unknown = set(spec) - set(Mission.model_fields)
+            if unknown:
+                raise ValueError(f"unknown fields {', '.join(sorted(unknown))}")
+            mission = Mission.model_validate(spec)
+            if mission.id in missions:
+                raise ValueError(f"mission {mission.id} is defined twice")
+            unknown = set(grading) - {"python", "search"}
+            if unknown:
+                raise ValueError(f"unknown grading {', '.join(sorted(unknown))}")
+            if "python" in grading:
+                python[mission.id] = _python_grading(grading["python"], regex_engine)
+            if "search" in grading:
+                search_targets[mission.id] = _search_target(grading["search"])
+        except (OSError, ValueError, AttributeError, KeyError, TypeError, IndexError) as e:
+            # JSONDecodeError, ValidationError and QuerySyntaxError are ValueErrors
+            detail = e.errors(include_url=False) if isinstance(e, ValidationError) else e
+            raise MissionSpecError(f"{path}: {detail}") from e
+        missions[mission.id] = mission
+    if not missions:
+        raise MissionSpecError(f"no mission specs found in {directory}")
+    return MissionCatalog(
+        version=version,
+        missions=dict(sorted(missions.items())),
+        python=python,
+        search_targets=search_targets,
+    )
+
+
+class MissionSpecs:
+    """
+    The current MissionCatalog, reloaded when its files change.
+
+    Readers take self.current once per request and use that catalog
+    throughout; the reference is only ever replaced, never mutated.
+    Grading regexes run on regex_engine ("re" or "linear").
+    """
+
+    def __init__(self, directory: Path = LESSONS_DIR, regex_engine: str = "re"):
+        self.directory = Path(directory)
+        self.regex_engine = regex_engine
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        self._signature = self._scan()
+        # Bad specs at startup are fatal; later they only skip a reload
+        self.current = load_catalog(self.directory, regex_engine=regex_engine)
+        self.reloads = 0
+        self.last_error: Optional[str] = None
+
+    def _scan(self) -> Tuple[Tuple[str, int, int], ...]:
+        """Path, mtime and size of every spec file: changes when any file does."""
+        entries = []
+        for path in sorted(self.directory.rglob("*.json")):
+            try:
+                stat = path.stat()
+            except OSError:
+                # Deleted between listing and stat; the next scan settles it
+                continue
+            entries.append((str(path), stat.st_mtime_ns, stat.st_size))
+        return tuple(entries)
+
+    def reload(self, force: bool = False) -> bool:
+        """
+        Rebuild the catalog if any spec file changed (or if forced).
+
+        Returns True if a new catalog was swapped in. If the files
+        don't load, the error is logged and kept in last_error, and
+        the current catalog stays.
+        """
+        with self._lock:
+            signature = self._scan()
+            if signature == self._signature and not force:
+                return False
+            # Remembered even on failure, so a broken file is reported once
+            self._signature = signature
+            try:
+                catalog = load_catalog(self.directory, self.current.version + 1, self.regex_engine)
+            except MissionSpecError as e:
+                self.last_error = str(e)
+                logger.error("Keeping mission specs v%d: %s", self.current.version, e)
+                return False
+            self.current = catalog
+            self.reloads += 1
+            self.last_error = None
+            logger.info("Loaded mission specs v%d (%d missions)", catalog.version, len(catalog.missions))
+            return True
+
+    def watch(self, interval: float = DEFAULT_WATCH_INTERVAL):
+        """Poll the spec files every interval seconds on a daemon thread."""
+        if self._watcher is not None:
+            return
+        self._stop.clear()
+
+        def poll():
+            while not self._stop.wait(interval):
+                try:
+                    self.reload()
+                except Exception:
+                    # The watcher must outlive surprises; the next poll retries
+                    logger.exception("Mission spec reload failed")
+
+        self._watcher = threading.Thread(target=poll, name="mission-spec-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop(self):
+        """Stop the watcher thread, if one is running."""
+        if self._watcher is not None:
+            self._stop.set()
+            self._watcher.join()
+            self._watcher = None
@@ -0,0 +1,187 @@
+"""
+Cyber Coding Game - Percolator
+
+Standing queries (saved detection rules) matched against events as
+they are appended, instead of events matched against queries.
+
+Rules are indexed by the terms an event must contain for the rule
+to possibly match:
+
+- field:value needs that exact term
+- a bare word or phrase needs one of its tokens in the full text
+- wildcards, fuzzy terms, ranges and CIDR blocks need the field
+  to be present at all
+- OR needs any of its clauses' keys, AND the keys of its most
+  selective positive clause
+
+Rules with no such key (pure negations, bare wildcards) are checked
+against every event. Each new event looks up only the keys it
+carries, so the cost of matching stays flat as rules are added.
+
+Candidates are confirmed by running the rule's compiled plan over
+a throwaway LogIndex of just the appended batch, so rules behave
+exactly like the same query typed into search.
+"""
+
+import threading
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple
+
+from .lucene_index import LogIndex, TIME_FIELDS, flatten_event, iter_bitmap
+from .text_analysis import Analyzer
+from .lucene_query import (
+    Deadline, QueryPlan, Query, TermQuery, WildcardQuery, FuzzyQuery, CidrQuery, RangeQuery, AndQuery, OrQuery,
+    compile_query
+)
+
+# A key is ("term", field, normalized value), ("field", field)
+# or ("text", token)
+Key = Tuple[str, ...]
+
+# Saved rules are checked on every append, so their number is capped
+MAX_RULES = 1000
+
+
+class RuleLimitError(RuntimeError):
+    """Raised when saving a new rule would go over max_rules."""
+
+
+def _field_keys(field: str) -> Set[Key]:
+    keys = {("field", field)}
+    if field == "hour":
+        # hour is derived from the timestamp for events that lack it
+        keys.update(("field", time_field) for time_field in TIME_FIELDS)
+    return keys
+
+
+def rule_keys(node: Query, analyzer: Analyzer) -> Optional[FrozenSet[Key]]:
+    """
+    Keys of which any matching event must carry at least one,
+    or None when the query can match events carrying none of them.
+    """
+    if isinstance(node, TermQuery):
+        if node.field is None:
+            # A phrase needs all of its tokens; the longest is the rarest bet
+            tokens = analyzer.tokens(node.value)
+            return frozenset({("text", max(tokens, key=len))}) if tokens else frozenset()
+        return frozenset({("term", node.field, LogIndex.normalize(node.value))})
+    if isinstance(node, (WildcardQuery, FuzzyQuery, CidrQuery, RangeQuery)):
+        return None if node.field is None else frozenset(_field_keys(node.field))
+    if isinstance(node, OrQuery):
+        keys: Set[Key] = set()
+        for clause in node.clauses:
+            clause_keys = rule_keys(clause, analyzer)
+            if clause_keys is None:
+                return None
+            keys |= clause_keys
+        return frozenset(keys)
+    if isinstance(node, AndQuery):
+        options = [keys for keys in (rule_keys(clause, analyzer) for clause in node.clauses) if keys is not None]
+        if not options:
+            return None
+        # Exact terms are far more selective than field presence
+        return min(options, key=lambda keys: (any(key[0] == "field" for key in keys), len(keys)))
+    return None
+
+
+def event_keys(event: Dict[str, Any], analyzer: Analyzer) -> List[Key]:
+    """Every key an event carries, with nested objects as dotted fields like the index has them."""
+    keys: List[Key] = []
+    for field, value in flatten_event(event).items():
+        keys.append(("term", field, LogIndex.normalize(value)))
+        keys.append(("field", field))
+        keys.extend(("text", token) for token in analyzer.tokens(str(value)))
+    return keys
+
+
+class Percolator:
+    """Index of saved rules, matched against batches of new events."""
+
+    def __init__(self, analyzer: Optional[Analyzer] = None, max_rules: int = MAX_RULES):
+        # Must be the searched index's analyzer so rules match like searches
+        self.analyzer = analyzer or Analyzer()
+        self.max_rules = max_rules
+        self.rules: Dict[str, QueryPlan] = {}
+        self._keys: Dict[str, Optional[FrozenSet[Key]]] = {}
+        self._by_key: Dict[Key, Set[str]] = {}
+        self._unkeyed: Set[str] = set()
+        self._lock = threading.Lock()
+        # Rule-event pairs actually verified, to see how well keys prune
+        self.checks = 0
+
+    def add_rule(self, rule_id: str, query: str):
+        """
+        Save (or replace) a rule; raises QuerySyntaxError for bad queries
+        and RuleLimitError when max_rules are already saved.
+        """
+        plan = compile_query(query)
+        keys = rule_keys(plan.root, self.analyzer)
+        with self._lock:
+            if rule_id not in self.rules and len(self.rules) >= self.max_rules:
+                raise RuleLimitError(f"at most {self.max_rules} rules can be saved")
+            self._remove(rule_id)
+            self.rules[rule_id] = plan
+            self._keys[rule_id] = keys
+            if keys is None:
+                self._unkeyed.add(rule_id)
+            else:
+                for key in keys:
+                    self._by_key.setdefault(key, set()).add(rule_id)
+
+    def remove_rule(self, rule_id: str) -> bool:
+        """Delete a rule; returns False if there was none."""
+        with self._lock:
+            return self._remove(rule_id)
+
+    def _remove(self, rule_id: str) -> bool:
+        if rule_id not in self.rules:
+            return False
+        del self.rules[rule_id]
+        keys = self._keys.pop(rule_id)
+        if keys is None:
+            self._unkeyed.discard(rule_id)
+        else:
+            for key in keys:
+                holders = self._by_key[key]
+                holders.discard(rule_id)
+                if not holders:
+                    del self._by_key[key]
+        return True
+
+    def candidates(self, event: Dict[str, Any]) -> Set[str]:
+        """Rules that could match an event, judged by its keys alone."""
+        found = set(self._unkeyed)
+        for key in event_keys(event, self.analyzer):
+            holders = self._by_key.get(key)
+            if holders:
+                found |= holders
+        return found
+
+    def percolate(self, events: List[Dict[str, Any]],
+                  deadline: Optional[Deadline] = None) -> List[Tuple[int, str]]:
+        """
+        Match a batch of events against the saved rules.
+
+        Returns (position in batch, rule_id) pairs in batch order. With
+        a deadline, QueryBudgetError is raised once matching runs past it.
+        """
+        if not events:
+            return []
+        with self._lock:
+            pending: Dict[str, int] = {}
+            for pos, event in enumerate(events):
+                for rule_id in self.candidates(event):
+                    pending[rule_id] = pending.get(rule_id, 0) | (1 << pos)
+            plans = {rule_id: self.rules[rule_id] for rule_id in pending}
+        if not pending:
+            return []
+        batch = LogIndex(events, self.analyzer)
+        matches = []
+        for rule_id, candidates in pending.items():
+            self.checks += candidates.bit_count()
+            hits = plans[rule_id].execute(batch, candidates, deadline=deadline) & candidates
+            matches.extend((pos, rule_id) for pos in iter_bitmap(hits))
+        matches.sort()
+        return matches
+
+    def __len__(self) -> int:
+        return len(self.rules)
@@ -0,0 +1,506 @@
+"""
+Cyber Coding Game - Python Structural Grader
+
+⚠️ Submissions are parsed with ast.parse and never executed. The
+syntax tree is only walked and read.
+
+Grading looks at what the code does rather than how it is spelled:
+a loop over logs inside a comment or a string doesn't count, and
+neither does a "?, ?" that never reaches execute().
+
+One walk over the syntax tree collects every fact the checks need
+(see CodeFacts). The walk is iterative, so deeply nested code can't
+exhaust the recursion limit. Checks are small declarative specs,
+(kind, argument) pairs such as ("loops_over", "logs"), evaluated
+against the collected facts. All of a mission's checks together
+cost one pass over the tree.
+
+Missions can also be graded by regexes over the source text; a
+PatternSet checks a mission's patterns together, ruling most of them
+out with plain substring lookups first.
+
+Regexes in checks and patterns run on re by default, and are refused
+at load time if their shape can backtrack catastrophically (see
+linear_regex.backtracking_risk). The "linear" engine runs them in
+time linear in the code's length instead. Either way, grading one
+submission can be given a deadline; past it, GradingTimeout.
+"""
+
+import ast
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from .linear_regex import LinearRegex, RegexTimeout, backtracking_risk
+
+# A check is (kind,) or (kind, argument); see CHECKS and REGEX_CHECKS for the kinds
+Check = Sequence[Any]
+
+# execute() with its query in the first argument, as in sqlite3 and DB-API
+SQL_CALLS = frozenset({"execute", "executemany"})
+
+REGEX_ENGINES = ("re", "linear")
+
+
+class GradingTimeout(RuntimeError):
+    """Grading one submission ran past its deadline."""
+
+
+def check_deadline(deadline: Optional[float]):
+    """Raise GradingTimeout once deadline (a time.perf_counter() value) has passed."""
+    if deadline is not None and time.perf_counter() > deadline:
+        raise GradingTimeout("grading ran past its time budget")
+
+
+class Regex:
+    """
+    A grading regex, compiled for one engine.
+
+    On "re", patterns with a catastrophic-backtracking shape are
+    refused; on "linear", patterns the linear engine can't run are
+    (backreferences, lookarounds). Both raise ValueError.
+    """
+
+    def __init__(self, pattern: str, flags: int = re.IGNORECASE, engine: str = "re"):
+        if engine not in REGEX_ENGINES:
+            raise ValueError(f"unknown regex engine {engine!r}, use one of {', '.join(REGEX_ENGINES)}")
+        self.pattern = pattern
+        self.engine = engine
+        try:
+            if engine == "linear":
+                self._linear: Optional[LinearRegex] = LinearRegex(pattern, flags)
+            else:
+                risk = backtracking_risk(pattern, flags)
+                if risk:
+                    raise ValueError(f"{pattern!r} could backtrack catastrophically: {risk}")
+                self._linear = None
+                self._compiled = re.compile(pattern, flags)
+        except re.error as e:
+            raise ValueError(f"{pattern!r} is not a valid regex: {e}") from e
+
+    def search(self, text: str, deadline: Optional[float] = None) -> bool:
+        """Whether the pattern matches anywhere in text."""
+        check_deadline(deadline)
+        if self._linear is None:
+            return self._compiled.search(text) is not None
+        try:
+            return self._linear.search(text, deadline)
+        except RegexTimeout as e:
+            raise GradingTimeout(str(e)) from e
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Regex) and (self.pattern, self.engine) == (other.pattern, other.engine)
+
+    def __hash__(self) -> int:
+        return hash((self.pattern, self.engine))
+
+    def __repr__(self) -> str:
+        return f"Regex({self.pattern!r}, engine={self.engine!r})"
+
+
+@dataclass
+class CodeFacts:
+    """What one walk over a submission's syntax tree found."""
+    statements: int = 0
+    # Called function and method names
+    calls: Set[str] = field(default_factory=set)
+    # Class names of every node, e.g. "For", "If", "ListComp"
+    node_types: Set[str] = field(default_factory=set)
+    # Identifiers: variables, attributes, functions, their arguments
+    # and imported modules
+    names: Set[str] = field(default_factory=set)
+    # Every string literal; the literal parts of f-strings count too
+    strings: List[str] = field(default_factory=list)
+    # Text of each print() call, arguments joined by spaces and
+    # anything that isn't a literal shown as {}
+    printed: List[str] = field(default_factory=list)
+    # Variables printed as they are: print(alert), print(f"{alert}")
+    printed_names: Set[str] = field(default_factory=set)
+    # Names iterated over by for loops and comprehensions
+    loops_over: Set[str] = field(default_factory=set)
+    # String literals that appear in comparisons
+    compared: Set[str] = field(default_factory=set)
+    # One flag per execute() call: query is a literal with ? placeholders
+    # and the values are passed separately
+    sql_calls: List[bool] = field(default_factory=list)
+
+
+def _call_name(func: ast.expr) -> Optional[str]:
+    if isinstance(func, ast.Name):
+        return func.id
+    if isinstance(func, ast.Attribute):
+        return func.attr
+    return None
+
+
+def _root_name(node: ast.expr) -> Optional[str]:
+    """logs for logs, logs.items(), logs[1:] and self.logs."""
+    while True:
+        if isinstance(node, ast.Name):
+            return node.id
+        if isinstance(node, ast.Attribute):
+            return node.attr
+        if isinstance(node, ast.Call):
+            node = node.func.value if isinstance(node.func, ast.Attribute) else node.func
+        elif isinstance(node, ast.Subscript):
+            node = node.value
+        else:
+            return None
+
+
+def _text(node: ast.expr) -> str:
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    if isinstance(node, ast.JoinedStr):
+        return "".join(_text(value) if isinstance(value, ast.Constant) else "{}" for value in node.values)
+    return "{}"
+
+
+def _printed_names(args: List[ast.expr]) -> Iterator[str]:
+    for arg in args:
+        if isinstance(arg, ast.Name):
+            yield arg.id
+        elif isinstance(arg, ast.JoinedStr):
+            for value in arg.values:
+                if isinstance(value, ast.FormattedValue) and isinstance(value.value, ast.Name):
+                    yield value.value.id
+
+
+def _is_string(node: ast.expr) -> bool:
+    return isinstance(node, ast.Constant) and isinstance(node.value, str)
+
+
+class _FactCollector(ast.NodeVisitor):
+    """
+    Records the facts of one node at a time. collect_facts feeds it
+    every node from ast.walk, so visiting never recurses.
+    """
+
+    def __init__(self, facts: CodeFacts):
+        self.facts = facts
+        # Literal strings assigned to each name, to follow query = "..."
+        self.string_vars: Dict[str, str] = {}
+        # First argument of each execute() call that passes values
+        self.queries: List[ast.expr] = []
+
+    def visit(self, node: ast.AST):
+        self.facts.node_types.add(type(node).__name__)
+        super().visit(node)
+
+    def generic_visit(self, node: ast.AST):
+        """Children come from ast.walk, not from here."""
+
+    def visit_Name(self, node: ast.Name):
+        self.facts.names.add(node.id)
+
+    def visit_Attribute(self, node: ast.Attribute):
+        self.facts.names.add(node.attr)
+
+    def visit_arg(self, node: ast.arg):
+        self.facts.names.add(node.arg)
+
+    def visit_FunctionDef(self, node):
+        self.facts.names.add(node.name)
+
+    visit_AsyncFunctionDef = visit_ClassDef = visit_FunctionDef
+
+    def visit_alias(self, node: ast.alias):
+        self.facts.names.update(node.name.split("."))
+        if node.asname:
+            self.facts.names.add(node.asname)
+
+    def visit_ImportFrom(self, node: ast.ImportFrom):
+        if node.module:
+            self.facts.names.update(node.module.split("."))
+
+    def visit_Constant(self, node: ast.Constant):
+        if isinstance(node.value, str):
+            self.facts.strings.append(node.value)
+
+    def visit_Compare(self, node: ast.Compare):
+        self.facts.compared.update(operand.value for operand in (node.left, *node.comparators) if _is_string(operand))
+
+    def visit_For(self, node):
+        name = _root_name(node.iter)
+        if name is not None:
+            self.facts.loops_over.add(name)
+
+    visit_AsyncFor = visit_comprehension = visit_For
+
+    def visit_Assign(self, node: ast.Assign):
+        if _is_string(node.value):
+            for target in node.targets:
+                if isinstance(target, ast.Name):
+                    self.string_vars[target.id] = node.value.value
+
+    def visit_Call(self, node: ast.Call):
+        name = _call_name(node.func)
+        if name is None:
+            return
+        self.facts.calls.add(name)
+        if name == "print":
+            self.facts.printed.append(" ".join(_text(arg) for arg in node.args))
+            self.facts.printed_names.update(_printed_names(node.args))
+        elif name in SQL_CALLS:
+            has_params = len(node.args) >= 2 or any(keyword.arg == "parameters" for keyword in node.keywords)
+            if node.args and has_params:
+                self.queries.append(node.args[0])
+            else:
+                self.facts.sql_calls.append(False)
+
+    def resolve_queries(self):
+        """Flag each parameterized execute() call, once every assignment has been seen."""
+        for query in self.queries:
+            if isinstance(query, ast.Name):
+                text = self.string_vars.get(query.id)
+            else:
+                text = query.value if _is_string(query) else None
+            self.facts.sql_calls.append(text is not None and "?" in text)
+
+
+def collect_facts(code: str) -> CodeFacts:
+    """
+    Parse code and collect its facts in one walk.
+
+    Raises SyntaxError for code Python can't parse (including source
+    that is too deeply nested for the parser itself).
+    """
+    try:
+        tree = ast.parse(code)
+    except (ValueError, RecursionError, MemoryError) as e:
+        # Null bytes, or nesting beyond what the parser handles
+        raise SyntaxError(str(e) or type(e).__name__) from e
+
+    collector = _FactCollector(CodeFacts(statements=len(tree.body)))
+    # ast.walk is breadth-first with an explicit queue, not recursive
+    for node in ast.walk(tree):
+        collector.visit(node)
+    collector.resolve_queries()
+    return collector.facts
+
+
+CHECKS: Dict[str, Callable[[CodeFacts, Any], bool]] = {
+    # A function or method is called, e.g. ("calls", "print")
+    "calls": lambda facts, name: name in facts.calls,
+    # Some syntax is used, by ast class name, e.g. ("uses", "For")
+    "uses": lambda facts, node_type: node_type in facts.node_types,
+    # A for loop or comprehension iterates over a name
+    "loops_over": lambda facts, name: name in facts.loops_over,
+    # A string literal is compared against, e.g. status == "failed"
+    "compares_to": lambda facts, value: value in facts.compared,
+    # Every execute() call passes its values separately from a ? query
+    "parameterized_sql": lambda facts, _: bool(facts.sql_calls) and all(facts.sql_calls),
+    # There is at least one statement, not only comments
+    "has_code": lambda facts, _: facts.statements > 0,
+}
+
+# Regex checks (case-insensitive): the texts each one searches
+REGEX_CHECKS: Dict[str, Callable[[CodeFacts], Iterable[str]]] = {
+    # The text of some print() call matches, or the name of a variable
+    # it prints (print(alert) prints an alert)
+    "prints": lambda facts: (*facts.printed, *facts.printed_names),
+    # Some string literal matches
+    "string": lambda facts: facts.strings,
+    # An identifier or string literal matches
+    "mentions": lambda facts: (*facts.names, *facts.strings),
+}
+
+
+def compile_check(check: Check, engine: str = "re") -> Check:
+    """
+    The check with its regex, if any, compiled for engine.
+
+    Raises ValueError for a check of unknown kind or with a bad (or,
+    on re, catastrophically backtracking) regex.
+    """
+    if not check or (check[0] not in CHECKS and check[0] not in REGEX_CHECKS):
+        raise ValueError(f"unknown check {check!r}, use one of {', '.join([*CHECKS, *REGEX_CHECKS])}")
+    if check[0] not in REGEX_CHECKS:
+        return tuple(check)
+    if len(check) < 2:
+        raise ValueError(f"check {check!r} needs a regex")
+    try:
+        return (check[0], Regex(check[1], engine=engine))
+    except ValueError as e:
+        raise ValueError(f"check {check!r}: {e}") from e
+
+
+def passes(facts: CodeFacts, check: Check, deadline: Optional[float] = None) -> bool:
+    """Evaluate one check (from compile_check) against collected facts."""
+    kind, *argument = check
+    if kind in REGEX_CHECKS:
+        regex = argument[0] if isinstance(argument[0], Regex) else Regex(argument[0])
+        return any(regex.search(text, deadline) for text in REGEX_CHECKS[kind](facts))
+    return CHECKS[kind](facts, argument[0] if argument else None)
+
+
+_REPEAT_RE = re.compile(r"\{\d*(?:,\d*)?\}")
+
+
+def _class_end(pattern: str, i: int) -> int:
+    """Index just past the character class starting at pattern[i]."""
+    j = i + 1
+    if pattern[j:j + 1] == "^":
+        j += 1
+    if pattern[j:j + 1] == "]":
+        # A "]" right at the start is part of the class
+        j += 1
+    while j < len(pattern) and pattern[j] != "]":
+        j += 2 if pattern[j] == "\\" else 1
+    return j + 1
+
+
+def _atoms(pattern: str) -> Iterator[Tuple[str, str]]:
+    """
+    Split a regex into top-level (kind, text) atoms: "char" for a
+    literal character, "group", "alt" for |, "quant" for a repeat,
+    and "other" for anything else (classes, escapes like \\s, dots
+    and anchors).
+    """
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\":
+            escaped = pattern[i + 1:i + 2]
+            i += 2
+            yield ("char" if escaped and not escaped.isalnum() else "other"), escaped
+        elif char == "[":
+            end = _class_end(pattern, i)
+            yield "other", pattern[i:end]
+            i = end
+        elif char == "(":
+            depth, j = 0, i
+            while j < len(pattern):
+                if pattern[j] == "\\":
+                    j += 2
+                    continue
+                if pattern[j] == "[":
+                    j = _class_end(pattern, j)
+                    continue
+                depth += {"(": 1, ")": -1}.get(pattern[j], 0)
+                j += 1
+                if depth == 0:
+                    break
+            yield "group", pattern[i:j]
+            i = j
+        elif char == "{" and _REPEAT_RE.match(pattern, i):
+            end = _REPEAT_RE.match(pattern, i).end()
+            yield "quant", pattern[i:end]
+            i = end
+        else:
+            i += 1
+            if char == "|":
+                yield "alt", char
+            elif char in "*+?":
+                yield "quant", char
+            elif char in ".^$":
+                yield "other", char
+            else:
+                yield "char", char
+
+
+def _longest_run(atoms: List[Tuple[str, str]]) -> Optional[str]:
+    """Longest stretch of unrepeated literal characters among the atoms."""
+    runs, run = [], ""
+    for kind, text in atoms:
+        if kind == "char":
+            run += text
+            continue
+        if kind == "quant":
+            # The repeated character may be absent
+            run = run[:-1]
+        runs.append(run)
+        run = ""
+    runs.append(run)
+    return max(runs, key=len) or None
+
+
+def required_literals(pattern: str) -> Optional[Tuple[str, ...]]:
+    """
+    Literals of which every match of pattern contains at least one,
+    or None if no such set can be read off the pattern.
+
+    Each top-level alternative gives its longest literal run, or the
+    literals of a group it consists of, so (count|len) gives both
+    words. Deliberately conservative: anything unclear ends a run.
+    """
+    branches: List[List[Tuple[str, str]]] = [[]]
+    for atom in _atoms(pattern):
+        if atom[0] == "alt":
+            branches.append([])
+        else:
+            branches[-1].append(atom)
+    literals: List[str] = []
+    for atoms in branches:
+        if len(atoms) == 1 and atoms[0][0] == "group":
+            found = _group_literals(atoms[0][1])
+        else:
+            run = _longest_run(atoms)
+            found = (run,) if run else None
+        if not found:
+            return None
+        literals.extend(found)
+    return tuple(literals)
+
+
+def _group_literals(group: str) -> Optional[Tuple[str, ...]]:
+    body = group[1:-1]
+    if body.startswith("?:"):
+        body = body[2:]
+    elif body.startswith("?P<"):
+        body = body[body.index(">") + 1:]
+    elif body.startswith("?"):
+        # Lookarounds, inline flags, conditionals
+        return None
+    return required_literals(body)
+
+
+class PatternSet:
+    """
+    A mission's patterns, checked against submitted code together.
+
+    Every pattern's required literals (see required_literals) are
+    found at startup. For a submission, each literal is looked up once
+    with a plain substring check, which is far cheaper than a regex
+    scan. Patterns whose literals are all absent are ruled out without
+    running; only the others are confirmed with their compiled regex,
+    on the given engine. The answers match re.search exactly.
+    """
+
+    def __init__(self, patterns: Sequence[str], flags: int = re.IGNORECASE, engine: str = "re"):
+        self.compiled = [Regex(pattern, flags, engine) for pattern in patterns]
+        self.ignore_case = bool(flags & re.IGNORECASE)
+        self.literals: List[Optional[Tuple[str, ...]]] = []
+        for pattern in patterns:
+            literals = required_literals(pattern)
+            if literals and self.ignore_case:
+                literals = tuple(literal.lower() for literal in literals) \
+                    if all(literal.isascii() for literal in literals) else None
+            self.literals.append(literals)
+
+    def candidates(self, code: str) -> FrozenSet[int]:
+        """Indexes of the patterns that could match code, judged by literals alone."""
+        if self.ignore_case:
+            if not code.isascii():
+                # Unicode case folding can match letters lower() doesn't map
+                return frozenset(range(len(self.compiled)))
+            code = code.lower()
+        present: Dict[str, bool] = {}
+        found = set()
+        for i, literals in enumerate(self.literals):
+            if literals is None or any(
+                present[literal] if literal in present else present.setdefault(literal, literal in code)
+                for literal in literals
+            ):
+                found.add(i)
+        return frozenset(found)
+
+    def matches(self, code: str, i: int, candidates: FrozenSet[int], deadline: Optional[float] = None) -> bool:
+        """Whether pattern i matches code (candidates from self.candidates(code))."""
+        return i in candidates and self.compiled[i].search(code, deadline)
+
+    def search(self, code: str) -> Set[int]:
+        """Indexes of every pattern that matches code."""
+        candidates = self.candidates(code)
+        return {i for i in candidates if self.matches(code, i, candidates)}
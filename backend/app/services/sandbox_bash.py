@@ -15,9 +15,29 @@ All "commands" are FAKE for educational purposes only.
 """
 
 import re
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 from ..models import ExecutionResult
 
+MAX_COMMAND_LENGTH = 5000
+
+# Refused before simulating anything (extra safety layer)
+BLOCKED_PATTERNS = ("rm -rf", "sudo", "chmod 777", ">/dev/", "mkfs")
+
+
+def blocked_command(command: str) -> Optional[ExecutionResult]:
+    """The refusal for an obviously dangerous command, or None if it may run."""
+    for pattern in BLOCKED_PATTERNS:
+        if pattern in command.lower():
+            return ExecutionResult(
+                success=False,
+                output="",
+                error="This command is not allowed in the simulation.",
+                hints=["Try using safe commands like grep, cat, or ls."],
+                feedback="That command could be dangerous on real systems. "
+                         "In this game, we focus on safe analysis commands!"
+            )
+    return None
+
 
 class BashSandbox:
     """
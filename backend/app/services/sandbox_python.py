@@ -3,7 +3,8 @@ Cyber Coding Game - Python Sandbox (SAFE SIMULATION)
 
 ⚠️ CRITICAL SECURITY NOTICE:
 This module does NOT execute real Python code!
-It uses pattern matching and pre-defined outputs to simulate execution.
+It inspects the code (its syntax tree via ast.parse, or regexes over
+the text) and uses pre-defined outputs to simulate execution.
 
 NEVER add:
 - eval()
@@ -14,9 +15,33 @@ NEVER add:
 All "execution" is FAKE for educational purposes only.
 """
 
-import re
-from typing import Dict, Any
+import hashlib
+import math
+import time
+from typing import NamedTuple, Optional
 from ..models import ExecutionResult
+from .mission_specs import MissionSpecs, PythonGrading
+from .python_grader import GradingTimeout, check_deadline, collect_facts, passes
+from .result_cache import ResultCache
+
+# Verdicts kept for identical resubmissions
+GRADE_CACHE_SIZE = 4096
+
+# Seconds one submission may take to grade (0 for no limit)
+DEFAULT_GRADING_TIMEOUT = 0.5
+
+
+def normalize_code(code: str) -> str:
+    """Drop trailing whitespace, blank edges and Windows line endings."""
+    lines = [line.rstrip() for line in code.replace("\r\n", "\n").split("\n")]
+    return "\n".join(lines).strip("\n")
+
+
+class Verdict(NamedTuple):
+    """How a submission was graded, independent of the player's tier."""
+    correct: bool
+    hint: Optional[str] = None
+    error: Optional[str] = None
 
 
 class PythonSandbox:
@@ -26,152 +51,37 @@ class PythonSandbox:
     This sandbox does NOT run real Python code.
     It analyzes the submitted code structurally and
     returns appropriate responses based on the mission.
-    """
     
-    def __init__(self):
-        """Initialize the sandbox with mission solutions."""
-        self.solutions = self._create_solution_patterns()
+    Missions are graded as their spec (see mission_specs) says: by
+    checks on the parsed syntax tree, or by regexes over the text.
+    Verdicts are cached by a hash of the normalized code, so an
+    identical resubmission is answered without parsing it again.
     
-    def _create_solution_patterns(self) -> Dict[str, Dict[str, Any]]:
-        """Define expected patterns for each mission."""
-        return {
-            "mission01": {
-                "patterns": [
-                    r'print\s*\(\s*["\']Hello[,]?\s*World[!]?["\']\s*\)',
-                    r'print\s*\(\s*["\']hello[,]?\s*world[!]?["\']\s*\)',
-                ],
-                "output": "Hello, World!",
-                "success_feedback": "🎉 Amazing! You just wrote your first line of code! The print() function displays text on screen. You're officially a coder now!",
-                "partial_patterns": [
-                    (r'print\s*\(', "Good start! You have print() — now add a message in quotes inside the parentheses."),
-                    (r'["\'].*["\']', "You have text in quotes — now wrap it with print() to display it!"),
-                ]
-            },
-            "mission04": {
-                "patterns": [
-                    r'for\s+\w+\s+in\s+logs',
-                    r'if.*failed',
-                    r'print.*[Aa]lert',
-                ],
-                "requires_all": True,
-                "output": "⚠️ ALERT: john has 6 failed logins!",
-                "success_feedback": "🔥 Excellent work, Analyst! You just built a brute force detector. This same logic is used in real security tools!",
-                "partial_patterns": [
-                    (r'for\s+', "Good — you're using a loop! Now check each entry's status."),
-                    (r'if\s+', "You have a condition — make sure you're checking if status == 'failed'."),
-                    (r'["\']failed["\']', "You're looking for 'failed' — now count them per user!"),
-                ]
-            },
-            "mission07": {
-                "patterns": [
-                    r'(auth|login|access)',
-                    r'(time|hour|3:17|03:17)',
-                ],
-                "output": """Investigation Results:
-━━━━━━━━━━━━━━━━━━━━━
-Suspicious Activity at 03:17:22
-User: svc_backup
-IP: 10.0.50.99
-Action: Database query executed
-Files accessed: customers.db, transactions.db
-
-Timeline:
-03:15:01 - Failed SSH from 10.0.50.99
-03:15:45 - Failed SSH from 10.0.50.99
-03:16:30 - Successful SSH (svc_backup)
-03:17:22 - Database access initiated
-03:18:45 - Large data transfer detected
-""",
-                "success_feedback": "🕵️ Impressive investigation! You traced the attack from initial access to data exfiltration. Real incident responders follow this exact process!",
-            },
-            "mission08": {
-                "patterns": [
-                    r'execute\s*\(\s*query\s*,\s*\(',  # Parameterized query
-                    r'\?\s*,\s*\?',  # Placeholders
-                ],
-                "output": "✅ Code is now secure! Using parameterized queries prevents SQL injection.",
-                "success_feedback": "🔧 You fixed it! SQL injection is one of the most common vulnerabilities. You just learned how to prevent it!",
-                "partial_patterns": [
-                    (r'f["\'].*\{', "Careful — you're still using f-strings. That's the vulnerability! Use ? placeholders instead."),
-                ]
-            },
-            "mission09": {
-                "patterns": [
-                    r'(timestamp|time|datetime)',
-                    r'(window|minute|second)',
-                    r'(count|len)',
-                ],
-                "requires_all": True,
-                "output": """Detection Results:
-━━━━━━━━━━━━━━━━━━━━━
-🚨 Fast Attack Detected:
-   User: admin, 12 attempts in 45 seconds
-
-⚠️ Slow Attack Detected:
-   User: root, 15 attempts over 8 minutes
-""",
-                "success_feedback": "🛡️ Outstanding! Your detector catches both attack styles. This is exactly how enterprise security tools work!",
-            },
-            "mission10": {
-                "patterns": [
-                    r'.',  # Any code counts as an attempt
-                ],
-                "output": """
-═══════════════════════════════════════════════════════════
-                    INCIDENT REPORT
-═══════════════════════════════════════════════════════════
-
-Prepared by: Security Analyst (You!)
-Date: Investigation Complete
-
-EXECUTIVE SUMMARY:
-On the night in question, an unauthorized actor gained access
-to internal systems using compromised service account credentials.
-
-TIMELINE:
-• 02:45 - Reconnaissance scanning detected
-• 03:15 - Brute force attempts on SSH
-• 03:16 - Successful login (svc_backup compromised)
-• 03:17 - Database queries executed
-• 03:18 - Data exfiltration (4.2GB)
-• 03:22 - Attacker disconnected
-
-ATTACK VECTOR:
-Credential stuffing using previously leaked service account.
-
-RECOMMENDATIONS:
-1. Rotate all service account credentials
-2. Implement MFA for all remote access
-3. Add rate limiting to prevent brute force
-4. Enhance after-hours monitoring
-
-═══════════════════════════════════════════════════════════
-
-🎉 CONGRATULATIONS! 🎉
-
-You've completed the Cyber Coding Game!
-
-From "Hello, World!" to full incident investigations,
-you've grown into a true Cyber Defender.
-
-Remember: Use your skills to PROTECT, never to harm.
-The digital world needs defenders like you! 🛡️
-""",
-                "success_feedback": "🏆 You did it! You've completed every mission and proven yourself as a Threat Hunter. The cybersecurity community is lucky to have defenders like you!",
-            }
-        }
+    Grading one submission stops after timeout seconds. The deadline
+    is checked between checks and between regex searches, and inside
+    searches on the linear regex engine; a single re search runs to
+    its end.
+    """
+    
+    def __init__(self, specs: Optional[MissionSpecs] = None, cache_size: int = GRADE_CACHE_SIZE,
+                 timeout: float = DEFAULT_GRADING_TIMEOUT):
+        """Initialize the sandbox with mission solutions (specs from lessons/ by default)."""
+        self.specs = specs or MissionSpecs()
+        self.verdicts = ResultCache(max_entries=cache_size, ttl=math.inf)
+        self.timeout = timeout
     
     def simulate(self, code: str, mission_id: str, tier: int = 1) -> ExecutionResult:
         """
         Simulate Python code execution.
         
-        This does NOT run real code — it pattern matches
+        This does NOT run real code — it inspects the code
         to determine if the solution is correct.
         """
-        # Get mission-specific patterns
-        mission_config = self.solutions.get(mission_id, {})
+        # Get mission-specific checks
+        catalog = self.specs.current
+        grading = catalog.python.get(mission_id)
         
-        if not mission_config:
+        if grading is None:
             # Default response for unknown missions
             return ExecutionResult(
                 success=True,
@@ -179,48 +89,103 @@ The digital world needs defenders like you! 🛡️
                 feedback="Your code looks good! Keep experimenting."
             )
         
-        patterns = mission_config.get("patterns", [])
-        requires_all = mission_config.get("requires_all", False)
-        
-        # Check for matches
-        matches = []
-        for pattern in patterns:
-            if re.search(pattern, code, re.IGNORECASE):
-                matches.append(pattern)
-        
-        # Determine success
-        if requires_all:
-            is_correct = len(matches) == len(patterns)
-        else:
-            is_correct = len(matches) > 0
+        verdict = self._grade(code, mission_id, grading, catalog.version)
         
-        if is_correct:
+        if verdict.correct:
             return ExecutionResult(
                 success=True,
-                output=mission_config.get("output", "Success!"),
-                feedback=mission_config.get("success_feedback", "Great job!"),
+                output=grading.output,
+                feedback=grading.success_feedback,
                 is_complete=True
             )
         
-        # Check for partial progress
-        partial_patterns = mission_config.get("partial_patterns", [])
-        for pattern, hint in partial_patterns:
-            if re.search(pattern, code, re.IGNORECASE):
-                return ExecutionResult(
-                    success=False,
-                    output="",
-                    feedback=hint,
-                    hints=self._get_tier_hints(tier, mission_id)
-                )
+        if verdict.error:
+            return ExecutionResult(
+                success=False,
+                output="",
+                error=verdict.error,
+                feedback=verdict.hint,
+                hints=self._get_tier_hints(tier, mission_id)
+            )
         
-        # No match at all
+        # Partial progress, or no match at all
         return ExecutionResult(
             success=False,
             output="",
-            feedback=self._get_encouragement(tier),
+            feedback=verdict.hint or self._get_encouragement(tier),
             hints=self._get_tier_hints(tier, mission_id)
         )
     
+    def grade(self, code: str, mission_id: str) -> Verdict:
+        """Grade code for a known mission, reusing the verdict for code seen before."""
+        catalog = self.specs.current
+        return self._grade(code, mission_id, catalog.python[mission_id], catalog.version)
+    
+    def _grade(self, code: str, mission_id: str, grading: PythonGrading, version: int) -> Verdict:
+        deadline = time.perf_counter() + self.timeout if self.timeout > 0 else None
+        code = normalize_code(code)
+        # The spec version keeps verdicts from before a reload out
+        key = (version, mission_id, hashlib.blake2b(code.encode("utf-8", "surrogatepass"), digest_size=16).digest())
+        verdict = self.verdicts.get(key)
+        if verdict is None:
+            try:
+                if grading.checks:
+                    verdict = self._grade_structure(code, grading, deadline)
+                else:
+                    verdict = self._grade_patterns(code, grading, deadline)
+            except GradingTimeout:
+                # Not cached: under load, code that normally passes could time out
+                return Verdict(
+                    correct=False,
+                    error=f"Grading timed out after {self.timeout:g}s",
+                    hint="Your code took too long to check. Try a shorter, simpler version.",
+                )
+            self.verdicts.put(key, verdict)
+        return verdict
+    
+    @staticmethod
+    def _grade_structure(code: str, grading: PythonGrading, deadline: Optional[float] = None) -> Verdict:
+        """Grade by checks on the syntax tree; one parse, one walk."""
+        try:
+            facts = collect_facts(code)
+        except SyntaxError as e:
+            where = f"line {e.lineno}" if e.lineno else "your code"
+            return Verdict(
+                correct=False,
+                error=f"SyntaxError: {e.msg} ({where})",
+                hint=f"Python can't read {where} yet. Fix that first, then run it again.",
+            )
+        check_deadline(deadline)
+        combine = all if grading.requires_all else any
+        if combine(passes(facts, check, deadline) for check in grading.checks):
+            return Verdict(correct=True)
+        for check, hint in grading.partial_checks:
+            if passes(facts, check, deadline):
+                return Verdict(correct=False, hint=hint)
+        return Verdict(correct=False)
+    
+    @staticmethod
+    def _grade_patterns(code: str, grading: PythonGrading, deadline: Optional[float] = None) -> Verdict:
+        """Grade by regexes over the source text."""
+        patterns = grading.patterns
+        matcher = grading.matcher
+        
+        # Patterns whose literals are missing from the code are ruled
+        # out up front; the rest run only until the answer is known.
+        # Indexes past the solution patterns are partial patterns.
+        candidates = matcher.candidates(code)
+        if grading.requires_all:
+            is_correct = all(matcher.matches(code, i, candidates, deadline) for i in range(len(patterns)))
+        else:
+            is_correct = any(matcher.matches(code, i, candidates, deadline) for i in range(len(patterns)))
+        if is_correct:
+            return Verdict(correct=True)
+        
+        for offset, (pattern, hint) in enumerate(grading.partial_patterns, len(patterns)):
+            if matcher.matches(code, offset, candidates, deadline):
+                return Verdict(correct=False, hint=hint)
+        return Verdict(correct=False)
+    
     def _get_encouragement(self, tier: int) -> str:
         """Get tier-appropriate encouragement."""
         if tier == 1:
@@ -0,0 +1,172 @@
+"""
+Cyber Coding Game - Sharded Log Search
+
+Splits a LogIndex into N shards and searches them in parallel
+across a pool of worker processes (scatter-gather).
+
+Each shard is written as an index snapshot; every worker maps all
+of them at startup, so any worker can serve any shard and the OS
+page cache holds a single copy. A search sends the query string
+to every shard at once. Each shard runs the plan and returns:
+
+- its exact hit count
+- its own top k sort keys after the cursor
+- mergeable aggregation partials (see LogIndex.partial_aggregations)
+
+The parent maps shard-local event IDs back to global ones, merges
+the per-shard pages by (timestamp, event ID) for the global top k,
+and sums the totals.
+
+Shards are either time ranges (equal-sized slices of the timestamp
+column, events without one go to the last shard) or event ID
+modulo N. Events keep their global order inside a shard, so a
+global cursor translates to a shard-local one with one bisect.
+"""
+
+import heapq
+import math
+import os
+import tempfile
+from array import array
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor, wait
+from itertools import islice
+from typing import Any, Dict, List, Optional, Tuple
+
+from .lucene_index import LogIndex, SORT_FIELD
+from .index_snapshot import load_snapshot, save_snapshot
+from .lucene_query import Deadline, QueryBudgetError, compile_query
+
+SHARD_MODES = ("time", "hash")
+
+# Shard indexes loaded by each worker process
+_shards: List[LogIndex] = []
+
+
+def _load_shards(paths: List[str]):
+    """Worker initializer: map every shard snapshot."""
+    global _shards
+    _shards = [load_snapshot(path) for path in paths]
+
+
+def _search_shard(shard_no: int, query: str, k: int, after: Optional[Tuple[float, int]],
+                  aggregations: Optional[Dict[str, Any]],
+                  timeout: Optional[float] = None) -> Tuple[List[Tuple[float, int]], int, Optional[Dict[str, Any]]]:
+    """Run a query on one shard: (top k sort keys, total, aggregation partials)."""
+    shard = _shards[shard_no]
+    plan = compile_query(query)
+    deadline = Deadline(timeout) if timeout is not None else None
+    if aggregations:
+        # The aggregations need the full bitmap anyway; page from that one
+        matches = plan.execute(shard, deadline=deadline)
+        doc_ids, total = shard.page(matches, k, after), matches.bit_count()
+        partials = shard.partial_aggregations(matches, aggregations)
+    else:
+        doc_ids, total = shard.top_k(plan, k, after, deadline)
+        partials = None
+    return [shard.sort_key(doc_id) for doc_id in doc_ids], total, partials
+
+
+class ShardedSearch:
+    """
+    Scatter-gather search over N shards of an index.
+
+    The index itself stays with the caller (it serves the rows of
+    the merged page); the workers only ever see shard snapshots.
+    Call close() to stop the workers and remove the snapshots.
+    """
+
+    def __init__(self, index: LogIndex, shards: int, mode: str = "time",
+                 workers: Optional[int] = None, shard_dir: Optional[str] = None):
+        if shards < 1:
+            raise ValueError("shards must be at least 1")
+        if mode not in SHARD_MODES:
+            raise ValueError(f"unknown shard mode {mode!r}, use one of {', '.join(SHARD_MODES)}")
+        self.mode = mode
+        self._tempdir = None if shard_dir else tempfile.TemporaryDirectory(prefix="log-shards-")
+        directory = shard_dir or self._tempdir.name
+
+        # Global event IDs of each shard, ascending
+        self.global_ids: List[array] = [array("I") for _ in range(shards)]
+        assign = self._time_assigner(index, shards) if mode == "time" else (lambda doc_id: doc_id % shards)
+        for doc_id in range(len(index)):
+            self.global_ids[assign(doc_id)].append(doc_id)
+
+        paths = []
+        for shard_no, doc_ids in enumerate(self.global_ids):
+            path = os.path.join(directory, f"shard-{shard_no:03d}.idx")
+            # Built one at a time so only a single shard is ever in memory
+            save_snapshot(LogIndex((index.logs[doc_id] for doc_id in doc_ids), index.analyzer), path)
+            paths.append(path)
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers or min(shards, os.cpu_count() or 1),
+            initializer=_load_shards,
+            initargs=(paths,),
+        )
+
+    @staticmethod
+    def _time_assigner(index: LogIndex, shards: int):
+        """Shard chooser for time mode: equal-count time ranges, untimed events last."""
+        times = index.time_values.get(SORT_FIELD)
+        if times is None:
+            return lambda doc_id: shards - 1
+        ordered = sorted(epoch for epoch in times if not math.isnan(epoch))
+        boundaries = [ordered[len(ordered) * i // shards] for i in range(1, shards)] if ordered else []
+
+        def assign(doc_id: int) -> int:
+            epoch = times[doc_id]
+            return shards - 1 if math.isnan(epoch) else bisect_right(boundaries, epoch)
+        return assign
+
+    def _local_key(self, shard_no: int, after: Optional[Tuple[float, int]]) -> Optional[Tuple[float, int]]:
+        """Translate a global cursor key to the same position in one shard."""
+        if after is None:
+            return None
+        return after[0], bisect_right(self.global_ids[shard_no], after[1]) - 1
+
+    def search(self, query: str, k: int, after: Optional[Tuple[float, int]] = None,
+               aggregations: Optional[Dict[str, Any]] = None,
+               deadline: Optional[Deadline] = None) -> Tuple[List[int], int, List[Dict[str, Any]]]:
+        """
+        Search every shard in parallel.
+
+        Returns the global top k event IDs after the cursor key, the
+        exact total, and one aggregation partial per shard (empty when
+        no aggregations were asked for). Query errors raised in a
+        worker are re-raised here.
+
+        With a deadline, each worker gets the time that is left and
+        stops itself; if any shard still hasn't answered by then,
+        QueryBudgetError is raised without waiting for it.
+        """
+        timeout = deadline.remaining() if deadline is not None else None
+        futures = [
+            self.pool.submit(_search_shard, shard_no, query, k, self._local_key(shard_no, after), aggregations, timeout)
+            for shard_no in range(len(self.global_ids))
+        ]
+        _, pending = wait(futures, timeout)
+        if pending:
+            for future in pending:
+                future.cancel()
+            raise QueryBudgetError(f"query ran longer than {deadline.seconds:g}s")
+        results = [future.result() for future in futures]
+        pages = [
+            [(epoch, global_ids[local_id]) for epoch, local_id in keys]
+            for global_ids, (keys, _, _) in zip(self.global_ids, results)
+        ]
+        top = [doc_id for _, doc_id in islice(heapq.merge(*pages), k)]
+        total = sum(shard_total for _, shard_total, _ in results)
+        partials = [partial for _, _, partial in results if partial is not None]
+        return top, total, partials
+
+    def close(self):
+        """Stop the worker processes and delete temporary shard snapshots."""
+        self.pool.shutdown()
+        if self._tempdir is not None:
+            self._tempdir.cleanup()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,54 @@
+"""
+Cyber Coding Game - Text Analysis
+
+Turns field values into the tokens of the full-text index, and
+bare query words into the same tokens, so both sides agree.
+
+Pipeline: split into word characters (letters, digits, _),
+lowercase, then optionally stem. ``/admin/users`` becomes
+``admin``, ``users``; ``10.0.50.99`` becomes four tokens that a
+phrase query matches back in order.
+
+Stemming is a light English suffix stripper (plurals and -ing/-ed),
+enough that ``logins`` finds ``login`` without Porter's surprises.
+"""
+
+import re
+from functools import lru_cache
+from typing import Tuple
+
+_WORD_RE = re.compile(r"\w+")
+
+# Tokens of common values are cached; logs repeat values constantly
+TOKEN_CACHE_SIZE = 65536
+
+
+def stem(token: str) -> str:
+    """Strip common English plural and verb suffixes from a lowercase token."""
+    if len(token) <= 3 or not token.isalpha():
+        return token
+    if token.endswith("ies") and not token.endswith(("eies", "aies")):
+        return token[:-3] + "y"
+    if token.endswith("es") and not token.endswith(("aes", "ees", "oes", "ses")):
+        return token[:-1]
+    if token.endswith("s") and not token.endswith(("us", "ss")):
+        return token[:-1]
+    for suffix in ("ing", "ed"):
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            return token[:-len(suffix)]
+    return token
+
+
+class Analyzer:
+    """Tokenize, lowercase and (optionally) stem text."""
+
+    def __init__(self, stem: bool = False):
+        self.stem = stem
+        self.tokens = lru_cache(maxsize=TOKEN_CACHE_SIZE)(self._tokens)
+
+    def _tokens(self, text: str) -> Tuple[str, ...]:
+        words = _WORD_RE.findall(text.lower())
+        return tuple(stem(word) for word in words) if self.stem else tuple(words)
+
+    def __repr__(self) -> str:
+        return f"Analyzer(stem={self.stem})"
@@ -6,6 +6,7 @@ Tests for the FastAPI backend API endpoints.
 Run with: pytest tests/ -v
 """
 
+import json
 import pytest
 from fastapi.testclient import TestClient
 import sys
@@ -14,7 +15,9 @@ import os
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
+from app import main
 from app.main import app
+from app.services.lucene_search_sim import LuceneSearchSimulator
 
 
 # Create test client
@@ -115,6 +118,34 @@ class TestBashExecution:
         assert "output" in data
 
 
+class TestBatchGrading:
+    """Tests for the batch grading endpoint."""
+    
+    def test_batch_streams_ndjson(self):
+        """Every submission gets a line, then a summary closes the stream."""
+        response = client.post("/api/run/batch", json={"submissions": [
+            {"code": 'print("Hello, World!")', "mission_id": "mission01"},
+            {"code": "cd /var; sudo rm -rf /", "mission_id": "mission02"},
+            {"code": "status:failed", "mission_id": "mission03"},
+            {"code": "ls", "mission_id": "no_such_mission"},
+        ]})
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        results = {line["index"]: line for line in lines[:-1]}
+        assert sorted(results) == [0, 1, 2, 3]
+        assert results[0]["result"]["success"]
+        assert results[1]["result"]["error"] == "This command is not allowed in the simulation."
+        assert results[2]["error"] and results[3]["error"] == "Mission not found"
+        summary = lines[-1]["summary"]
+        assert (summary["total"], summary["correct"], summary["rejected"]) == (4, 1, 2)
+    
+    def test_empty_batch_rejected(self):
+        """A batch needs at least one submission."""
+        response = client.post("/api/run/batch", json={"submissions": []})
+        assert response.status_code == 422
+
+
 class TestLogSearch:
     """Tests for log search endpoint."""
     
@@ -128,6 +159,82 @@ class TestLogSearch:
         data = response.json()
         assert "results" in data or "entries" in data or "output" in data
     
+    def test_total_reported_beyond_page(self):
+        """The response carries the true total and the returned page size."""
+        response = client.post("/api/search/logs", json={
+            "query": "status:success",
+            "max_results": 4
+        })
+        assert response.status_code == 200
+        data = response.json()
+        assert data["total_matches"] == 11
+        assert data["returned_count"] == 4
+        assert len(data["results"]) == 4
+    
+    def test_cursor_pagination(self):
+        """next_cursor fetches the following page."""
+        first = client.post("/api/search/logs", json={"query": "status:failed", "max_results": 3}).json()
+        assert first["next_cursor"]
+        second = client.post("/api/search/logs", json={
+            "query": "status:failed",
+            "max_results": 3,
+            "search_after": first["next_cursor"]
+        }).json()
+        assert second["returned_count"] == 2
+        assert second["next_cursor"] is None
+        assert first["results"][-1]["timestamp"] < second["results"][0]["timestamp"]
+    
+    def test_aggregations_block(self):
+        """Requested aggregations come back alongside the results."""
+        response = client.post("/api/search/logs", json={
+            "query": "status:failed",
+            "aggregations": {"top_ips": {"type": "terms", "field": "ip", "size": 5}}
+        })
+        assert response.status_code == 200
+        buckets = response.json()["aggregations"]["top_ips"]["buckets"]
+        assert buckets == [{"key": "10.0.50.99", "count": 5}]
+    
+    def test_profile_flag(self):
+        """profile: true adds an execution profile to the response."""
+        response = client.post("/api/search/logs", json={"query": "status:failed", "profile": True})
+        assert response.status_code == 200
+        profile = response.json()["profile"]
+        assert profile["clauses"][0]["description"] == "status:failed"
+        assert profile["clauses"][0]["matches"] == 5
+    
+    def test_cache_stats(self):
+        """Repeating a search is served from the result cache."""
+        before = client.get("/api/search/cache").json()
+        client.post("/api/search/logs", json={"query": "user:sarah"})
+        client.post("/api/search/logs", json={"query": "user:sarah"})
+        after = client.get("/api/search/cache").json()
+        assert after["hits"] >= before["hits"] + 1
+    
+    def test_detection_rule_alerts(self, monkeypatch):
+        """Saved rules raise alerts for appended live events."""
+        # A fresh simulator, so the rule and events don't leak into other tests
+        monkeypatch.setattr(main, "lucene_search", LuceneSearchSimulator())
+        response = client.post("/api/search/rules", json={"rule_id": "api-rule", "query": "user:zed"})
+        assert response.status_code == 200
+        response = client.post("/api/search/events", json={"events": [{"user": "zed", "action": "probe"}]})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["added"] == 1
+        assert [alert["rule_id"] for alert in data["alerts"]] == ["api-rule"]
+        response = client.post("/api/search/events", json={"events": [{"user": "zed", "level": 5, "ip": None}]})
+        assert response.status_code == 200
+        assert response.json()["alerts"][0]["entry"]["level"] == "5"
+        response = client.post("/api/search/logs", json={"query": "user:zed", "live": True})
+        assert response.json()["total_matches"] == 2
+        assert client.post("/api/search/logs", json={"query": "user:zed"}).json()["total_matches"] == 0
+        assert client.delete("/api/search/rules/api-rule").status_code == 200
+        assert client.post("/api/search/rules", json={"rule_id": "bad", "query": "user:(x"}).status_code == 400
+    
+    def test_did_you_mean(self):
+        """A misspelt value comes back with a suggestion."""
+        response = client.post("/api/search/logs", json={"query": "status:faild"})
+        assert response.json()["suggestion"] == "status:failed"
+    
     def test_empty_query(self):
         """Empty query is handled gracefully."""
         response = client.post("/api/search/logs", json={
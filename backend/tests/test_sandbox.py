@@ -9,6 +9,11 @@ These tests ensure that:
 3. Security constraints are enforced
 """
 
+import json
+import random
+import re
+import shutil
+import time
 import pytest
 import sys
 import os
@@ -16,8 +21,27 @@ import os
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
 from app.services.sandbox_python import PythonSandbox
+from app.services.python_grader import PatternSet, Regex, collect_facts, compile_check, required_literals
+from app.services.linear_regex import MAX_DFA_STATES, LinearRegex, RegexTimeout, backtracking_risk
 from app.services.sandbox_bash import BashSandbox
-from app.services.lucene_search_sim import LuceneSearchSimulator
+from app.services.mission_specs import LESSONS_DIR, MissionSpecError, MissionSpecs, load_catalog
+from app.services.batch_grading import BatchGrader
+from app.services import lucene_search_sim
+from app.services.lucene_search_sim import LuceneSearchSimulator, MissionTarget
+from app.services.lucene_index import (
+    LogIndex, DictColumn, StringColumn, MAX_DICT_VALUES, levenshtein_matches, iter_bitmap
+)
+from app.services.log_ingest import ingest_file
+from app.services.result_cache import ResultCache
+from app.services.percolator import Percolator, RuleLimitError, rule_keys
+from app.services.text_analysis import Analyzer
+from app.services.index_snapshot import save_snapshot, load_snapshot
+from app.game_logic import GameLogic
+from app.models import AggregationRequest, CodeSubmission
+from app.services.lucene_query import (
+    TermQuery, WildcardQuery, RangeQuery, FuzzyQuery, Deadline, QueryBudgetError, QuerySyntaxError,
+    compile_query, parse_query
+)
 
 
 class TestPythonSandbox:
@@ -47,6 +71,149 @@ class TestPythonSandbox:
         # Should fail without executing
         assert result["success"] == False or "os" not in result.get("output", "").lower()
 
+    def test_required_literals(self):
+        """Only literals every match must contain are used to rule patterns out."""
+        assert required_literals(r"print\s*\(") == ("print",)
+        assert required_literals(r"ab{2}cd") == ("cd",)
+        assert required_literals(r"(count|len)") == ("count", "len")
+        assert required_literals(r"x(a|b)yz") == ("yz",)
+        assert required_literals(r"(?!foo)bar") == ("bar",)
+        assert required_literals(r"a|b+") is None
+        assert required_literals(r".") is None
+    
+    def test_pattern_set_matches_each_pattern(self):
+        """A PatternSet reports exactly the patterns re.search would find."""
+        patterns = [r"abc", r"bcd", r"b", r"(count|len)\(", r"[\"'].*[\"']", r"x{2,}"]
+        matcher = PatternSet(patterns)
+        for code in ["abcd", "ABCD", "len(x)", "Count(", "say 'hi'", "xx", "x", "", "ﬀ abc"]:
+            expected = {i for i, pattern in enumerate(patterns) if re.search(pattern, code, re.IGNORECASE)}
+            assert matcher.search(code) == expected
+    
+    def test_simulate_grades_missions(self):
+        """Solutions pass, partial attempts get the mission's hint."""
+        assert self.sandbox.simulate('print("Hello, World!")', "mission01").is_complete
+        partial = self.sandbox.simulate("print(x)", "mission01")
+        assert not partial.success
+        assert partial.feedback != self.sandbox.simulate("x = 1", "mission01").feedback
+    
+    def test_comments_and_strings_do_not_count(self):
+        """Structural checks look at code, not at text that merely looks like it."""
+        assert not self.sandbox.simulate('# print("Hello, World!")', "mission01").success
+        assert not self.sandbox.simulate("# for e in logs: if failed: print('alert')\nx = 1", "mission04").success
+        solution = (
+            "for entry in logs:\n"
+            "    if entry['status'] == 'failed':\n"
+            "        print(f'ALERT: {entry[\"user\"]}')\n"
+        )
+        assert self.sandbox.simulate(solution, "mission04").success
+        # A printed variable counts by its name, as the text grader allowed
+        by_name = "for entry in logs:\n    if entry['status'] == 'failed':\n        print(alert)\n"
+        assert self.sandbox.simulate(by_name, "mission04").success
+        assert not self.sandbox.simulate(by_name.replace("print(alert)", "print(user)"), "mission04").success
+    
+    def test_parameterized_sql(self):
+        """Only execute() calls with a ? query and separate values pass mission08."""
+        fixed = 'query = "INSERT INTO users VALUES (?, ?)"\ndatabase.execute(query, (username, email))'
+        still_vulnerable = (
+            'query = f"INSERT INTO users VALUES (\'{username}\', \'{email}\')"\n'
+            "database.execute(query)  # execute(query, (?, ?))"
+        )
+        assert self.sandbox.simulate(fixed, "mission08").success
+        result = self.sandbox.simulate(still_vulnerable, "mission08")
+        assert not result.success
+        assert "f-strings" in result.feedback
+    
+    def test_syntax_errors_are_reported(self):
+        """Code Python can't parse fails with the line to fix, never a crash."""
+        result = self.sandbox.simulate('x = 1\nprint "Hello"', "mission01")
+        assert not result.success
+        assert "line 2" in result.error
+        for code in ["1+" * 3000 + "1", "(" * 300, "x = 1\x00"]:
+            assert self.sandbox.simulate(code, "mission04").error
+    
+    def test_resubmissions_are_cached(self):
+        """Identical code, up to trailing whitespace, reuses the verdict."""
+        self.sandbox.simulate('print("Hello, World!")', "mission01")
+        self.sandbox.simulate('print("Hello, World!")   \r\n\n', "mission01")
+        stats = self.sandbox.verdicts.stats()
+        assert (stats.hits, stats.misses) == (1, 1)
+        # Verdicts are per mission
+        self.sandbox.simulate('print("Hello, World!")', "mission04")
+        assert self.sandbox.verdicts.stats().misses == 2
+    
+    def test_code_facts(self):
+        """One walk collects what the checks need."""
+        facts = collect_facts(
+            "from datetime import datetime\n"
+            "for user, n in counts.items():\n"
+            "    if n > 5 and kind != 'ok':\n"
+            "        print('ALERT:', user)\n"
+        )
+        assert {"datetime", "counts", "user"} <= facts.names
+        assert facts.loops_over == {"counts"}
+        assert facts.compared == {"ok"}
+        assert facts.printed == ["ALERT: {}"]
+        with pytest.raises(ValueError):
+            compile_check(("runs",))
+
+
+class TestGradingRegexes:
+    """Tests for regex safety: the backtracking lint, the linear engine, the time budget."""
+    
+    def test_catastrophic_shapes_rejected(self):
+        """Patterns that can backtrack catastrophically are refused on re."""
+        for pattern in [r"(a+)+$", r"(\w+\s?)*$", r"(\w|[a-z]\d)*$", r"\w+\s*\w+=", r".*.*x"]:
+            assert backtracking_risk(pattern, re.IGNORECASE), pattern
+            with pytest.raises(ValueError):
+                compile_check(("string", pattern))
+        for pattern in [r"if.*failed", r"(timestamp|time|datetime)", r"(\w+\s)*x", r"^hello,?\s*world!?$"]:
+            assert backtracking_risk(pattern, re.IGNORECASE) is None, pattern
+        # Linear time on any shape, but no backreferences
+        assert Regex(r"(a+)+$", engine="linear").search("a" * 5000 + "!") is False
+        with pytest.raises(ValueError):
+            Regex(r"(a)\1", engine="linear")
+    
+    def test_linear_engine_agrees_with_re(self):
+        """The linear engine finds a match exactly when re.search does."""
+        patterns = [r"if.*failed", r"^hello,?\s*world!?$", r"\bab\b", r"a{2,3}b", r"[^ab]+c",
+                    r"(?m)^b$", r"x$", r"\Aab|c\Z", r"[a-zß]+x", r"(a|ab)*c", r"\W\w"]
+        alphabet = "abcxßſKKé 1\n._"
+        rng = random.Random(7)
+        for pattern in patterns:
+            for flags in (0, re.IGNORECASE):
+                linear, compiled = LinearRegex(pattern, flags), re.compile(pattern, flags)
+                for _ in range(300):
+                    text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 10)))
+                    assert linear.search(text) == bool(compiled.search(text)), (pattern, flags, text)
+        with pytest.raises(RegexTimeout):
+            LinearRegex("x").search("a" * 10000, deadline=0)
+    
+    def test_linear_engine_cache_is_bounded(self):
+        """A pattern with exponentially many DFA states can't grow the cache past its cap."""
+        linear, compiled = LinearRegex("a[ab]{14}c"), re.compile("a[ab]{14}c")
+        rng = random.Random(1)
+        for ending in ("", "", "c"):
+            text = "".join(rng.choice("ab") for _ in range(10000)) + ending
+            assert linear.search(text) == bool(compiled.search(text))
+            assert len(linear._dfa_states) <= MAX_DFA_STATES
+            assert len(linear._transitions) <= MAX_DFA_STATES
+    
+    def test_grading_timeout(self):
+        """Past its budget a submission fails with an error, and isn't cached."""
+        sandbox = PythonSandbox(timeout=1e-9)
+        result = sandbox.simulate('print("Hello, World!")', "mission01")
+        assert not result.success
+        assert "timed out" in result.error
+        assert sandbox.verdicts.stats().entries == 0
+    
+    def test_linear_engine_grades_missions(self):
+        """Shipped missions grade the same on the linear engine."""
+        sandbox = PythonSandbox(MissionSpecs(LESSONS_DIR, regex_engine="linear"))
+        assert sandbox.simulate('print("Hello, World!")', "mission01").is_complete
+        assert not sandbox.simulate("print(x)", "mission01").success
+        with pytest.raises(ValueError):
+            MissionSpecs(LESSONS_DIR, regex_engine="pcre")
+
 
 class TestBashSandbox:
     """Tests for Bash sandbox safety."""
@@ -110,6 +277,659 @@ class TestLuceneSimulator:
             # Should handle gracefully without executing anything
             assert "output" in result or "results" in result
 
+    def test_field_lookup_uses_index(self):
+        """field:value is answered from the inverted index postings."""
+        postings = self.simulator.index.lookup("status", "FAILED")
+        assert len(postings) == 5
+        result = self.simulator.search("status:Failed")
+        assert result.total_matches == 5
+        assert all(entry.status == "failed" for entry in result.results)
+
+    def test_index_covers_numeric_fields(self):
+        """Numeric values are indexed by their string form."""
+        result = self.simulator.search("hour:23")
+        assert result.total_matches == 2
+
+    def test_and_query_intersects(self):
+        """AND keeps only events matching every clause."""
+        result = self.simulator.search("status:success AND user:john")
+        assert result.total_matches == 1
+        assert result.results[0].timestamp == "2024-01-15 10:45:25"
+
+    def test_or_query_deduplicates(self):
+        """OR returns each matching event once, in corpus order."""
+        result = self.simulator.search("user:john OR status:failed")
+        timestamps = [entry.timestamp for entry in result.results]
+        assert len(timestamps) == 6
+        assert timestamps == sorted(timestamps)
+
+    def test_bare_terms_use_full_text_index(self):
+        """Bare words and phrases resolve through token postings and positions."""
+        index = self.simulator.index
+        assert list(index.text_lookup("ADMIN")) == sorted(
+            set(index.lookup("user", "admin")) | set(index.text_postings["admin"])
+        )
+        assert self.simulator.search("users").total_matches == \
+            self.simulator.search("path:*users*").total_matches
+        # Phrases match consecutive tokens of one value, never across fields
+        attacker = len(index.lookup("ip", "10.0.50.99"))
+        assert self.simulator.search('"10.0.50.99"').total_matches == attacker
+        assert self.simulator.search('"10.0.50"').total_matches == attacker
+        assert self.simulator.search('"50.10"').total_matches == 0
+        assert index.execute_clause(TermQuery(None, "192.168")) == index.lookup_bitmap("ip", "192.168.1.50") | \
+            index.execute_clause(WildcardQuery("ip", "192.168.*"))
+    
+    def test_stemming_analyzer(self):
+        """With stemming, plural and -ing forms find the base word."""
+        analyzer = Analyzer(stem=True)
+        assert analyzer.tokens("Failed logins for /admin/users") == ("fail", "login", "for", "admin", "user")
+        index = LogIndex([{"message": "user logins blocked"}], analyzer)
+        assert list(index.text_lookup("login")) == [0]
+        assert list(index.text_lookup('"users login"')) == [0]
+
+    def test_wildcard_is_anchored(self):
+        """Wildcards match whole terms, with prefix/suffix/infix shapes."""
+        assert self.simulator.search("user:adm*").total_matches == 3
+        assert self.simulator.search("user:dmin*").total_matches == 0
+        assert self.simulator.search("path:*/db").total_matches == 1
+        assert self.simulator.search("path:/a*d*b").total_matches == 1
+
+    def test_wildcard_narrowed_by_trigrams(self):
+        """Only terms sharing the pattern's trigrams are verified."""
+        candidates = self.simulator.index._wildcard_candidates("path", "*admin*")
+        assert set(candidates) == {"/admin/panel", "/admin/users", "/admin/config", "/admin/db"}
+        assert list(self.simulator.index._wildcard_candidates("user", "*zzz*")) == []
+
+    def test_wraparound_hour_range(self):
+        """hour:[23 TO 5] covers 11 PM through 5 AM."""
+        result = self.simulator.search("path:*admin* AND hour:[23 TO 5]", "mission06")
+        assert result.total_matches == 4
+        assert result.is_correct
+
+    def test_mission_graded_by_result_set(self):
+        """Missions compare result sets, not query text."""
+        # Any query that finds exactly the target events passes
+        assert self.simulator.search("path:*admin* AND hour:[0 TO 23]", "mission06").is_correct
+        assert self.simulator.search("failed AND NOT status:success", "mission03").is_correct
+        # Right keywords, wrong events
+        assert not self.simulator.search("admin AND hour:[12 TO 23]", "mission06").is_correct
+        noisy = self.simulator.search("status:failed OR user:mike", "mission03")
+        assert not noisy.is_correct
+        assert "2 results don't belong" in noisy.feedback
+
+    def test_mission_thresholds(self):
+        """Targets can accept partial answers and follow events added to the corpus."""
+        self.simulator.mission_targets["lenient"] = MissionTarget("status:failed", min_precision=0.7, min_recall=0.5)
+        assert self.simulator.search("status:failed OR user:mike", "lenient").is_correct
+        assert not self.simulator.search("user:mike", "lenient").is_correct
+        self.simulator.index.add({"user": "eve", "action": "login", "status": "failed"})
+        stale = self.simulator.search("user:john AND status:failed", "mission03")
+        assert not stale.is_correct
+        assert "1 events you're hunting for are missing" in stale.feedback
+
+    def test_timestamp_range(self):
+        """Timestamps are range-searchable after parsing to epoch."""
+        result = self.simulator.search('timestamp:["2024-01-15 10:45:00" TO "2024-01-15 10:45:20"}')
+        assert result.total_matches == 4
+
+    def test_hour_derived_from_timestamp(self):
+        """Corpora without an hour field still support hour ranges."""
+        index = LogIndex([{"timestamp": "2024-02-01 23:30:00"}, {"timestamp": "2024-02-01 12:00:00"}])
+        assert index.execute_clause(RangeQuery("hour", "22", "2")) == 0b01
+
+    def test_total_matches_is_true_hit_count(self):
+        """total_matches counts every hit even when the page is truncated."""
+        result = self.simulator.search("status:success OR status:failed", max_results=3)
+        assert result.total_matches == 16
+        assert result.returned_count == 3
+        assert len(result.results) == 3
+
+    def test_single_term_page_from_postings(self):
+        """A single-term query pages straight from its posting list."""
+        result = self.simulator.search("status:failed", max_results=2)
+        assert result.total_matches == 5
+        assert [entry.timestamp for entry in result.results] == ["2024-01-15 10:45:01", "2024-01-15 10:45:05"]
+
+    def test_search_after_walks_all_pages(self):
+        """Following next_cursor visits every hit once, in timestamp order."""
+        seen, cursor = [], None
+        while True:
+            page = self.simulator.search("status:success OR hour:10", max_results=4, search_after=cursor)
+            seen.extend(entry.timestamp for entry in page.results)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        assert len(seen) == 16
+        assert seen == sorted(seen)
+
+    def test_search_after_on_unordered_corpus(self):
+        """Pagination follows timestamps even when events arrive out of order."""
+        self.simulator.index = LogIndex(reversed(self.simulator.logs))
+        self.simulator.logs = self.simulator.index.logs
+        first = self.simulator.search("status:failed", max_results=3)
+        second = self.simulator.search("status:failed", max_results=3, search_after=first.next_cursor)
+        timestamps = [entry.timestamp for entry in first.results + second.results]
+        assert timestamps == sorted(timestamps)
+        assert len(timestamps) == 5
+        assert second.next_cursor is None
+
+    def test_terms_and_cardinality_aggregations(self):
+        """Aggregations count over all matches, not the returned page."""
+        result = self.simulator.search("status:failed OR path:*admin*", max_results=1, aggregations={
+            "ips": AggregationRequest(type="terms", field="ip", size=3),
+            "users": AggregationRequest(type="cardinality", field="user"),
+        })
+        assert result.returned_count == 1
+        assert [(b.key, b.count) for b in result.aggregations["ips"].buckets] == [("10.0.50.99", 9)]
+        assert result.aggregations["users"].value == 4
+
+    def test_date_histogram_aggregation(self):
+        """date_histogram buckets matches by timestamp interval."""
+        result = self.simulator.search("path:*admin*", aggregations={
+            "per_day": AggregationRequest(type="date_histogram", field="timestamp", interval="1d"),
+        })
+        buckets = [(b.key, b.count) for b in result.aggregations["per_day"].buckets]
+        assert buckets == [("2024-01-15 00:00:00", 2), ("2024-01-16 00:00:00", 2)]
+
+    def test_query_profile(self):
+        """profile reports clause order, sizes and timings without changing results."""
+        plain = self.simulator.search("path:*admin* AND user:john")
+        profiled = self.simulator.search("path:*admin* AND user:john", profile=True)
+        assert plain.profile is None
+        assert profiled.total_matches == plain.total_matches
+        root = profiled.profile.clauses[0]
+        assert root.type == "AndQuery"
+        # Clauses run smallest estimate first; later ones only see survivors
+        first, second = root.children
+        assert {first.description, second.description} == {"user:john", "path:*admin*"}
+        assert first.estimate <= second.estimate
+        assert second.candidates == first.matches
+        assert profiled.profile.total_ms >= profiled.profile.execute_ms
+        assert profiled.profile.cost == compile_query("path:*admin* AND user:john").cost(self.simulator.index)
+
+    def test_query_budget(self):
+        """Queries priced over the budget are refused before they run."""
+        index = self.simulator.index
+        assert compile_query("user:john").cost(index) < compile_query("user:*o*").cost(index) \
+            < compile_query("*o*").cost(index)
+        simulator = LuceneSearchSimulator(max_query_cost=60)
+        assert simulator.search("status:failed AND user:john").total_matches == 5
+        rejected = simulator.search(" OR ".join(f"*{c}*" for c in "aeiou"))
+        assert rejected.total_matches == 0
+        assert rejected.feedback.startswith("Query too expensive")
+
+    def test_query_deadline(self):
+        """A running plan stops at the first clause after its deadline."""
+        ticks = iter(range(10))
+        deadline = Deadline(1.5, clock=lambda: next(ticks))
+        with pytest.raises(QueryBudgetError):
+            compile_query("user:john AND status:failed").execute(self.simulator.index, deadline=deadline)
+        assert next(ticks) == 3
+
+    def test_deadline_inside_clause(self):
+        """One slow wildcard or fuzzy clause is stopped while it runs."""
+        index = LogIndex([{"user": f"user{i}"} for i in range(3000)])
+        for query in ["user:*9*", "*9*", "user:usr12~2"]:
+            ticks = iter(range(100))
+            deadline = Deadline(2, clock=lambda: next(ticks))
+            with pytest.raises(QueryBudgetError):
+                compile_query(query).execute(index, deadline=deadline)
+            # Created, checked before the clause, then twice inside it
+            assert next(ticks) == 4
+
+    def test_result_cache(self):
+        """Equivalent queries share a cache entry until the corpus changes."""
+        simulator = LuceneSearchSimulator()
+        first = simulator.search("status:failed AND (hour:[23 TO 5])")
+        again = simulator.search("  status:failed   AND hour:[23 TO 5]")
+        assert again.model_dump(exclude={"query"}) == first.model_dump(exclude={"query"})
+        stats = simulator.cache_stats()
+        assert (stats.hits, stats.misses, stats.entries) == (1, 1, 1)
+        
+        simulator.index.add({"timestamp": "2024-01-17 01:00:00", "status": "failed", "hour": 1})
+        assert simulator.search("status:failed AND hour:[23 TO 5]").total_matches == first.total_matches + 1
+        assert simulator.cache_stats().misses == 2
+    
+    def test_result_cache_eviction_and_ttl(self):
+        """Entries are evicted least recently used first and expire after ttl."""
+        now = [0.0]
+        cache = ResultCache(max_entries=2, ttl=10, clock=lambda: now[0])
+        cache.put("a", 1)
+        cache.put("b", 2)
+        assert cache.get("a") == 1
+        cache.put("c", 3)
+        assert cache.get("b") is None
+        now[0] = 11
+        assert cache.get("a") is None
+        stats = cache.stats()
+        assert (stats.evictions, stats.expirations, stats.hits) == (1, 1, 1)
+
+    def test_fuzzy_and_prefix_from_dictionary(self):
+        """Fuzzy and prefix terms come from the sorted term dictionary."""
+        assert self.simulator.search("status:faild~1").total_matches == 5
+        # An adjacent swap is a single edit, like Lucene
+        assert self.simulator.index.fuzzy_terms("user", "jhon", 1) == [("john", 1)]
+        assert list(self.simulator.index.prefix_terms("user", "S")) == ["sarah", "svc_backup"]
+        assert self.simulator.search("user:s*").total_matches == \
+            self.simulator.search("user:sarah OR user:svc_backup").total_matches
+    
+    def test_levenshtein_matches_skip_dead_prefixes(self):
+        """Matches are exact edit distances over a sorted list."""
+        terms = sorted(["admin", "admins", "badmin", "odmin", "root", "rot", "roots"])
+        assert levenshtein_matches(terms, "admn", 1) == [("admin", 1)]
+        assert levenshtein_matches(terms, "rot", 2) == [("root", 1), ("roots", 2), ("rot", 0)]
+    
+    def test_did_you_mean(self):
+        """Misspelt values get a corrected query suggestion."""
+        result = self.simulator.search("status:faild AND user:jhon")
+        assert result.total_matches == 0
+        assert result.suggestion == "status:failed AND user:john"
+        assert "Did you mean" in result.feedback
+        assert self.simulator.search("status:failed AND user:sarah").suggestion is None
+
+    def test_cidr_and_ip_range(self):
+        """CIDR blocks and IP ranges resolve on the integer IP column."""
+        assert self.simulator.search("ip:10.0.0.0/8").total_matches == \
+            len(self.simulator.index.lookup("ip", "10.0.50.99"))
+        assert self.simulator.search("ip:192.168.1.0/24").total_matches == \
+            self.simulator.search("ip:192.168.1.*").total_matches
+        assert self.simulator.search("ip:[192.168.1.50 TO 192.168.1.52]").total_matches == \
+            self.simulator.search("ip:192.168.1.50 OR ip:192.168.1.51 OR ip:192.168.1.52").total_matches
+        # Composes with other clauses
+        assert self.simulator.search("ip:10.0.0.0/8 AND status:failed").total_matches == 5
+        assert self.simulator.search("ip:10.0.0.0/8 -ip:10.0.50.99").total_matches == 0
+    
+    def test_ipv6_cidr(self):
+        """IPv6 blocks are answered from the term dictionary."""
+        index = LogIndex([{"ip": "fe80::1"}, {"ip": "2001:db8::5"}, {"ip": "10.1.2.3"}])
+        plan = compile_query("ip:2001:db8::/32 OR ip:[fe80:: TO fe80::ff]")
+        assert list(iter_bitmap(plan.execute(index))) == [0, 1]
+        with pytest.raises(QuerySyntaxError):
+            parse_query("ip:10.0.0.0/33")
+
+
+class TestLogIngest:
+    """Tests for streaming corpus ingest."""
+    
+    def test_ndjson_ingest_in_batches(self, tmp_path):
+        """NDJSON lines are indexed in batches; bad lines are skipped."""
+        capture = tmp_path / "capture.ndjson"
+        lines = [json.dumps({"timestamp": f"2024-03-01 0{i}:00:00", "user": "eve", "status": "failed"})
+                 for i in range(5)]
+        capture.write_text("\n".join(lines + ["not json", "[1, 2]", ""]) + "\n")
+        index = LogIndex()
+        stats = ingest_file(str(capture), index, batch_size=2)
+        assert stats.events == 5
+        assert stats.skipped == 2
+        assert stats.batches == 3
+        assert stats.events_per_second > 0
+        assert len(index.lookup("user", "eve")) == 5
+        assert index.execute_clause(RangeQuery("hour", "3", "4")).bit_count() == 2
+    
+    def test_nested_and_mixed_type_values(self, tmp_path):
+        """Nested objects become dotted fields; lists and bools are kept as they are."""
+        capture = tmp_path / "http.ndjson"
+        records = [
+            {"http": {"method": "GET", "response": {"status": 200}}, "tags": ["a", "b"], "ok": True},
+            {"http": {"method": "POST"}, "tags": ["a", "b"], "ok": 1},
+            {"ok": 1.0},
+        ]
+        capture.write_text("\n".join(json.dumps(record) for record in records) + "\n")
+        index = LogIndex()
+        assert ingest_file(str(capture), index).events == 3
+        assert index.logs[0] == {"http.method": "GET", "http.response.status": 200, "tags": ["a", "b"], "ok": True}
+        assert [index.logs[i]["ok"] for i in range(3)] == [True, 1, 1.0]
+        assert type(index.logs[1]["ok"]) is int
+        assert index.execute_clause(RangeQuery("http.response.status", "200", "299")).bit_count() == 1
+        assert compile_query("http.method:post").execute(index).bit_count() == 1
+    
+    def test_simulator_loads_corpus_file(self, tmp_path):
+        """The simulator can search a capture instead of the demo logs."""
+        capture = tmp_path / "auth.log"
+        capture.write_text("sshd failed password for root\nsshd accepted key for deploy\n")
+        simulator = LuceneSearchSimulator(corpus_path=str(capture))
+        assert simulator.ingest_stats.events == 2
+        assert simulator.search("failed").total_matches == 1
+
+
+class TestIndexSnapshot:
+    """Tests for memory-mapped index snapshots."""
+    
+    def test_snapshot_round_trip(self, tmp_path):
+        """A loaded snapshot answers queries exactly like the built index."""
+        built = LuceneSearchSimulator()
+        snapshot = str(tmp_path / "demo.idx")
+        save_snapshot(built.index, snapshot)
+        loaded = LuceneSearchSimulator(snapshot_path=snapshot)
+        assert loaded.index.read_only
+        for query in ["status:failed", "path:*admin* AND hour:[23 TO 5]", "john", "NOT status:success",
+                      '"10.0.50"', "ip:192.168.0.0/16"]:
+            assert loaded.search(query).model_dump() == built.search(query).model_dump()
+    
+    def test_missing_snapshot_is_written(self, tmp_path):
+        """The first worker builds the index and saves the snapshot."""
+        snapshot = tmp_path / "demo.idx"
+        LuceneSearchSimulator(snapshot_path=str(snapshot))
+        assert snapshot.exists()
+        index = load_snapshot(str(snapshot))
+        assert len(index) == 17
+        with pytest.raises(RuntimeError):
+            index.add({"user": "mallory"})
+
+    def test_stale_snapshot_is_rebuilt(self, tmp_path):
+        """A snapshot of another or an older capture is rebuilt, not served."""
+        capture = tmp_path / "capture.ndjson"
+        capture.write_text('{"user": "eve"}\n')
+        snapshot = str(tmp_path / "capture.idx")
+        assert len(LuceneSearchSimulator(corpus_path=str(capture), snapshot_path=snapshot).index) == 1
+        assert LuceneSearchSimulator(corpus_path=str(capture), snapshot_path=snapshot).index.read_only
+        capture.write_text('{"user": "eve"}\n{"user": "bob"}\n')
+        assert len(LuceneSearchSimulator(corpus_path=str(capture), snapshot_path=snapshot).index) == 2
+        other = tmp_path / "other.ndjson"
+        other.write_text('{"user": "mallory"}\n')
+        rebuilt = LuceneSearchSimulator(corpus_path=str(other), snapshot_path=snapshot)
+        assert rebuilt.search("user:mallory").total_matches == 1
+        assert load_snapshot(snapshot).snapshot_source["path"] == str(other)
+    
+    def test_rows_rebuilt_from_columns(self, tmp_path):
+        """Events live only in the columns; near-unique fields are packed."""
+        events = [{"status": "ok", "message": f"line {i}"} for i in range(MAX_DICT_VALUES + 10)]
+        events += [{"message": "", "code": 200}, {"message": 7, "status": None}, {"message": "\x00raw"}]
+        index = LogIndex(events)
+        assert isinstance(index.columns["message"], StringColumn)
+        assert isinstance(index.columns["status"], DictColumn)
+        snapshot = str(tmp_path / "rows.idx")
+        save_snapshot(index, snapshot)
+        loaded = load_snapshot(snapshot)
+        for doc_id in [0, MAX_DICT_VALUES, len(events) - 3, len(events) - 2, len(events) - 1]:
+            assert index.logs[doc_id] == loaded.logs[doc_id] == events[doc_id]
+        assert loaded.logs.take("message", [1, len(events) - 2]) == ["line 1", 7]
+        assert index.value_counts("message", index.lookup_bitmap("status", "ok"))["line 3"] == 1
+
+
+class TestShardedSearch:
+    """Tests for scatter-gather search across worker processes."""
+    
+    @pytest.mark.parametrize("mode", ["time", "hash"])
+    def test_sharded_matches_single_index(self, mode):
+        """Totals, pages and aggregations merge to the unsharded answer."""
+        single = LuceneSearchSimulator()
+        sharded = LuceneSearchSimulator(shards=3, shard_mode=mode)
+        aggs = {
+            "users": AggregationRequest(type="terms", field="user", size=3),
+            "ips": AggregationRequest(type="cardinality", field="ip"),
+            "per_hour": AggregationRequest(type="date_histogram", field="timestamp", interval="1h"),
+        }
+        try:
+            for query in ["status:failed", "path:*admin* AND hour:[23 TO 5]", "john", "NOT status:success"]:
+                expected = single.search(query, max_results=4, aggregations=aggs).model_dump()
+                assert sharded.search(query, max_results=4, aggregations=aggs).model_dump() == expected
+            
+            # Cursors from the merged page resume correctly on every shard
+            pages, cursor = [], None
+            while True:
+                result = sharded.search("NOT status:success", max_results=2, search_after=cursor)
+                pages.extend(entry.timestamp for entry in result.results)
+                cursor = result.next_cursor
+                if cursor is None:
+                    break
+            expected = single.search("NOT status:success").results
+            assert pages == [entry.timestamp for entry in expected]
+            
+            assert "Query error" in sharded.search("status:(failed").feedback
+        finally:
+            sharded.sharded.close()
+
+
+class TestMissionSpecs:
+    """Tests for mission specs loaded from lessons/ and hot reloaded."""
+    
+    @pytest.fixture
+    def lessons(self, tmp_path):
+        """A writable copy of the shipped mission specs."""
+        shutil.copytree(LESSONS_DIR, tmp_path / "lessons", ignore=shutil.ignore_patterns("*.md"))
+        return tmp_path / "lessons"
+    
+    @staticmethod
+    def edit(path, change):
+        spec = json.loads(path.read_text(encoding="utf-8"))
+        change(spec)
+        path.write_text(json.dumps(spec), encoding="utf-8")
+    
+    def test_shipped_specs_load(self):
+        """Every mission ships a valid spec; graded ones compile."""
+        catalog = load_catalog(LESSONS_DIR)
+        assert list(catalog.missions) == [f"mission{i:02d}" for i in range(1, 11)]
+        assert set(catalog.python) == {"mission01", "mission04", "mission07", "mission08", "mission09", "mission10"}
+        assert set(catalog.search_targets) == {"mission03", "mission06"}
+    
+    def test_reload_swaps_catalog(self, lessons):
+        """Edited specs go live; catalogs already handed out don't change."""
+        specs = MissionSpecs(lessons)
+        sandbox = PythonSandbox(specs)
+        game = GameLogic(specs)
+        before = specs.current
+        assert sandbox.simulate('print("Hello, World!")', "mission01").output == "Hello, World!"
+        
+        self.edit(lessons / "tier1_new_trainee" / "mission01.json",
+                  lambda spec: spec["grading"]["python"].update(output="Hi!", checks=[["prints", "^hi$"]]))
+        assert specs.reload()
+        assert not specs.reload()
+        assert specs.current.version == before.version + 1
+        assert before.python["mission01"].output == "Hello, World!"
+        # Verdicts from the old specs are not reused
+        assert not sandbox.simulate('print("Hello, World!")', "mission01").success
+        assert sandbox.simulate('print("hi")', "mission01").output == "Hi!"
+        
+        (lessons / "tier3_threat_hunter" / "mission11.json").write_text(json.dumps({
+            "id": "mission11", "tier": 3, "tier_name": "Threat Hunter", "title": "Extra", "description": "d",
+            "story": "s", "coding_concept": "c", "security_concept": "s", "language": "lucene",
+            "grading": {"search": {"target": "user:john", "success_feedback": "Found {count}!"}},
+        }), encoding="utf-8")
+        assert specs.reload()
+        assert game.get_progress().total_missions == 11
+        simulator = LuceneSearchSimulator(specs=specs)
+        assert simulator.search("user:john", mission_id="mission11").feedback == "Found 6!"
+    
+    def test_broken_spec_keeps_catalog(self, lessons):
+        """A spec that doesn't load is reported once and the old catalog stays."""
+        specs = MissionSpecs(lessons)
+        before = specs.current
+        path = lessons / "tier2_analyst" / "mission04.json"
+        self.edit(path, lambda spec: spec["grading"]["python"].update(checks=[["runs_code"]]))
+        assert not specs.reload()
+        assert specs.current is before
+        assert "mission04.json" in specs.last_error
+        
+        path.write_text("{not json", encoding="utf-8")
+        assert not specs.reload()
+        assert "mission04.json" in specs.last_error
+        with pytest.raises(MissionSpecError):
+            MissionSpecs(lessons)
+    
+    def test_watcher_reloads(self, lessons):
+        """The watcher thread picks up edits without being asked."""
+        specs = MissionSpecs(lessons)
+        specs.watch(interval=0.01)
+        try:
+            self.edit(lessons / "tier1_new_trainee" / "mission02.json", lambda spec: spec.update(title="Renamed"))
+            deadline = time.monotonic() + 5
+            while specs.reloads == 0 and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            specs.stop()
+        assert specs.current.missions["mission02"].title == "Renamed"
+
+
+class TestBatchGrading:
+    """Tests for grading many submissions across worker processes."""
+    
+    def test_pool_matches_in_process(self):
+        """Worker processes grade exactly like the server process, whatever the order."""
+        codes = [
+            ('print("Hello, World!")', "mission01"),
+            ("print(x)", "mission01"),
+            ("for e in logs:\n    if e['status'] == 'failed':\n        print('ALERT')", "mission04"),
+            ("cd /var/log", "mission02"),
+            ("pwd", "mission02"),
+            ("status:failed", "mission03"),
+        ]
+        submissions = [CodeSubmission(code=code, mission_id=mission_id) for code, mission_id in codes * 5]
+        with BatchGrader(workers=0) as local:
+            expected = list(local.grade(submissions))
+        with BatchGrader(workers=2, chunk_size=4) as pool:
+            graded = sorted(pool.grade(submissions), key=lambda result: result.index)
+        assert [result.index for result in expected] == list(range(len(submissions)))
+        assert graded == expected
+        # Each bash submission starts in the home directory
+        assert expected[4].result.output == expected[10].result.output == "/home/trainee"
+
+
+class TestPercolator:
+    """Tests for standing detection rules over appended events."""
+    
+    def test_appended_events_raise_alerts(self):
+        """New events are searchable live and matched against saved rules."""
+        simulator = LuceneSearchSimulator()
+        simulator.add_rule("night-admin", "path:*admin* AND hour:[23 TO 5]")
+        simulator.add_rule("eve", "user:eve")
+        alerts = simulator.append_events([
+            {"timestamp": "2024-01-17 02:00:00", "user": "eve", "path": "/admin/users", "status": "success"},
+            {"timestamp": "2024-01-17 12:00:00", "user": "bob", "path": "/admin/users", "status": "success"},
+        ])
+        assert [(a.rule_id, a.event_id) for a in alerts] == [("eve", 0), ("night-admin", 0)]
+        assert simulator.search_live("user:eve").total_matches == 1
+        assert simulator.remove_rule("eve")
+        assert simulator.append_events([{"user": "eve"}]) == []
+    
+    def test_live_events_are_kept_apart(self, monkeypatch):
+        """Live events never reach the graded corpus, and only the newest are kept."""
+        monkeypatch.setattr(lucene_search_sim, "MAX_LIVE_EVENTS", 4)
+        simulator = LuceneSearchSimulator()
+        simulator.append_events([{"user": "john", "status": "failed"}])
+        assert simulator.search("user:john AND status:failed", mission_id="mission03").is_correct
+        assert simulator.search_live("status:failed").total_matches == 1
+        simulator.append_events([{"user": f"u{i}"} for i in range(3)])
+        simulator.add_rule("all", "user:*")
+        alerts = simulator.append_events([{"user": "u3"}])
+        assert [alert.event_id for alert in alerts] == [4]
+        assert len(simulator.live) == 3
+        assert simulator.search_live("status:failed OR user:u0").total_matches == 0
+    
+    def test_non_string_values_in_alerts(self):
+        """Alerts render numbers, booleans and nulls as LogEntry text."""
+        simulator = LuceneSearchSimulator()
+        simulator.add_rule("svc", "user:svc")
+        alerts = simulator.append_events([
+            {"user": "svc", "level": 5, "timestamp": 1705400000, "ip": None, "action": True}
+        ])
+        entry = alerts[0].entry
+        assert (entry.level, entry.timestamp, entry.ip, entry.action) == ("5", "1705400000", None, "True")
+    
+    def test_rule_budget(self):
+        """Rules priced over the search budget are refused, since they run on every append."""
+        simulator = LuceneSearchSimulator(max_query_cost=60)
+        with pytest.raises(QueryBudgetError):
+            simulator.add_rule("wide", " OR ".join(f"*{c}*" for c in "aeiou"))
+        simulator.add_rule("narrow", "user:eve")
+        assert len(simulator.percolator) == 1
+    
+    def test_rule_limit(self):
+        """Past max_rules, new rules are refused but existing ones can be replaced."""
+        percolator = Percolator(max_rules=2)
+        percolator.add_rule("a", "user:a")
+        percolator.add_rule("b", "user:b")
+        with pytest.raises(RuleLimitError):
+            percolator.add_rule("c", "user:c")
+        percolator.add_rule("a", "user:z")
+        assert len(percolator) == 2
+    
+    def test_nested_event_fields(self):
+        """Rules on dotted fields match nested events like search does."""
+        simulator = LuceneSearchSimulator()
+        simulator.add_rule("get", "http.method:GET")
+        simulator.add_rule("eve", "user:eve")
+        alerts = simulator.append_events([{"user": "eve", "http": {"method": "GET"}}])
+        assert sorted(alert.rule_id for alert in alerts) == ["eve", "get"]
+        assert simulator.search_live("http.method:GET").total_matches == 1
+    
+    def test_only_candidate_rules_are_checked(self):
+        """Rules whose terms an event lacks are never evaluated against it."""
+        percolator = Percolator()
+        for i in range(500):
+            percolator.add_rule(f"user-{i}", f"user:user{i} AND status:failed")
+        percolator.add_rule("any-failure", "status:failed OR level:ERROR")
+        matches = percolator.percolate([{"user": "user7", "status": "failed"}])
+        assert matches == [(0, "any-failure"), (0, "user-7")]
+        assert percolator.checks == 2
+    
+    def test_rule_keys(self):
+        """Rules are keyed by required terms, or unkeyed when they can't be."""
+        analyzer = Analyzer()
+        assert rule_keys(parse_query("user:John AND path:*x*"), analyzer) == {("term", "user", "john")}
+        assert rule_keys(parse_query("user:a OR status:failed"), analyzer) == \
+            {("term", "user", "a"), ("term", "status", "failed")}
+        assert ("field", "timestamp") in rule_keys(parse_query("hour:[23 TO 5]"), analyzer)
+        assert rule_keys(parse_query('"failed login"'), analyzer) == {("text", "failed")}
+        assert rule_keys(parse_query("NOT user:a"), analyzer) is None
+        assert rule_keys(parse_query("adm*"), analyzer) is None
+
+
+class TestLuceneQueryParser:
+    """Tests for the Lucene query parser and plan cache."""
+    
+    def test_and_binds_tighter_than_or(self):
+        """a AND b OR c parses as (a AND b) OR c."""
+        assert str(parse_query("user:john AND status:success OR user:mike")) == \
+            "((user:john AND status:success) OR user:mike)"
+    
+    def test_grouping_and_negation(self):
+        """Parentheses, NOT and -clause are supported."""
+        simulator = LuceneSearchSimulator()
+        grouped = simulator.search("user:john AND (status:success OR user:mike)")
+        assert grouped.total_matches == 1
+        excluded = simulator.search("user:john -status:failed")
+        assert excluded.total_matches == 1
+        assert excluded.results[0].status == "success"
+    
+    def test_quoted_phrase_keeps_operators(self):
+        """Operators inside quotes are part of the value."""
+        assert str(parse_query('details:"a AND b"')) == 'details:"a AND b"'
+    
+    def test_unbalanced_parentheses_rejected(self):
+        """Syntax errors raise QuerySyntaxError."""
+        with pytest.raises(QuerySyntaxError):
+            parse_query("(status:failed")
+    
+    def test_plan_cached_per_normalized_query(self):
+        """Equivalent spellings reuse one compiled plan."""
+        assert compile_query("status:failed  AND user:john") is compile_query(" status:failed AND user:john ")
+    
+    def test_fuzzy_syntax(self):
+        """term~N is fuzzy (default 2 edits); quoted values stay literal."""
+        assert parse_query("user:jhon~1") == FuzzyQuery("user", "jhon", 1)
+        assert parse_query("user:jhon~") == FuzzyQuery("user", "jhon", 2)
+        assert isinstance(parse_query('user:"jhon~1"'), TermQuery)
+        assert str(parse_query('user:"a~1" OR user:"a*"')) == '(user:"a~1" OR user:"a*")'
+        with pytest.raises(QuerySyntaxError):
+            parse_query("user:jhon~3")
+    
+    def test_field_applies_to_group(self):
+        """field:( ... ) puts the field on every clause inside that has none."""
+        assert str(parse_query("user:(john OR mike)")) == "(user:john OR user:mike)"
+        assert str(parse_query("status:failed AND user:(john)")) == "(status:failed AND user:john)"
+        assert str(parse_query("user:(john OR status:failed)")) == "(user:john OR status:failed)"
+        assert str(parse_query("hour:[1 to 5]")) == "hour:[1 TO 5]"
+        simulator = LuceneSearchSimulator()
+        assert simulator.search("user:(john OR mike)").total_matches == \
+            simulator.search("user:john OR user:mike").total_matches
+    
+    def test_ambiguous_syntax_rejected(self):
+        """Queries that would otherwise be silently misread are syntax errors."""
+        for query in ['user:"john"~1', "user:", "user: john", "hour:[1 TO", "[1 TO 5]", "hour:[1 TO 5]x", 'a"b"']:
+            with pytest.raises(QuerySyntaxError):
+                parse_query(query)
+
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])